@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import sys
@@ -19,6 +20,7 @@ from starlette.responses import Response
 import contextvars
 from src.tools.tool import get_mpesa_tools
 from src.handlers.stk_push import stk_push_handler
+from src.utils.logging_config import LOG_FORMAT, configure_logging, get_logging_pipeline
 from paylink_tracer import paylink_tracer
 
 load_dotenv()
@@ -44,11 +46,19 @@ request_context = contextvars.ContextVar("request_context")
     default=False,
     help="Enable JSON responses for StreamableHTTP",
 )
-def main(port: int, log_level: str, json_response: bool) -> int:
-    logging.basicConfig(
-        level=getattr(logging, log_level.upper()),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+@click.option(
+    "--log-format",
+    type=click.Choice(["text", "json"]),
+    default=LOG_FORMAT,
+    help="Log output format. Defaults to LOG_FORMAT.",
+)
+@click.option(
+    "--log-queue/--no-log-queue",
+    default=True,
+    help="Write logs from a background thread so the event loop never blocks on log I/O",
+)
+def main(port: int, log_level: str, json_response: bool, log_format: str, log_queue: bool) -> int:
+    configure_logging(log_level, log_format=log_format, use_queue=log_queue)
 
     app = Server("mpesa_mcp_server")
 
@@ -140,6 +150,10 @@ def main(port: int, log_level: str, json_response: bool) -> int:
                 yield
             finally:
                 logger.info("Application shutting down...")
+                # Write out queued log records before the process exits
+                pipeline = get_logging_pipeline()
+                if pipeline is not None:
+                    await asyncio.to_thread(pipeline.flush)
 
     routes = [
         Route("/sse", endpoint=handle_sse, methods=["GET"]),
@@ -149,7 +163,8 @@ def main(port: int, log_level: str, json_response: bool) -> int:
 
     starlette_app = Starlette(debug=True, lifespan=lifespan, routes=routes)
 
-    uvicorn.run(starlette_app, host="0.0.0.0", port=port)
+    # log_config=None: uvicorn's loggers propagate to the root pipeline configured above
+    uvicorn.run(starlette_app, host="0.0.0.0", port=port, log_level=log_level.lower(), log_config=None)
 
     return 0
 
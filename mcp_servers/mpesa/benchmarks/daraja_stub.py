@@ -0,0 +1,88 @@
+"""Local stand-in for the Daraja endpoints the M-Pesa server calls.
+
+Serves OAuth, STK push and STK query with configurable latency so benchmarks
+measure the MCP server rather than Safaricom's sandbox.
+
+    python benchmarks/daraja_stub.py --port 5099 --latency-ms 80 --jitter-ms 20
+"""
+
+import asyncio
+import itertools
+import json
+import random
+
+import click
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_stub_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, token_ttl: int = 3599) -> Starlette:
+    counter = itertools.count(1)
+    stats = {"oauth": 0, "stkpush": 0, "stkquery": 0}
+
+    async def delay() -> None:
+        seconds = (latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    async def oauth(request: Request) -> JSONResponse:
+        stats["oauth"] += 1
+        await delay()
+        return JSONResponse({"access_token": f"stub-token-{stats['oauth']}", "expires_in": str(token_ttl)})
+
+    async def stk_push(request: Request) -> JSONResponse:
+        stats["stkpush"] += 1
+        body = json.loads(await request.body())
+        await delay()
+        n = next(counter)
+        return JSONResponse(
+            {
+                "MerchantRequestID": f"stub-{n}",
+                "CheckoutRequestID": f"ws_CO_stub_{n}",
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": f"Success. Request accepted for processing ({body.get('AccountReference')})",
+            }
+        )
+
+    async def stk_query(request: Request) -> JSONResponse:
+        stats["stkquery"] += 1
+        body = json.loads(await request.body())
+        await delay()
+        return JSONResponse(
+            {
+                "ResponseCode": "0",
+                "ResponseDescription": "The service request has been accepted successsfully",
+                "MerchantRequestID": "stub",
+                "CheckoutRequestID": body.get("CheckoutRequestID"),
+                "ResultCode": "0",
+                "ResultDesc": "The service request is processed successfully.",
+            }
+        )
+
+    async def get_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+
+    return Starlette(
+        routes=[
+            Route("/oauth/v1/generate", endpoint=oauth, methods=["GET"]),
+            Route("/mpesa/stkpush/v1/processrequest", endpoint=stk_push, methods=["POST"]),
+            Route("/mpesa/stkpushquery/v1/query", endpoint=stk_query, methods=["POST"]),
+            Route("/stats", endpoint=get_stats, methods=["GET"]),
+        ]
+    )
+
+
+@click.command()
+@click.option("--port", default=5099, help="Port to listen on")
+@click.option("--latency-ms", default=0.0, help="Added latency per Daraja call")
+@click.option("--jitter-ms", default=0.0, help="Uniform +/- jitter applied to the latency")
+def main(port: int, latency_ms: float, jitter_ms: float) -> None:
+    uvicorn.run(create_stub_app(latency_ms, jitter_ms), host="127.0.0.1", port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Closed-loop load generator for the M-Pesa MCP server.
+
+Each virtual user performs a real MCP ``initialize`` handshake and then calls
+``tools/call stk_push`` back to back until the run ends. Credentials point the
+server at the Daraja stub (see ``daraja_stub.py``).
+
+    python benchmarks/loadgen.py --url http://127.0.0.1:5002/mcp/ \\
+        --daraja-url http://127.0.0.1:5099 --concurrency 50 --duration 20
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import click
+import httpx
+
+PROTOCOL_VERSION = "2025-06-18"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    values = sorted(latencies)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50) * 1000, 3),
+        "p95": round(percentile(values, 95) * 1000, 3),
+        "p99": round(percentile(values, 99) * 1000, 3),
+        "mean": round(sum(values) / len(values) * 1000, 3),
+        "max": round(values[-1] * 1000, 3),
+    }
+
+
+def tenant_headers(daraja_url: str, shortcode: str = "174379") -> Dict[str, str]:
+    return {
+        "accept": "application/json, text/event-stream",
+        "content-type": "application/json",
+        "mpesa-base-url": daraja_url,
+        "mpesa-business-shortcode": shortcode,
+        "mpesa-passkey": "bench-passkey",
+        "mpesa-callback-url": "https://example.com/mpesa/callback",
+        "mpesa-consumer-key": "bench-key",
+        "mpesa-consumer-secret": "bench-secret",
+    }
+
+
+def parse_rpc_response(response: httpx.Response) -> Optional[Dict[str, Any]]:
+    """Extract the JSON-RPC message from a JSON or SSE response body."""
+    body = response.text
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        data = [line[5:].strip() for line in body.splitlines() if line.startswith("data:")]
+        body = data[-1] if data else ""
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _tool_succeeded(message: Optional[Dict[str, Any]]) -> bool:
+    try:
+        result = message["result"]
+        if result.get("isError"):
+            return False
+        structured = result.get("structuredContent")
+        if structured is not None:
+            return structured.get("status") == "success"
+        return json.loads(result["content"][0]["text"]).get("status") == "success"
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+
+
+class LoadResult:
+    def __init__(self) -> None:
+        self.call_latencies: List[float] = []
+        self.init_latencies: List[float] = []
+        self.errors = 0
+        self.error_samples: List[str] = []
+
+    def error(self, detail: str) -> None:
+        self.errors += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(detail[:300])
+
+
+async def _initialize(client: httpx.AsyncClient, url: str, headers: Dict[str, str], result: LoadResult) -> Dict[str, str]:
+    start = time.perf_counter()
+    response = await client.post(
+        url,
+        headers=headers,
+        json={
+            "jsonrpc": "2.0",
+            "id": 0,
+            "method": "initialize",
+            "params": {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "paylink-loadgen", "version": "1.0"},
+            },
+        },
+    )
+    response.raise_for_status()
+    result.init_latencies.append(time.perf_counter() - start)
+
+    session_headers = dict(headers)
+    session_id = response.headers.get("mcp-session-id")
+    if session_id:
+        session_headers["mcp-session-id"] = session_id
+    session_headers["mcp-protocol-version"] = PROTOCOL_VERSION
+    await client.post(url, headers=session_headers, json={"jsonrpc": "2.0", "method": "notifications/initialized"})
+    return session_headers
+
+
+async def _virtual_user(
+    user: int,
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Dict[str, str],
+    deadline: float,
+    record_after: float,
+    sequence: "itertools.count[int]",
+    result: LoadResult,
+) -> None:
+    try:
+        session_headers = await _initialize(client, url, headers, result)
+    except httpx.HTTPError as e:
+        result.error(f"initialize: {e!r}")
+        return
+
+    while time.perf_counter() < deadline:
+        n = next(sequence)
+        payload = {
+            "jsonrpc": "2.0",
+            "id": n,
+            "method": "tools/call",
+            "params": {
+                "name": "stk_push",
+                "arguments": {
+                    "amount": "1",
+                    "phone_number": f"2547{user % 100_000_000:08d}",
+                    # Unique per call so idempotency never replays a cached push
+                    "account_reference": f"BENCH{n}",
+                    "transaction_desc": "benchmark",
+                },
+            },
+        }
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, headers=session_headers, json=payload)
+            elapsed = time.perf_counter() - start
+            message = parse_rpc_response(response)
+        except httpx.HTTPError as e:
+            result.error(f"tools/call: {e!r}")
+            continue
+
+        if start < record_after:
+            continue
+        if response.status_code == 200 and _tool_succeeded(message):
+            result.call_latencies.append(elapsed)
+        else:
+            result.error(f"tools/call: HTTP {response.status_code} {response.text}")
+
+
+async def run_load(
+    url: str,
+    daraja_url: str,
+    concurrency: int = 20,
+    duration: float = 10.0,
+    warmup: float = 2.0,
+    shortcodes: int = 1,
+) -> Dict[str, Any]:
+    """Run a closed-loop load test and return a machine-readable summary."""
+    result = LoadResult()
+    sequence = itertools.count(1)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(60.0)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        record_after = started + warmup
+        deadline = record_after + duration
+        await asyncio.gather(
+            *(
+                _virtual_user(
+                    i,
+                    client,
+                    url,
+                    tenant_headers(daraja_url, str(174379 + i % max(1, shortcodes))),
+                    deadline,
+                    record_after,
+                    sequence,
+                    result,
+                )
+                for i in range(concurrency)
+            )
+        )
+        measured = max(1e-9, time.perf_counter() - record_after)
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(measured, 3),
+        "requests": len(result.call_latencies),
+        "errors": result.errors,
+        "throughput_rps": round(len(result.call_latencies) / measured, 2),
+        "latency_ms": summarize(result.call_latencies),
+        "initialize_ms": summarize(result.init_latencies),
+        "error_samples": result.error_samples,
+    }
+
+
+@click.command()
+@click.option("--url", default="http://127.0.0.1:5002/mcp/", help="StreamableHTTP endpoint of the server under test")
+@click.option("--daraja-url", default="http://127.0.0.1:5099", help="Base URL of the Daraja stub")
+@click.option("--concurrency", default=20, help="Virtual users (concurrent in-flight calls)")
+@click.option("--duration", default=10.0, help="Measured seconds, after warmup")
+@click.option("--warmup", default=2.0, help="Seconds of load before recording starts")
+@click.option("--shortcodes", default=1, help="Spread users over this many tenant shortcodes")
+def main(url: str, daraja_url: str, concurrency: int, duration: float, warmup: float, shortcodes: int) -> None:
+    summary = asyncio.run(run_load(url, daraja_url, concurrency, duration, warmup, shortcodes))
+    click.echo(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Run the M-Pesa server benchmark across configurations.
+
+Starts the Daraja stub, then for each configuration starts ``server.py`` with
+that configuration's flags, drives it with the load generator and writes all
+results to one JSON file so runs can be compared across releases.
+
+    cd mcp_servers/mpesa
+    python benchmarks/run.py --duration 15 --concurrency 50 --output bench.json
+    python benchmarks/run.py --config stateless-json --baseline previous.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+import httpx
+
+from loadgen import run_load
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+# Name -> extra server.py arguments
+CONFIGS: Dict[str, List[str]] = {
+    "stateless-json": ["--json-response"],
+    "stateless-sse": [],
+    "stateless-json-2-workers": ["--json-response", "--workers", "2"],
+    "stateless-json-4-workers": ["--json-response", "--workers", "4"],
+    "stateful-json": ["--json-response", "--stateful"],
+    "stateful-sse": ["--stateful"],
+}
+
+# Per-shortcode throttling would cap throughput at the configured Daraja quota
+SERVER_ENV = {"MPESA_RATE_LIMIT_RPS": "0"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> float:
+    """Block until something accepts connections on ``port``; return seconds waited."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"nothing listening on port {port} after {timeout}s")
+
+
+def wait_for_ready(port: int, timeout: float = 30.0) -> float:
+    """Block until the server's ``/readyz`` answers 200; return seconds waited."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/readyz", timeout=0.5).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"server on port {port} not ready after {timeout}s")
+
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=SERVER_DIR,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_process(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_config(name: str, server_args: List[str], daraja_url: str, load: Dict[str, Any]) -> Dict[str, Any]:
+    port = free_port()
+    env = {**SERVER_ENV, "MPESA_WARMUP_BASE_URLS": daraja_url}
+    proc = start_process(["server.py", "--port", str(port), "--log-level", "WARNING", *server_args], env)
+    try:
+        startup = wait_for_ready(port)
+        summary = asyncio.run(run_load(f"http://127.0.0.1:{port}/mcp/", daraja_url, **load))
+    finally:
+        stop_process(proc)
+    return {"config": name, "server_args": server_args, "startup_s": round(startup, 3), **summary}
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> None:
+    """Attach relative change versus a previous run's results for the same configs."""
+    previous = {r["config"]: r for r in baseline.get("results", [])}
+    for result in results:
+        old = previous.get(result["config"])
+        if not old:
+            continue
+
+        def change(new: float, was: float) -> Optional[float]:
+            return round((new - was) / was * 100, 1) if was else None
+
+        result["vs_baseline_pct"] = {
+            "throughput_rps": change(result["throughput_rps"], old["throughput_rps"]),
+            "p50": change(result["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+            "p99": change(result["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+        }
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'config':<24}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    click.echo(header, err=True)
+    click.echo("-" * len(header), err=True)
+    for r in results:
+        lat = r["latency_ms"]
+        click.echo(
+            f"{r['config']:<24}{r['throughput_rps']:>10.1f}{lat['p50']:>10.2f}{lat['p95']:>10.2f}"
+            f"{lat['p99']:>10.2f}{r['errors']:>8}",
+            err=True,
+        )
+
+
+@click.command()
+@click.option(
+    "--config",
+    "config_names",
+    multiple=True,
+    type=click.Choice(sorted(CONFIGS)),
+    help="Configurations to run (repeatable). Defaults to all.",
+)
+@click.option("--concurrency", default=20, help="Virtual users per run")
+@click.option("--duration", default=10.0, help="Measured seconds per configuration")
+@click.option("--warmup", default=2.0, help="Unrecorded seconds before each measurement")
+@click.option("--shortcodes", default=1, help="Spread load over this many tenant shortcodes")
+@click.option("--daraja-latency-ms", default=50.0, help="Latency the Daraja stub adds per call")
+@click.option("--daraja-jitter-ms", default=10.0, help="Jitter around the stub latency")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write JSON results here (default: stdout)")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Previous results file to compare against")
+def main(
+    config_names: tuple[str, ...],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    shortcodes: int,
+    daraja_latency_ms: float,
+    daraja_jitter_ms: float,
+    output: Optional[str],
+    baseline: Optional[str],
+) -> None:
+    names = list(config_names) or list(CONFIGS)
+    load = {"concurrency": concurrency, "duration": duration, "warmup": warmup, "shortcodes": shortcodes}
+
+    stub_port = free_port()
+    stub = start_process(
+        [
+            "benchmarks/daraja_stub.py",
+            "--port",
+            str(stub_port),
+            "--latency-ms",
+            str(daraja_latency_ms),
+            "--jitter-ms",
+            str(daraja_jitter_ms),
+        ]
+    )
+    try:
+        wait_for_port(stub_port)
+        daraja_url = f"http://127.0.0.1:{stub_port}"
+        results = []
+        for name in names:
+            click.echo(f"running {name} ...", err=True)
+            results.append(run_config(name, CONFIGS[name], daraja_url, load))
+    finally:
+        stop_process(stub)
+
+    if baseline:
+        compare(results, json.loads(Path(baseline).read_text()))
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "load": {**load, "daraja_latency_ms": daraja_latency_ms, "daraja_jitter_ms": daraja_jitter_ms},
+        "results": results,
+    }
+
+    print_table(results)
+    text = json.dumps(report, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+    else:
+        click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure how quickly the M-Pesa server can take traffic after it is started.
+
+For each transport selection, starts ``server.py`` several times and records
+the seconds until its port accepts connections and until ``/readyz`` first
+answers 200 (session manager running, HTTP pool warm). Medians are written as
+JSON so cold-start regressions show up next to the throughput results.
+
+    cd mcp_servers/mpesa
+    python benchmarks/startup.py --runs 5 --output startup.json
+"""
+
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+
+from run import SERVER_ENV, free_port, start_process, stop_process, wait_for_port, wait_for_ready
+
+# Name -> extra server.py arguments
+CONFIGS: Dict[str, List[str]] = {
+    "streamable-http": ["--transport", "streamable-http"],
+    "sse": ["--transport", "sse"],
+    "all-transports": ["--transport", "streamable-http", "--transport", "sse"],
+    "stateful": ["--transport", "streamable-http", "--stateful"],
+}
+
+
+def measure(server_args: List[str]) -> Dict[str, float]:
+    port = free_port()
+    start = time.perf_counter()
+    proc = start_process(["server.py", "--port", str(port), "--log-level", "WARNING", *server_args], SERVER_ENV)
+    try:
+        wait_for_port(port)
+        listening = time.perf_counter() - start
+        wait_for_ready(port)
+        ready = time.perf_counter() - start
+    finally:
+        stop_process(proc)
+    return {"listening_s": listening, "ready_s": ready}
+
+
+@click.command()
+@click.option(
+    "--config",
+    "config_names",
+    multiple=True,
+    type=click.Choice(list(CONFIGS)),
+    help="Configurations to measure (default: all)",
+)
+@click.option("--runs", default=5, help="Server starts per configuration")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write JSON results here (default: stdout)")
+def main(config_names: tuple[str, ...], runs: int, output: Optional[str]) -> None:
+    results: List[Dict[str, Any]] = []
+    for name in config_names or CONFIGS:
+        click.echo(f"measuring {name} ...", err=True)
+        samples = [measure(CONFIGS[name]) for _ in range(runs)]
+        results.append(
+            {
+                "config": name,
+                "server_args": CONFIGS[name],
+                "runs": runs,
+                "listening_s": round(statistics.median(s["listening_s"] for s in samples), 3),
+                "ready_s": round(statistics.median(s["ready_s"] for s in samples), 3),
+                "ready_max_s": round(max(s["ready_s"] for s in samples), 3),
+            }
+        )
+
+    click.echo(f"{'config':<20}{'listening s':>14}{'ready s':>10}", err=True)
+    for r in results:
+        click.echo(f"{r['config']:<20}{r['listening_s']:>14.3f}{r['ready_s']:>10.3f}", err=True)
+
+    text = json.dumps({"results": results}, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+    else:
+        click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,91 @@
 import logging
 import os
+import json
+import time
 import click
+import tempfile
+import asyncio
+import functools
 import contextlib
+import dataclasses
 import contextvars
-import uvicorn
 from typing import Any
 from collections.abc import AsyncIterator
 
 from dotenv import load_dotenv
+
+# Before any src import: modules read their settings from the environment at import time
+load_dotenv()
+
 from starlette.types import Receive, Scope, Send
 from starlette.applications import Starlette
 from starlette.routing import Route, Mount
 
 from mcp.server.lowlevel import Server
-from mcp.types import TextContent, Tool
-from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
-from mcp.server.sse import SseServerTransport
-
-from src.tools.tool import get_mpesa_tools
-from src.handlers.stk_push import stk_push_handler
+from mcp.server.lowlevel.helper_types import ReadResourceContents
+from mcp.types import LoggingLevel, Resource, ResourceTemplate, TextContent, Tool
+
+from src.tools.registry import ToolInputError
+from src.providers.registry import ProviderRouter, load_provider
+from src.handlers.metrics import metrics_endpoint
+from src.handlers.payment_resource import (
+    PAYMENT_RESOURCE_TEMPLATE,
+    read_payment_resource,
+    subscribe_payment_resource,
+    unsubscribe_payment_resource,
+)
+from src.handlers.health import ReadinessChecks, healthz_endpoint, readyz_endpoint
+from src.utils.http_client import MPESA_WARMUP_BASE_URLS, HttpPoolConfig, http_pool
+from src.utils.credentials import EMPTY_REQUEST_HEADERS, RequestHeaders, parse_request_headers
+from src.utils.trace import LazyTraceContext, TraceContextProvider
+from src.utils.trace_export import trace_exporter
+from src.utils import json_codec
+from src.utils.logging_config import LOG_FORMAT, configure_logging, get_logging_pipeline
+from src.utils.admission import Overloaded, admission, overloaded_result, tenant_for
+from src.utils.lifecycle import MPESA_DRAIN_GRACE_SECONDS, MPESA_SHUTDOWN_CONNECTION_TIMEOUT, drain, draining_result
+from src.utils.metrics import HTTP_REQUESTS_IN_FLIGHT, TOOL_CALL_SECONDS, TOOL_CALLS_IN_FLIGHT, tool_outcome
+from src.utils.token_store import MPESA_TOKEN_STORE_PATH
+from src.utils.job_queue import MPESA_JOB_JOURNAL_PATH
+from src.utils.auth import token_refresher
+from src.utils.event_store import evict_idle_sessions, session_events
+from src.utils.rate_limit import rate_limiter
+from src.utils.payment_events import checkout_request_ids, payment_notifier
 
 from paylink_tracer import paylink_tracer,set_trace_context_provider
 
-
-load_dotenv()
-
 # ------------------------------------------------------------------------------
 # Config & globals
 # ------------------------------------------------------------------------------
 logger = logging.getLogger(__name__)
 MPESA_MCP_SERVER_PORT = int(os.getenv("MPESA_MCP_SERVER_PORT", "5002"))
+MPESA_WORKERS = int(os.getenv("MPESA_WORKERS", "1"))
+
+TRANSPORT_STREAMABLE_HTTP = "streamable-http"
+TRANSPORT_SSE = "sse"
+# Transports mounted when --transport is not given (comma-separated)
+MPESA_TRANSPORTS = tuple(
+    t.strip() for t in os.getenv("MPESA_TRANSPORTS", f"{TRANSPORT_STREAMABLE_HTTP},{TRANSPORT_SSE}").split(",") if t.strip()
+)
+
+# Settings handed from main() to worker processes, which build the app via app_factory()
+SERVER_SETTINGS_ENV = "MPESA_SERVER_SETTINGS"
+
+# Provider plugins loaded next to the built-in M-Pesa provider ("module" or "module:attribute", comma-separated)
+BUILTIN_PROVIDER = "src.providers.mpesa"
+MPESA_GATEWAY_PROVIDERS = tuple(p.strip() for p in os.getenv("MPESA_GATEWAY_PROVIDERS", "").split(",") if p.strip())
+# Provider for bare tool names when the request has no payment-provider header
+MPESA_DEFAULT_PROVIDER = os.getenv("MPESA_DEFAULT_PROVIDER", "mpesa")
 
 # Per-request context (populated by ASGI handler)
-request_context: contextvars.ContextVar[dict] = contextvars.ContextVar("request_context")
-trace_context: contextvars.ContextVar[dict] = contextvars.ContextVar("trace_context")
+request_context: contextvars.ContextVar[RequestHeaders] = contextvars.ContextVar("request_context")
+trace_context: contextvars.ContextVar[LazyTraceContext] = contextvars.ContextVar("trace_context")
 
-set_trace_context_provider(trace_context)  
+# The same values, kept on the ASGI scope for tool calls that run in a session task
+REQUEST_HEADERS_SCOPE_KEY = "mpesa.request_headers"
+TRACE_CONTEXT_SCOPE_KEY = "mpesa.trace_context"
 
-# ------------------------------------------------------------------------------
-# Header / trace helpers
-# ------------------------------------------------------------------------------
-def _extract_headers(scope: Scope) -> dict[str, str]:
-    """Normalize incoming ASGI headers: lowercase keys, '_' -> '-'."""
-    raw = scope.get("headers", []) or []
-    out: dict[str, str] = {}
-    for k, v in raw:
-        kk = k.decode().strip().lower().replace("_", "-")
-        out[kk] = v.decode()
-    return out
-
-
-def extract_trace_context(scope: dict, headers: dict) -> dict:
-    """Build trace context including the FULL normalized headers for multi-tenant tracing."""
-    client = scope.get("client") or ["", ""]
-    server = scope.get("server") or ["", ""]
-    query_string = scope.get("query_string", b"")
-    if isinstance(query_string, bytes):
-        query_string = query_string.decode()
-
-    return {
-        "request": {
-            "method": scope.get("method"),
-            "path": scope.get("path"),
-            "query_string": query_string,
-            "client": {"ip": client[0], "port": client[1] if len(client) > 1 else None},
-            "server": {"host": server[0], "port": server[1] if len(server) > 1 else None},
-            # ✅ keep ALL normalized headers (includes paylink-api-key / authorization)
-            "headers": headers,
-        },
-        "environment": {
-            "mcp_protocol_version": headers.get("mcp-protocol-version"),
-            "payment_provider": headers.get("payment-provider"),
-        },
-    }
+# The tracer materializes (redacted) trace context only when it reads it
+set_trace_context_provider(TraceContextProvider(trace_context))
 
 # ------------------------------------------------------------------------------
 # CLI
@@ -90,109 +103,492 @@ def extract_trace_context(scope: dict, headers: dict) -> dict:
     default=False,
     help="Enable JSON responses for StreamableHTTP",
 )
-def main(port: int, log_level: str, json_response: bool) -> int:
-    logging.basicConfig(
-        level=getattr(logging, log_level.upper()),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+@click.option(
+    "--http2/--no-http2",
+    default=None,
+    help="Use HTTP/2 for Daraja calls (requires the 'h2' package). Defaults to MPESA_HTTP2.",
+)
+@click.option(
+    "--log-format",
+    type=click.Choice(["text", "json"]),
+    default=LOG_FORMAT,
+    help="Log output format. Defaults to LOG_FORMAT.",
+)
+@click.option(
+    "--log-queue/--no-log-queue",
+    default=True,
+    help="Write logs from a background thread so the event loop never blocks on log I/O",
+)
+@click.option(
+    "--workers",
+    default=MPESA_WORKERS,
+    type=click.IntRange(min=1),
+    help="Worker processes. With more than one, access tokens are shared through --token-store; "
+    "/metrics, admission control, idempotency, payment status and stk_query caches stay per worker.",
+)
+@click.option(
+    "--loop",
+    type=click.Choice(["auto", "asyncio", "uvloop"]),
+    default="auto",
+    help="Event loop; 'auto' uses uvloop when installed (pip install '.[perf]')",
+)
+@click.option(
+    "--http",
+    "http_impl",
+    type=click.Choice(["auto", "h11", "httptools"]),
+    default="auto",
+    help="HTTP parser; 'auto' uses httptools when installed",
+)
+@click.option(
+    "--token-store",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite file for sharing access tokens across processes. Defaults to "
+    "MPESA_TOKEN_STORE_PATH, or a temp file when --workers > 1.",
+)
+@click.option(
+    "--job-journal",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite journal enabling stk_push submit_async; queued payments survive restarts. "
+    "Defaults to MPESA_JOB_JOURNAL_PATH (unset disables async submission).",
+)
+@click.option(
+    "--transport",
+    "transports",
+    multiple=True,
+    type=click.Choice([TRANSPORT_STREAMABLE_HTTP, TRANSPORT_SSE]),
+    default=MPESA_TRANSPORTS,
+    help="Transport to serve; repeat for several. Only these are imported and mounted. Defaults to MPESA_TRANSPORTS.",
+)
+@click.option(
+    "--provider",
+    "providers",
+    multiple=True,
+    default=MPESA_GATEWAY_PROVIDERS,
+    help="Extra payment provider plugin to load ('module' or 'module:attribute'); repeat for several. "
+    "Defaults to MPESA_GATEWAY_PROVIDERS.",
+)
+@click.option(
+    "--default-provider",
+    default=MPESA_DEFAULT_PROVIDER,
+    help="Provider for tool calls without a payment-provider header or provider prefix",
+)
+@click.option(
+    "--stateful",
+    is_flag=True,
+    default=False,
+    help="Keep MCP sessions (with resumable SSE streams) in memory; single worker only",
+)
+@click.option("--debug/--no-debug", default=False, help="Starlette debug mode (tracebacks in responses)")
+def main(
+    port: int,
+    log_level: str,
+    json_response: bool,
+    http2: bool | None,
+    log_format: str,
+    log_queue: bool,
+    workers: int,
+    loop: str,
+    http_impl: str,
+    token_store: str | None,
+    job_journal: str | None,
+    transports: tuple[str, ...],
+    providers: tuple[str, ...],
+    default_provider: str,
+    stateful: bool,
+    debug: bool,
+) -> int:
+    if stateful and workers > 1:
+        raise click.UsageError("--stateful keeps sessions in process memory and cannot be used with --workers > 1")
+
+    configure_logging(log_level, log_format=log_format, use_queue=log_queue)
+
+    # Outbound pool settings come from MPESA_HTTP_* env vars; CLI may override HTTP/2
+    http_config = HttpPoolConfig.from_env()
+    if http2 is not None:
+        http_config = dataclasses.replace(http_config, http2=http2)
+
+    # Workers read these from the environment they inherit
+    if token_store is None and workers > 1 and not os.getenv(MPESA_TOKEN_STORE_PATH):
+        token_store = os.path.join(tempfile.gettempdir(), f"paylink-mpesa-tokens-{port}.sqlite")
+    if token_store:
+        os.environ[MPESA_TOKEN_STORE_PATH] = token_store
+    if job_journal:
+        os.environ[MPESA_JOB_JOURNAL_PATH] = job_journal
+
+    import uvicorn
+
+    uvicorn_options = dict(
+        host="0.0.0.0",
+        port=port,
+        loop=loop,
+        http=http_impl,
+        log_level=log_level.lower(),
+        # Tool calls have drained by the time uvicorn shuts down; idle streams get this long to close
+        timeout_graceful_shutdown=MPESA_SHUTDOWN_CONNECTION_TIMEOUT,
+        # uvicorn's loggers propagate to the root pipeline configured above
+        log_config=None,
     )
 
+    if workers == 1:
+        uvicorn.run(
+            create_app(json_response, http_config, debug, stateful, transports, providers, default_provider),
+            **uvicorn_options,
+        )
+        return 0
+
+    logger.warning(
+        "Running %d workers: /metrics, admission control, the idempotency store, the payment status store "
+        "and the stk_query cache are per worker. Each scrape of /metrics reports only the worker that "
+        "answered it, a duplicate stk_push that reaches another worker is sent again, and a Daraja "
+        "callback is only matched by the worker that sent the prompt. Run one worker per replica when "
+        "those guarantees matter.",
+        workers,
+    )
 
-    app = Server("mpesa_mcp_server")
-
-    @app.list_tools()
-    async def list_tools() -> list[Tool]:
-        return get_mpesa_tools()
+    # Each worker enforces its share of the per-shortcode Daraja quota
+    os.environ["MPESA_RATE_LIMIT_RPS"] = str(rate_limiter.rate / workers)
+    os.environ["MPESA_RATE_LIMIT_BURST"] = str(max(1, rate_limiter.burst // workers))
+
+    os.environ[SERVER_SETTINGS_ENV] = json.dumps(
+        {
+            "json_response": json_response,
+            "http_config": dataclasses.asdict(http_config),
+            "debug": debug,
+            "transports": list(transports),
+            "providers": list(providers),
+            "default_provider": default_provider,
+            "log_level": log_level,
+            "log_format": log_format,
+            "log_queue": log_queue,
+        }
+    )
+    uvicorn.run("server:app_factory", factory=True, workers=workers, **uvicorn_options)
+    return 0
 
-    @app.call_tool()
-    @paylink_tracer()
-    async def call_tool(name: str, arguments: dict[str, Any]) -> list[TextContent]:
-        headers = request_context.get({})
-        trace_ctx = trace_context.get({})
 
-        logger.info(f"Trace context on tool call: {trace_ctx}")
+# ------------------------------------------------------------------------------
+# App
+# ------------------------------------------------------------------------------
+class PaylinkServer(Server):
+    """MCP server that also advertises resource subscriptions (payment updates)."""
+
+    def get_capabilities(self, notification_options, experimental_capabilities):
+        capabilities = super().get_capabilities(notification_options, experimental_capabilities)
+        # The lowlevel server always reports subscribe=False
+        if capabilities.resources is not None:
+            capabilities.resources.subscribe = True
+        return capabilities
+
+
+def app_factory() -> Starlette:
+    """Build the app inside a uvicorn worker process from the settings main() exported."""
+    settings = json.loads(os.environ[SERVER_SETTINGS_ENV])
+    configure_logging(settings["log_level"], log_format=settings["log_format"], use_queue=settings["log_queue"])
+    return create_app(
+        json_response=settings["json_response"],
+        http_config=HttpPoolConfig(**settings["http_config"]),
+        debug=settings["debug"],
+        transports=tuple(settings["transports"]),
+        providers=tuple(settings["providers"]),
+        default_provider=settings["default_provider"],
+    )
 
-        try:
-            if name == "stk_push":
-                result = await stk_push_handler(arguments, headers)
-            else:
-                return [TextContent(type="text", text=f"Error: Unknown tool '{name}'")]
 
-            # Coerce to text for MCP response
-            if not isinstance(result, str):
-                import json as _json
-                result = _json.dumps(result, ensure_ascii=False)
+def create_app(
+    json_response: bool = False,
+    http_config: HttpPoolConfig | None = None,
+    debug: bool = False,
+    stateful: bool = False,
+    transports: tuple[str, ...] = MPESA_TRANSPORTS,
+    providers: tuple[str, ...] = MPESA_GATEWAY_PROVIDERS,
+    default_provider: str = MPESA_DEFAULT_PROVIDER,
+) -> Starlette:
+    """Build the Starlette app serving MCP over ``transports``, callbacks, metrics and health probes.
+
+    With ``stateful``, StreamableHTTP sessions live in memory between requests
+    and their SSE events are buffered in ``session_events`` so a client can
+    resume a dropped stream with ``Last-Event-ID``.
+
+    ``providers`` are plugin modules loaded next to the built-in M-Pesa
+    provider. All of them share this process's HTTP pool, caches and metrics;
+    tool calls are routed by the ``payment-provider`` header or a
+    ``<provider>__`` tool-name prefix.
+    """
+    http_config = http_config or HttpPoolConfig.from_env()
+
+    app = PaylinkServer("mpesa_mcp_server")
+
+    router = ProviderRouter(
+        [load_provider(spec) for spec in dict.fromkeys((BUILTIN_PROVIDER, *providers))],
+        default_provider,
+    )
+    logger.info("Payment providers: %s (default: %s)", ", ".join(sorted(router.names())), router.default)
+
+    def bind_request_context(func):
+        """Run ``func`` with the context of the HTTP request that carried the tool call.
+
+        Stateful sessions handle messages in a task started by the session's
+        first request, so the context vars set by the ASGI handler would
+        otherwise still hold that request's headers.
+        """
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            scope = getattr(app.request_context.request, "scope", None) or {}
+            request = scope.get(REQUEST_HEADERS_SCOPE_KEY)
+            if request is None:
+                return await func(*args, **kwargs)
+            tok_req = request_context.set(request)
+            tok_trace = trace_context.set(scope[TRACE_CONTEXT_SCOPE_KEY])
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                trace_context.reset(tok_trace)
+                request_context.reset(tok_req)
 
-            return [TextContent(type="text", text=result)]
+        return wrapper
 
+    @app.list_tools()
+    @bind_request_context
+    async def list_tools() -> list[Tool]:
+        request = request_context.get(EMPTY_REQUEST_HEADERS)
+        return router.list_tools(request.headers.get("payment-provider"))
+
+    # Inputs are checked against schemas compiled once in the tool registry
+    async def run_tool(name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+        request = request_context.get(EMPTY_REQUEST_HEADERS)
+        # Formatted (with credentials redacted) only if DEBUG is enabled
+        logger.debug("Trace context on tool call: %r", trace_context.get(None))
+
+        # A draining instance starts nothing it may not be able to finish
+        if not drain.try_enter():
+            return draining_result()
+
+        # Metric labels; unknown names share one label to bound series count
+        provider_label, tool_label = "unknown", "unknown"
+        in_flight = None
+        start = time.perf_counter()
+        outcome = "exception"
+        try:
+            provider_label, entry = router.resolve(name, request.headers.get("payment-provider"))
+            if entry is not None:
+                tool_label = entry.tool.name
+            in_flight = TOOL_CALLS_IN_FLIGHT.labels(provider_label, tool_label)
+            in_flight.inc()
+            if entry is None:
+                outcome = "unknown_tool"
+                return {"status": "error", "message": f"Unknown tool '{name}'"}
+
+            # Rejected before any token fetch or rate-limit slot is spent
+            entry.validate(arguments)
+            # Waits its tenant's turn when all slots are busy
+            async with admission.slot(tenant_for(request)):
+                result = await entry.handler(arguments, request)
+            outcome = tool_outcome(result)
+            return result
+
+        except Overloaded as e:
+            outcome = "shed"
+            logger.warning("Tool call shed by admission control: %s", e)
+            return overloaded_result(e)
+
+        except ToolInputError as e:
+            outcome = "invalid_input"
+            return {"status": "error", "message": f"Invalid input: {e}", "errors": e.errors}
         except ValueError as e:
-            return [TextContent(type="text", text=f"Invalid input: {e}")]
+            outcome = "invalid_input"
+            return {"status": "error", "message": f"Invalid input: {e}"}
         except Exception as e:
             logger.exception("Tool error")
-            return [
-                TextContent(
-                    type="text",
-                    text=f"Something went wrong while running tool '{name}'. Error: {e}",
-                )
-            ]
+            return {"status": "error", "message": f"Something went wrong while running tool '{name}'. Error: {e}"}
+        finally:
+            drain.leave()
+            if in_flight is not None:
+                in_flight.dec()
+            TOOL_CALL_SECONDS.labels(provider_label, tool_label, outcome).observe(time.perf_counter() - start)
+
+    # Used for calls the trace sampler keeps, decided before the call starts
+    traced_run_tool = paylink_tracer()(run_tool)
+
+    # Results go out once as structured content, plus a compact text copy for clients that only read text
+    @app.call_tool(validate_input=False)
+    @bind_request_context
+    async def call_tool(name: str, arguments: dict[str, Any]) -> tuple[list[TextContent], dict[str, Any]]:
+        result = await trace_exporter.call(run_tool, traced_run_tool, name, arguments, trace_context.get(None))
+        # The session that sent a prompt hears about its outcome when the callback arrives
+        creds = request_context.get(EMPTY_REQUEST_HEADERS).credentials
+        for checkout_request_id in checkout_request_ids(result) if creds is not None else ():
+            payment_notifier.watch(checkout_request_id, app.request_context.session, creds.tenant_key)
+        return [TextContent(type="text", text=json_codec.dumps(result))], result
+
+    # payment://{checkout_request_id}: read it, or subscribe for notifications/resources/updated
+    @app.list_resources()
+    async def list_resources() -> list[Resource]:
+        # Payments are addressed through the template, not enumerated
+        return []
+
+    @app.list_resource_templates()
+    async def list_resource_templates() -> list[ResourceTemplate]:
+        return [PAYMENT_RESOURCE_TEMPLATE]
+
+    @app.read_resource()
+    @bind_request_context
+    async def read_resource(uri: Any) -> list[ReadResourceContents]:
+        content = read_payment_resource(uri, request_context.get(EMPTY_REQUEST_HEADERS))
+        return [ReadResourceContents(content=content, mime_type="application/json")]
+
+    @app.subscribe_resource()
+    @bind_request_context
+    async def subscribe_resource(uri: Any) -> None:
+        subscribe_payment_resource(uri, request_context.get(EMPTY_REQUEST_HEADERS), app.request_context.session)
+
+    @app.unsubscribe_resource()
+    async def unsubscribe_resource(uri: Any) -> None:
+        unsubscribe_payment_resource(uri, app.request_context.session)
+
+    # Payment outcomes reach the session that sent the prompt as info-level log notifications
+    @app.set_logging_level()
+    async def set_logging_level(level: LoggingLevel) -> None:
+        payment_notifier.set_log_level(app.request_context.session, level)
+
+    routes = [
+        *(route for provider in router.providers for route in provider.routes),
+        Route("/metrics", endpoint=metrics_endpoint, methods=["GET"]),
+        Route("/healthz", endpoint=healthz_endpoint, methods=["GET"]),
+        Route("/readyz", endpoint=readyz_endpoint, methods=["GET"]),
+    ]
+    readiness_checks: ReadinessChecks = {
+        "http_pool_warm": lambda: http_pool.is_warm,
+        "not_draining": lambda: not drain.draining,
+    }
 
     # ------------------------------------------------------------------------------
-    # Transports
+    # Transports (imported only when enabled)
     # ------------------------------------------------------------------------------
-    sse = SseServerTransport("/messages/")
-
-    # Robust ASGI SSE endpoint (avoid request._send)
-    async def sse_app(scope: Scope, receive: Receive, send: Send) -> None:
-        if scope.get("type") != "http":
-            return
-        try:
-            async with sse.connect_sse(scope, receive, send) as streams:
-                await app.run(streams[0], streams[1], app.create_initialization_options())
-        except Exception:
-            logger.exception("SSE: unhandled error")
-
-    session_manager = StreamableHTTPSessionManager(
-        app=app,
-        event_store=None,
-        json_response=json_response,
-        stateless=True,
-    )
-
-    async def handle_streamable_http(scope: Scope, receive: Receive, send: Send) -> None:
-        # Normalize & store ALL headers
-        headers = _extract_headers(scope)
-        tok_req = request_context.set(headers)
+    if TRANSPORT_SSE in transports:
+        from mcp.server.sse import SseServerTransport
 
-        # Build & store full trace context (includes headers)
-        tc = extract_trace_context(scope, headers)
-        tok_trace = trace_context.set(tc)
+        sse = SseServerTransport("/messages/")
 
-        try:
-            await session_manager.handle_request(scope, receive, send)
-        except Exception:
-            logger.exception("StreamableHTTP: unhandled error")
-        finally:
-            # Prevent context leakage across requests
-            trace_context.reset(tok_trace)
-            request_context.reset(tok_req)
+        # Robust ASGI SSE endpoint (avoid request._send)
+        async def sse_app(scope: Scope, receive: Receive, send: Send) -> None:
+            if scope.get("type") != "http":
+                return
+            try:
+                async with sse.connect_sse(scope, receive, send) as streams:
+                    await app.run(streams[0], streams[1], app.create_initialization_options())
+            except Exception:
+                logger.exception("SSE: unhandled error")
+
+        routes += [Mount("/sse", app=sse_app), Mount("/messages/", app=sse.handle_post_message)]
+
+    session_manager = None
+    session_manager_running = False
+    if TRANSPORT_STREAMABLE_HTTP in transports:
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+        session_manager = StreamableHTTPSessionManager(
+            app=app,
+            # Stateful sessions buffer their SSE events so a client can resume a stream
+            event_store=session_events if stateful else None,
+            json_response=json_response,
+            stateless=not stateful,
+        )
+
+        async def handle_streamable_http(scope: Scope, receive: Receive, send: Send) -> None:
+            # Normalize headers and resolve tenant credentials in a single pass
+            request = parse_request_headers(scope.get("headers"))
+            tok_req = request_context.set(request)
+
+            # Trace context is built lazily from scope + headers when first read
+            lazy_trace = LazyTraceContext(scope, request.headers)
+            tok_trace = trace_context.set(lazy_trace)
+            scope[REQUEST_HEADERS_SCOPE_KEY] = request
+            scope[TRACE_CONTEXT_SCOPE_KEY] = lazy_trace
+
+            # Open requests keep a stateful session from being evicted as idle
+            session_id = request.headers.get("mcp-session-id") if stateful else None
+            if session_id:
+                session_events.touch(session_id, 1)
+            # Events are stored under the request's session, or the one it creates
+            tok_events = None
+            if stateful:
+                tok_events, send = session_events.track(session_id, send)
+
+            HTTP_REQUESTS_IN_FLIGHT.inc()
+            try:
+                await session_manager.handle_request(scope, receive, send)
+            except Exception:
+                logger.exception("StreamableHTTP: unhandled error")
+            finally:
+                HTTP_REQUESTS_IN_FLIGHT.dec()
+                if session_id:
+                    session_events.touch(session_id, -1)
+                    # A client closing its session no longer needs its events
+                    if scope.get("method") == "DELETE":
+                        session_events.drop_session(session_id)
+                # Prevent context leakage across requests
+                if tok_events is not None:
+                    session_events.release(tok_events)
+                trace_context.reset(tok_trace)
+                request_context.reset(tok_req)
+
+        routes.append(Mount("/mcp", app=handle_streamable_http))
+        # The manager refuses requests until run() has started it in the lifespan
+        readiness_checks["session_manager"] = lambda: session_manager_running
 
     @contextlib.asynccontextmanager
     async def lifespan(starlette_app: Starlette) -> AsyncIterator[None]:
-        async with session_manager.run():
+        nonlocal session_manager_running
+        # Pooled Daraja clients live for the lifetime of the app
+        http_pool.configure(http_config)
+        # Connections are opened in the background; /readyz fails until they are
+        warmup = asyncio.create_task(http_pool.warm_up(MPESA_WARMUP_BASE_URLS))
+        # Keeps active tenants' tokens fresh so requests never wait on OAuth
+        token_refresher.start()
+        # Sampled traces are exported in batches by a background task
+        trace_exporter.start()
+        # SIGTERM drains in-flight tool calls before uvicorn starts shutting down
+        drain.reset()
+        drain.install_signal_handler()
+        async with contextlib.AsyncExitStack() as stack:
+            for provider in router.providers:
+                if provider.lifespan is not None:
+                    await stack.enter_async_context(provider.lifespan())
+            evictor = None
+            if session_manager is not None:
+                await stack.enter_async_context(session_manager.run())
+                session_manager_running = True
+                if stateful:
+                    evictor = asyncio.create_task(evict_idle_sessions(session_manager, session_events))
             try:
                 yield
             finally:
+                # Drain (a no-op if SIGTERM already did), then release resources and flush
                 logger.info("Application shutting down...")
-
-    routes = [
-        Mount("/sse", app=sse_app),
-        Mount("/messages/", app=sse.handle_post_message),
-        Mount("/mcp", app=handle_streamable_http),
-    ]
-
-    starlette_app = Starlette(debug=True, lifespan=lifespan, routes=routes)
-
-    uvicorn.run(starlette_app, host="0.0.0.0", port=port, log_level=log_level.lower())
-    return 0
+                session_manager_running = False
+                drain.restore_signal_handler()
+                drain.begin()
+                await drain.wait_idle(MPESA_DRAIN_GRACE_SECONDS)
+                for task in (warmup, evictor):
+                    if task is not None:
+                        task.cancel()
+                        with contextlib.suppress(asyncio.CancelledError):
+                            await task
+                await token_refresher.stop()
+                # Traces from drained calls go out before the pool they use is closed
+                await trace_exporter.stop()
+                await http_pool.aclose()
+                logger.info("Shutdown complete: pools closed")
+                pipeline = get_logging_pipeline()
+                if pipeline is not None:
+                    await asyncio.to_thread(pipeline.flush)
+
+    starlette_app = Starlette(debug=debug, lifespan=lifespan, routes=routes)
+    starlette_app.state.readiness_checks = readiness_checks
+    return starlette_app
 
 
 if __name__ == "__main__":
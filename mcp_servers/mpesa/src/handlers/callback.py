@@ -0,0 +1,56 @@
+import os
+import hmac
+import json
+import logging
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from src.utils.payment_store import payment_store
+
+logger = logging.getLogger(__name__)
+
+# Path Daraja posts STK results to; point `mpesa-callback-url` at it
+MPESA_CALLBACK_PATH = os.getenv("MPESA_CALLBACK_PATH", "/mpesa/callback")
+# Shared secret expected as `?token=...` on the callback URL; without it anyone can post outcomes
+MPESA_CALLBACK_TOKEN = os.getenv("MPESA_CALLBACK_TOKEN")
+
+
+def warn_if_unauthenticated() -> None:
+    """Log loudly at startup when callbacks are accepted without a token."""
+    if not MPESA_CALLBACK_TOKEN:
+        logger.warning(
+            "MPESA_CALLBACK_TOKEN is not set: %s accepts payment outcomes from anyone who knows a "
+            "CheckoutRequestID. Set it and add ?token=<secret> to mpesa-callback-url.",
+            MPESA_CALLBACK_PATH,
+        )
+
+
+async def mpesa_callback_endpoint(request: Request) -> JSONResponse:
+    """Receive a Daraja STK callback and record the payment outcome."""
+    if MPESA_CALLBACK_TOKEN:
+        token = request.query_params.get("token", "")
+        # Compared as bytes: compare_digest rejects non-ASCII str with TypeError
+        if not hmac.compare_digest(token.encode(), MPESA_CALLBACK_TOKEN.encode()):
+            logger.warning("Rejected M-Pesa callback with invalid token")
+            return JSONResponse({"ResultCode": 1, "ResultDesc": "Unauthorized"}, status_code=401)
+
+    try:
+        body = json.loads(await request.body())
+        record = payment_store.apply_callback(body)
+    except ValueError as e:
+        logger.warning("Invalid M-Pesa callback: %s", e)
+        return JSONResponse({"ResultCode": 1, "ResultDesc": "Invalid callback payload"}, status_code=400)
+
+    if record is None:
+        # Acknowledged so Daraja stops retrying; nothing is recorded for an unknown prompt
+        logger.warning("Ignored M-Pesa callback for unknown checkout_request_id")
+        return JSONResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
+
+    logger.info(
+        "M-Pesa callback: checkout_request_id=%s status=%s result_code=%s",
+        record.checkout_request_id,
+        record.status,
+        record.result_code,
+    )
+    return JSONResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
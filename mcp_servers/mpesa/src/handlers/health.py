@@ -0,0 +1,23 @@
+from typing import Callable, Dict
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+# Name -> callable that is True while that part of the server can take traffic
+ReadinessChecks = Dict[str, Callable[[], bool]]
+
+
+async def healthz_endpoint(request: Request) -> JSONResponse:
+    """Liveness: the process is up and its event loop answers."""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz_endpoint(request: Request) -> JSONResponse:
+    """Readiness: every check in ``app.state.readiness_checks`` passes (503 otherwise)."""
+    checks: ReadinessChecks = getattr(request.app.state, "readiness_checks", {})
+    results = {name: bool(check()) for name, check in checks.items()}
+    ready = all(results.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": results},
+        status_code=200 if ready else 503,
+    )
@@ -0,0 +1,30 @@
+import logging
+from typing import Any
+
+from src.utils.credentials import RequestHeaders
+from src.handlers.stk_push import stk_push_jobs
+
+logger = logging.getLogger(__name__)
+
+
+async def job_status_handler(arguments: dict[str, Any], request: RequestHeaders) -> dict[str, Any]:
+    try:
+        job_id = str(arguments.get("job_id") or "").strip()
+        if not job_id:
+            raise ValueError("Missing required field: 'job_id'")
+        creds = request.require_credentials()
+
+        job = await stk_push_jobs.get(job_id)
+
+        # Never hand out another tenant's job
+        if job is None or job.tenant_key != creds.tenant_key:
+            return {
+                "status": "error",
+                "message": "No job found. It may not have been submitted to this server or has expired.",
+            }
+
+        return {"status": "success", "job": job.to_dict()}
+
+    except ValueError as ve:
+        logger.warning("Validation error: %s", ve)
+        return {"status": "error", "message": f"Invalid input: {ve}"}
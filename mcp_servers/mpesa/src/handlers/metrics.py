@@ -0,0 +1,142 @@
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.handlers.stk_push import stk_push_jobs
+from src.utils.admission import admission
+from src.utils.auth import token_refresher
+from src.utils.event_store import session_events
+from src.utils.lifecycle import drain
+from src.utils.payment_events import payment_notifier
+from src.utils.logging_config import get_logging_pipeline
+from src.utils.metrics import Samples, metrics
+from src.utils.rate_limit import rate_limiter
+from src.utils.trace_export import trace_exporter
+from src.utils.resilience import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, circuit_breakers
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_BREAKER_STATES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+def _rate_limit_stat(field: str):
+    def collect() -> Samples:
+        for shortcode, stats in rate_limiter.stats().items():
+            yield {"shortcode": shortcode}, stats[field]
+
+    return collect
+
+
+def _breaker_stat(field: str):
+    def collect() -> Samples:
+        for base_url, stats in circuit_breakers.stats().items():
+            value = stats[field]
+            yield {"base_url": base_url}, _BREAKER_STATES.get(value, value)
+
+    return collect
+
+
+def _logging_stat(field: str):
+    def collect() -> Samples:
+        pipeline = get_logging_pipeline()
+        if pipeline is not None:
+            yield {}, pipeline.stats()[field]
+
+    return collect
+
+
+metrics.collector("mpesa_rate_limit_queue_depth", "Requests waiting for a Daraja rate-limit slot.", _rate_limit_stat("queue_depth"))
+metrics.collector("mpesa_rate_limit_admitted_total", "Requests admitted by the rate limiter.", _rate_limit_stat("admitted"), "counter")
+metrics.collector("mpesa_rate_limit_rejected_total", "Requests rejected by the rate limiter.", _rate_limit_stat("rejected"), "counter")
+metrics.collector("mpesa_circuit_breaker_state", "Breaker state per base URL (0 closed, 1 half-open, 2 open).", _breaker_stat("state"))
+metrics.collector("mpesa_circuit_breaker_opened_total", "Times the breaker has opened.", _breaker_stat("times_opened"), "counter")
+metrics.collector("mpesa_circuit_breaker_rejected_total", "Calls failed fast by an open breaker.", _breaker_stat("rejected"), "counter")
+metrics.collector(
+    "mpesa_token_refresh_tenants", "Tenants whose tokens are refreshed in the background.",
+    lambda: [({}, token_refresher.stats()["tenants"])],
+)
+metrics.collector(
+    "mpesa_token_refresh_total", "Background token refreshes by result.",
+    lambda: [({"result": "ok"}, token_refresher.refreshed), ({"result": "failed"}, token_refresher.failed)],
+    "counter",
+)
+metrics.collector(
+    "mcp_sessions", "Stateful MCP sessions with buffered events.",
+    lambda: [({}, session_events.stats()["sessions"])],
+)
+metrics.collector(
+    "mcp_session_event_bytes", "Serialized SSE event bytes held for resumption.",
+    lambda: [({}, session_events.total_bytes)],
+)
+metrics.collector(
+    "mcp_session_events_evicted_total", "Buffered events dropped by the per-session or global cap.",
+    lambda: [({}, session_events.evicted_events)],
+    "counter",
+)
+metrics.collector(
+    "mcp_sessions_evicted_total", "Sessions closed for being idle or already terminated.",
+    lambda: [({}, session_events.evicted_sessions)],
+    "counter",
+)
+metrics.collector(
+    "mcp_admission_in_flight", "Tool calls holding an admission slot.",
+    lambda: [({}, admission.in_flight)],
+)
+metrics.collector(
+    "mcp_admission_queue_depth", "Tool calls waiting for an admission slot.",
+    lambda: [({}, admission.queued)],
+)
+metrics.collector(
+    "mcp_admission_tenants_waiting", "Tenants with tool calls waiting for a slot.",
+    lambda: [({}, admission.stats()["tenants_waiting"])],
+)
+metrics.collector(
+    "mcp_admission_total", "Tool calls by admission result (admitted, waited, shed).",
+    lambda: [({"result": result}, admission.stats()[result]) for result in ("admitted", "waited", "shed")],
+    "counter",
+)
+metrics.collector("mpesa_draining", "1 while the server is draining for shutdown.", lambda: [({}, int(drain.draining))])
+metrics.collector(
+    "mpesa_drain_rejected_total", "Tool calls refused because the server was draining.",
+    lambda: [({}, drain.rejected)],
+    "counter",
+)
+metrics.collector(
+    "mpesa_payment_watches", "Payments with a session waiting for their outcome.",
+    lambda: [({}, payment_notifier.stats()["payments"])],
+)
+metrics.collector(
+    "mpesa_payment_notifications_total", "Payment notifications pushed to MCP sessions by result.",
+    lambda: [({"result": "sent"}, payment_notifier.sent), ({"result": "failed"}, payment_notifier.failed)],
+    "counter",
+)
+metrics.collector(
+    "mpesa_jobs", "Journaled payment jobs by state, as of the last maintenance pass.",
+    lambda: [({"state": state}, count) for state, count in stk_push_jobs.stats()["states"].items()],
+)
+metrics.collector(
+    "mpesa_job_runs_total", "Payment job runs in this process by result.",
+    lambda: [({"result": "completed"}, stk_push_jobs.completed), ({"result": "retried"}, stk_push_jobs.retried)],
+    "counter",
+)
+metrics.collector(
+    "mpesa_jobs_recovered_total", "Jobs recovered from stopped workers (requeued or marked unknown).",
+    lambda: [({}, stk_push_jobs.recovered)],
+    "counter",
+)
+metrics.collector(
+    "paylink_trace_buffer_depth", "Sampled traces waiting for export.",
+    lambda: [({}, trace_exporter.stats()["buffered"])],
+)
+metrics.collector(
+    "paylink_traces_total", "paylink_tracer traces by result (exported, failed, sampled_out, dropped).",
+    lambda: [({"result": result}, count) for result, count in trace_exporter.stats().items() if result != "buffered"],
+    "counter",
+)
+metrics.collector("log_queue_depth", "Log records waiting for the writer thread.", _logging_stat("queue_depth"))
+metrics.collector("log_records_dropped_total", "Log records dropped because the queue was full.", _logging_stat("dropped"), "counter")
+metrics.collector("log_records_sampled_out_total", "INFO/DEBUG records skipped by sampling.", _logging_stat("sampled_out"), "counter")
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Expose process metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,40 @@
+from typing import Any
+
+from mcp.server.session import ServerSession
+from mcp.types import ResourceTemplate
+
+from src.utils import json_codec
+from src.utils.credentials import RequestHeaders
+from src.utils.payment_events import PAYMENT_URI_TEMPLATE, checkout_request_id_from_uri, payment_notifier
+from src.utils.payment_store import payment_store
+
+PAYMENT_RESOURCE_TEMPLATE = ResourceTemplate(
+    uriTemplate=PAYMENT_URI_TEMPLATE,
+    name="payment",
+    description="Latest known state of an M-Pesa Express (STK Push) payment started by this server. Subscribe to be notified when the customer completes, cancels or fails the payment.",
+    mimeType="application/json",
+)
+
+
+def _checkout_request_id(uri: Any) -> str:
+    checkout_request_id = checkout_request_id_from_uri(uri)
+    if checkout_request_id is None:
+        raise ValueError(f"Unknown resource '{uri}'; expected {PAYMENT_URI_TEMPLATE}")
+    return checkout_request_id
+
+
+def read_payment_resource(uri: Any, request: RequestHeaders) -> str:
+    record = payment_store.get(_checkout_request_id(uri), request.require_credentials().tenant_key)
+    if record is None:
+        raise ValueError("No payment found. It may not have been initiated by this server or has expired.")
+    return json_codec.dumps(record.to_dict())
+
+
+def subscribe_payment_resource(uri: Any, request: RequestHeaders, session: ServerSession) -> None:
+    # Any id is accepted: the prompt may still be on its way to Daraja, and
+    # updates are only delivered to the tenant that owns the payment
+    payment_notifier.subscribe(_checkout_request_id(uri), session, request.require_credentials().tenant_key)
+
+
+def unsubscribe_payment_resource(uri: Any, session: ServerSession) -> None:
+    payment_notifier.unsubscribe(_checkout_request_id(uri), session)
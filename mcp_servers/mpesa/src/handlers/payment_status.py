@@ -0,0 +1,42 @@
+import logging
+from typing import Any
+
+from src.utils.credentials import RequestHeaders
+from src.utils.payment_store import PaymentRecord, payment_store
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_FIELDS = ("checkout_request_id", "merchant_request_id", "phone_number", "account_reference")
+
+
+def _find_record(arguments: dict[str, Any], tenant_key: str) -> PaymentRecord | None:
+    """Look up one of the tenant's payments by the first identifier given, most specific first."""
+    if arguments.get("checkout_request_id"):
+        return payment_store.get(str(arguments["checkout_request_id"]), tenant_key)
+    if arguments.get("merchant_request_id"):
+        return payment_store.get_by_merchant_request_id(str(arguments["merchant_request_id"]), tenant_key)
+    if arguments.get("phone_number"):
+        return payment_store.latest_by_phone(tenant_key, str(arguments["phone_number"]))
+    return payment_store.latest_by_reference(tenant_key, str(arguments["account_reference"]))
+
+
+async def payment_status_handler(arguments: dict[str, Any], request: RequestHeaders) -> dict[str, Any]:
+    try:
+        if not any(arguments.get(field) for field in LOOKUP_FIELDS):
+            raise ValueError(f"Provide one of: {', '.join(LOOKUP_FIELDS)}")
+
+        # Payments are only shown to callers holding the credentials that sent them
+        creds = request.require_credentials()
+        record = _find_record(arguments, creds.tenant_key)
+
+        if record is None:
+            return {
+                "status": "error",
+                "message": "No payment found. It may not have been initiated by this server or has expired.",
+            }
+
+        return {"status": "success", "payment": record.to_dict()}
+
+    except ValueError as ve:
+        logger.warning("Validation error: %s", ve)
+        return {"status": "error", "message": f"Invalid input: {ve}"}
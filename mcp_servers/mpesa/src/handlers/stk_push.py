@@ -1,138 +1,115 @@
 import logging
-import json
-import base64
-from datetime import datetime
-from typing import Any
+from typing import Any, Awaitable, Callable
 import httpx
-from src.utils.auth import get_mpesa_access_token
+from src.utils.credentials import MpesaCredentials, RequestHeaders, credentials_from_values
+from src.utils.daraja import circuit_open_result, http_error_result, request_failed_result
+from src.utils.resilience import CircuitOpenError
+from src.utils.payment_store import payment_store
+from src.utils.idempotency import IdempotencyKeyConflict, idempotency_key_for, payment_fingerprint
+from src.utils.job_queue import Job, JobQueue, JobQueueFull
+from src.utils.rate_limit import RateLimitExceeded, rate_limited_result
+from src.utils.stk_push import send_stk_push_idempotent, validate_payment
 
 logger = logging.getLogger(__name__)
 
-def _normalize_headers(headers: dict[str, str]) -> dict[str, str]:
-    """Normalize incoming headers to snake_case and lowercase keys."""
-    norm: dict[str, str] = {}
-    for k, v in (headers or {}).items():
-        if not isinstance(k, str):
-            continue
-        kk = k.strip().lower().replace("-", "_")
-        norm[kk] = v
-    return norm
-
-def _hget(headers_norm: dict[str, str], key: str) -> str | None:
-    """Get a header by snake_case key; accepts both hyphen and underscore originals."""
-    return headers_norm.get(key)
-
-async def stk_push_handler(arguments: dict[str, Any], headers: dict[str, str]) -> str:
-    # Normalize headers once
-    h = _normalize_headers(headers or {})
-
-    # Safe header debug (no secrets)
-    logger.info(
-        "M-Pesa header presence: base_url=%s, shortcode=%s, callback=%s, passkey=%s, consumer_key=%s, consumer_secret=%s",
-        bool(h.get("mpesa_base_url")),
-        bool(h.get("mpesa_business_shortcode")),
-        bool(h.get("mpesa_callback_url")),
-        bool(h.get("mpesa_passkey")),
-        bool(h.get("mpesa_consumer_key")),
-        bool(h.get("mpesa_consumer_secret")),
-    )
 
+async def _stk_push_result(
+    creds: MpesaCredentials,
+    arguments: dict[str, Any],
+    before_send: Callable[[], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """Send an STK push and map failures to tool results."""
     try:
-        # Validate required tool args
-        for field in ("amount", "phone_number", "account_reference", "transaction_desc"):
-            if not arguments.get(field):
-                logger.warning("Missing required field: '%s'", field)
-                raise ValueError(f"Missing required field: '{field}'")
-
-        # Read credentials from normalized headers (works for hyphen or underscore from client)
-        base_url            = _hget(h, "mpesa_base_url")
-        business_short_code = _hget(h, "mpesa_business_shortcode")
-        passkey             = _hget(h, "mpesa_passkey")
-        callback_url        = _hget(h, "mpesa_callback_url")
-        consumer_key        = _hget(h, "mpesa_consumer_key")
-        consumer_secret     = _hget(h, "mpesa_consumer_secret")
-
-        if not all([base_url, business_short_code, passkey, callback_url, consumer_key, consumer_secret]):
-            raise ValueError("Missing one or more M-Pesa credentials in request headers.")
-
-        logger.info("Using base URL: %s", base_url)
-
-        transaction_type = "CustomerPayBillOnline"
-
-        # Generate technical parameters
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        password_string = f"{business_short_code}{passkey}{timestamp}"
-        password = base64.b64encode(password_string.encode()).decode()
-
-        # Access token using dynamic credentials
-        access_token = await get_mpesa_access_token(consumer_key, consumer_secret, base_url)
-
-        # Ensure amount is a string/int as expected by API
-        amount = arguments["amount"]
-        # Optional: coerce to int (Safaricom accepts numeric); comment out if you prefer raw
-        try:
-            amount = int(str(amount))
-        except Exception:
-            pass
-
-        phone = str(arguments["phone_number"])
-
-        payload = {
-            "BusinessShortCode": business_short_code,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": transaction_type,
-            "Amount": amount,
-            "PartyA": phone,
-            "PartyB": business_short_code,
-            "PhoneNumber": phone,
-            "CallBackURL": callback_url,
-            "AccountReference": arguments["account_reference"],
-            "TransactionDesc": arguments["transaction_desc"],
-        }
+        return await send_stk_push_idempotent(creds, arguments, before_send=before_send)
 
-        url = f"{base_url}/mpesa/stkpush/v1/processrequest"
-        headers_ = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
+    except ValueError as ve:
+        logger.warning("Validation error: %s", ve)
+        return {"status": "error", "message": f"Invalid input: {ve}"}
+
+    except RateLimitExceeded as e:
+        logger.warning("STK push rejected by rate limiter: %s", e)
+        return rate_limited_result(e)
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=payload, headers=headers_)
-            resp.raise_for_status()
-            data = resp.json()
-
-        # Success per API contract: ResponseCode == "0"
-        if data.get("ResponseCode") != "0":
-            error_msg = data.get("ResponseDescription", "Unknown error")
-            logger.warning("STK push failed: code=%s msg=%s", data.get("ResponseCode"), error_msg)
-            return json.dumps({"status": "error", "message": error_msg, "raw": data}, indent=2)
-
-        result = {
-            "status": "success",
-            "message": data.get("CustomerMessage", "Payment prompt sent successfully"),
-            "merchant_request_id": data.get("MerchantRequestID"),
-            "checkout_request_id": data.get("CheckoutRequestID"),
-            "amount": str(amount),
-            "phone_number": phone,
-            "reference": arguments["account_reference"],
+    except CircuitOpenError as e:
+        logger.warning("STK push not sent: %s", e)
+        return circuit_open_result(e)
+
+    except httpx.HTTPStatusError as e:
+        return http_error_result(e)
+
+    except Exception as e:
+        logger.exception("Unexpected error during STK push request")
+        return request_failed_result(e, creds.base_url)
+
+async def _run_stk_push_job(job: Job, before_send: Callable[[], Awaitable[None]]) -> dict[str, Any]:
+    creds = credentials_from_values(tuple(value.encode() for value in job.credentials or ()))
+    return await _stk_push_result(creds, job.arguments, before_send)
+
+def _restore_payment(job: Job) -> None:
+    """Track a prompt sent before a restart again, so its callback still finds it."""
+    result = job.result or {}
+    checkout_request_id = result.get("checkout_request_id")
+    if result.get("status") != "success" or not checkout_request_id or checkout_request_id in payment_store:
+        return
+    payment_store.record_pending(
+        checkout_request_id,
+        result.get("merchant_request_id"),
+        job.tenant_key,
+        result.get("phone_number"),
+        result.get("reference"),
+        result.get("amount"),
+    )
+
+# Journaled stk_push jobs (submit_async); workers run for the lifetime of the app
+stk_push_jobs = JobQueue(_run_stk_push_job, restore=_restore_payment)
+
+async def _submit_stk_push_job(creds: MpesaCredentials, arguments: dict[str, Any]) -> dict[str, Any]:
+    """Journal the payment for the worker pool and return its job id without waiting for M-Pesa."""
+    arguments = {k: v for k, v in arguments.items() if k != "submit_async"}
+    key, ttl = idempotency_key_for(creds.tenant_key, arguments)
+    try:
+        job, replayed = await stk_push_jobs.submit(creds.tenant_key, creds.values(), arguments, key, ttl)
+    except JobQueueFull as e:
+        logger.warning("STK push job rejected: %s", e)
+        return {
+            "status": "error",
+            "message": f"Too many payments are waiting to be sent ({e}). Try again shortly.",
+            "retryable": True,
+            "retry_after": 1,
         }
 
-        logger.info("STK push successful for %s KES to %s", result["amount"], result["phone_number"])
-        return json.dumps(result, indent=2)
+    # The journal matched the key only; an explicit key must stand for the same payment
+    if replayed and key[0] == "key" and payment_fingerprint(job.arguments) != payment_fingerprint(arguments):
+        raise IdempotencyKeyConflict()
+
+    result = {
+        "status": "accepted",
+        "message": "Payment prompt queued for sending. Check progress with get_job_status.",
+        "job_id": job.id,
+        "job_state": job.state,
+        "amount": str(arguments["amount"]),
+        "phone_number": str(arguments["phone_number"]),
+        "reference": arguments["account_reference"],
+    }
+    if replayed:
+        result["idempotent_replay"] = True
+    return result
+
+async def stk_push_handler(arguments: dict[str, Any], request: RequestHeaders) -> dict[str, Any]:
+    try:
+        validate_payment(arguments)
+        creds = request.require_credentials()
+        logger.info("Using base URL: %s", creds.base_url)
+
+        if arguments.get("submit_async"):
+            return await _submit_stk_push_job(creds, arguments)
 
     except ValueError as ve:
         logger.warning("Validation error: %s", ve)
-        return json.dumps({"status": "error", "message": f"Invalid input: {ve}"}, indent=2)
-
-    except httpx.HTTPStatusError as e:
-        body = e.response.text if e.response is not None else ""
-        logger.error("HTTP error %s: %s", e.response.status_code if e.response else "?", body)
-        return json.dumps(
-            {"status": "error", "message": "HTTP request failed", "code": e.response.status_code if e.response else None, "raw": body},
-            indent=2,
-        )
+        return {"status": "error", "message": f"Invalid input: {ve}"}
 
     except Exception as e:
-        logger.exception("Unexpected error during STK push request")
-        return json.dumps({"status": "error", "message": f"Request failed: {e}"}, indent=2)
+        logger.exception("Unexpected error while queueing STK push")
+        return request_failed_result(e, None)
+
+    return await _stk_push_result(creds, arguments)
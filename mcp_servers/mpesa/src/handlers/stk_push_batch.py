@@ -0,0 +1,114 @@
+import os
+import asyncio
+import logging
+from typing import Any
+
+import httpx
+
+from src.utils.auth import get_access_token
+from src.utils.credentials import RequestHeaders
+from src.utils.idempotency import IdempotencyKeyConflict
+from src.utils.rate_limit import RateLimitExceeded, rate_limited_result
+from src.utils.daraja import circuit_open_result, http_error_result, request_failed_result
+from src.utils.resilience import CircuitOpenError
+from src.utils.stk_push import send_stk_push_idempotent, validate_payment
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on payments per batch call
+MPESA_BATCH_MAX_SIZE = int(os.getenv("MPESA_BATCH_MAX_SIZE", "100"))
+# Default number of STK requests in flight at once for a single batch
+MPESA_BATCH_CONCURRENCY = int(os.getenv("MPESA_BATCH_CONCURRENCY", "5"))
+# Hard cap on the per-call `max_concurrency` argument
+MPESA_BATCH_MAX_CONCURRENCY = int(os.getenv("MPESA_BATCH_MAX_CONCURRENCY", "20"))
+
+
+def _validate_batch(arguments: dict[str, Any]) -> tuple[list[dict[str, Any]], int]:
+    """Validate the whole batch up front; nothing is sent if any item is invalid."""
+    payments = arguments.get("payments")
+    if not isinstance(payments, list) or not payments:
+        raise ValueError("'payments' must be a non-empty array")
+    if len(payments) > MPESA_BATCH_MAX_SIZE:
+        raise ValueError(f"'payments' accepts at most {MPESA_BATCH_MAX_SIZE} items, got {len(payments)}")
+
+    problems: list[str] = []
+    for i, payment in enumerate(payments):
+        if not isinstance(payment, dict):
+            problems.append(f"payments[{i}]: must be an object")
+            continue
+        try:
+            validate_payment(payment)
+        except ValueError as ve:
+            problems.append(f"payments[{i}]: {ve}")
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    concurrency = arguments.get("max_concurrency") or MPESA_BATCH_CONCURRENCY
+    try:
+        concurrency = int(concurrency)
+    except (TypeError, ValueError):
+        raise ValueError("'max_concurrency' must be an integer")
+    concurrency = max(1, min(concurrency, MPESA_BATCH_MAX_CONCURRENCY))
+
+    return payments, concurrency
+
+
+async def stk_push_batch_handler(arguments: dict[str, Any], request: RequestHeaders) -> dict[str, Any]:
+    try:
+        payments, concurrency = _validate_batch(arguments)
+        creds = request.require_credentials()
+
+        # One token for the whole batch
+        access_token = await get_access_token(creds)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run(payment: dict[str, Any]) -> dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await send_stk_push_idempotent(creds, payment, access_token)
+                except IdempotencyKeyConflict as e:
+                    return {"status": "error", "message": f"Invalid input: {e}"}
+                except RateLimitExceeded as e:
+                    return rate_limited_result(e)
+                except CircuitOpenError as e:
+                    return circuit_open_result(e)
+                except httpx.HTTPStatusError as e:
+                    return http_error_result(e)
+                except Exception as e:
+                    logger.exception("Unexpected error during batch STK push item")
+                    return request_failed_result(e, creds.base_url)
+
+        logger.info("Sending STK push batch of %d payments (concurrency=%d)", len(payments), concurrency)
+        outcomes = await asyncio.gather(*(_run(p) for p in payments))
+
+        results = [{"index": i, **outcome} for i, outcome in enumerate(outcomes)]
+        succeeded = sum(1 for r in results if r.get("status") == "success")
+        failed = len(results) - succeeded
+
+        if failed == 0:
+            status = "success"
+        elif succeeded == 0:
+            status = "error"
+        else:
+            status = "partial"
+
+        return {
+            "status": status,
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": failed,
+            "results": results,
+        }
+
+    except ValueError as ve:
+        logger.warning("Validation error: %s", ve)
+        return {"status": "error", "message": f"Invalid input: {ve}"}
+
+    except CircuitOpenError as e:
+        logger.warning("STK push batch not sent: %s", e)
+        return circuit_open_result(e)
+
+    except Exception as e:
+        logger.exception("Unexpected error during STK push batch")
+        return {"status": "error", "message": f"Request failed: {e}"}
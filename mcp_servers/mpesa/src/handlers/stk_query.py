@@ -0,0 +1,155 @@
+import os
+import logging
+from typing import Any
+
+import httpx
+
+from src.utils.auth import get_access_token
+from src.utils.credentials import MpesaCredentials, RequestHeaders
+from src.utils.cache import SingleFlight, TTLCache
+from src.utils.daraja import (
+    circuit_open_result,
+    daraja_request,
+    http_error_result,
+    request_failed_result,
+    stk_password,
+    upstream_error_result,
+)
+from src.utils.metrics import DARAJA_RESPONSE_CODES
+from src.utils.resilience import CircuitOpenError
+from src.utils.rate_limit import RateLimitExceeded, rate_limited_result, rate_limiter
+from src.utils.payment_store import STATUS_PENDING, payment_store, status_for_result_code
+
+logger = logging.getLogger(__name__)
+
+# Cache lifetime while the customer has not completed the prompt yet
+MPESA_QUERY_PENDING_TTL = float(os.getenv("MPESA_QUERY_PENDING_TTL", "3"))
+# Cache lifetime once the payment has reached a final state
+MPESA_QUERY_FINAL_TTL = float(os.getenv("MPESA_QUERY_FINAL_TTL", "600"))
+MPESA_QUERY_CACHE_MAX_ENTRIES = int(os.getenv("MPESA_QUERY_CACHE_MAX_ENTRIES", "10000"))
+
+# Daraja errorCode returned (with HTTP 500) while the payment is still in progress
+_PENDING_ERROR_CODES = {"500.001.1001"}
+
+_query_cache: TTLCache[dict[str, Any]] = TTLCache(MPESA_QUERY_CACHE_MAX_ENTRIES)
+_query_flight = SingleFlight()
+
+
+async def _query_upstream(creds: MpesaCredentials, checkout_request_id: str) -> dict[str, Any]:
+    """Call the STK Push query endpoint and map the answer to a tool result."""
+    base_url = creds.base_url
+    business_short_code = creds.business_short_code
+    access_token = await get_access_token(creds)
+    password, timestamp = stk_password(business_short_code, creds.passkey)
+
+    payload = {
+        "BusinessShortCode": business_short_code,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id,
+    }
+    url = f"{base_url}/mpesa/stkpushquery/v1/query"
+    headers_ = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+
+    # Queries share the shortcode's Daraja quota with STK pushes
+    await rate_limiter.acquire(business_short_code)
+
+    resp = await daraja_request("POST", base_url, url, json=payload, headers=headers_)
+
+    if resp.is_error:
+        try:
+            error = resp.json()
+        except ValueError:
+            error = {}
+        if error.get("errorCode") in _PENDING_ERROR_CODES:
+            return {
+                "status": "success",
+                "checkout_request_id": checkout_request_id,
+                "payment_status": STATUS_PENDING,
+                "result_desc": error.get("errorMessage"),
+            }
+        resp.raise_for_status()
+
+    data = resp.json()
+    DARAJA_RESPONSE_CODES.labels("stkpushquery", str(data.get("ResponseCode"))).inc()
+    if data.get("ResponseCode") != "0" or data.get("ResultCode") is None:
+        error_msg = data.get("ResponseDescription", "Unknown error")
+        logger.warning("STK query failed: code=%s msg=%s", data.get("ResponseCode"), error_msg)
+        return upstream_error_result(error_msg, data)
+
+    result_code = int(data["ResultCode"])
+    # Keep a payment tracked by this server in sync with what Daraja reported
+    if payment_store.get(checkout_request_id, creds.tenant_key) is not None:
+        payment_store.apply_result(checkout_request_id, data.get("MerchantRequestID"), result_code, data.get("ResultDesc"))
+
+    return {
+        "status": "success",
+        "checkout_request_id": checkout_request_id,
+        "merchant_request_id": data.get("MerchantRequestID"),
+        "payment_status": status_for_result_code(result_code),
+        "result_code": result_code,
+        "result_desc": data.get("ResultDesc"),
+    }
+
+
+async def _query_and_cache(key: tuple, creds: MpesaCredentials, checkout_request_id: str) -> dict[str, Any]:
+    result = await _query_upstream(creds, checkout_request_id)
+    if result["status"] == "success":
+        ttl = MPESA_QUERY_PENDING_TTL if result["payment_status"] == STATUS_PENDING else MPESA_QUERY_FINAL_TTL
+        _query_cache.set(key, result, ttl)
+    return result
+
+
+async def stk_query_handler(arguments: dict[str, Any], request: RequestHeaders) -> dict[str, Any]:
+    base_url = None
+    try:
+        checkout_request_id = arguments.get("checkout_request_id")
+        if not checkout_request_id:
+            raise ValueError("Missing required field: 'checkout_request_id'")
+        checkout_request_id = str(checkout_request_id)
+
+        creds = request.require_credentials()
+        base_url = creds.base_url
+
+        # A final outcome already delivered by the Daraja callback needs no query
+        record = payment_store.get(checkout_request_id, creds.tenant_key)
+        if record is not None and record.status != STATUS_PENDING:
+            return {
+                "status": "success",
+                "checkout_request_id": checkout_request_id,
+                "merchant_request_id": record.merchant_request_id,
+                "payment_status": record.status,
+                "result_code": record.result_code,
+                "result_desc": record.result_desc,
+            }
+
+        # Keyed by the credential fingerprint: a cached answer is only shared with its own tenant
+        key = (creds.tenant_key, checkout_request_id)
+        result = _query_cache.get(key)
+        if result is None:
+            # Identical concurrent queries share one upstream call
+            result = await _query_flight.do(key, lambda: _query_and_cache(key, creds, checkout_request_id))
+
+        return result
+
+    except ValueError as ve:
+        logger.warning("Validation error: %s", ve)
+        return {"status": "error", "message": f"Invalid input: {ve}"}
+
+    except RateLimitExceeded as e:
+        logger.warning("STK query rejected by rate limiter: %s", e)
+        return rate_limited_result(e)
+
+    except CircuitOpenError as e:
+        logger.warning("STK query not sent: %s", e)
+        return circuit_open_result(e)
+
+    except httpx.HTTPStatusError as e:
+        return http_error_result(e)
+
+    except Exception as e:
+        logger.exception("Unexpected error during STK push query")
+        return request_failed_result(e, base_url)
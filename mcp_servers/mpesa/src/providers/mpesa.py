@@ -0,0 +1,26 @@
+import contextlib
+from typing import AsyncIterator
+
+from starlette.routing import Route
+
+from src.providers.registry import PaymentProvider
+from src.tools.tool import mpesa_tools
+from src.handlers.callback import MPESA_CALLBACK_PATH, mpesa_callback_endpoint, warn_if_unauthenticated
+from src.handlers.stk_push import stk_push_jobs
+
+
+@contextlib.asynccontextmanager
+async def _lifespan() -> AsyncIterator[None]:
+    warn_if_unauthenticated()
+    # Sends journaled submit_async payments, including any left over from the last run
+    async with stk_push_jobs.running():
+        yield
+
+
+# Built-in provider; always loaded and the default for bare tool names
+provider = PaymentProvider(
+    name="mpesa",
+    tools=mpesa_tools,
+    routes=[Route(MPESA_CALLBACK_PATH, endpoint=mpesa_callback_endpoint, methods=["POST"])],
+    lifespan=_lifespan,
+)
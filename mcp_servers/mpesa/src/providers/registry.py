@@ -0,0 +1,143 @@
+import re
+import json
+import logging
+import importlib
+from dataclasses import dataclass
+from typing import AsyncContextManager, Callable, Dict, List, Optional, Sequence, Tuple
+
+from mcp.types import Tool
+from starlette.routing import BaseRoute
+
+from src.tools.registry import RegisteredTool, ToolRegistry
+
+logger = logging.getLogger(__name__)
+
+# Separates the provider from the tool in a qualified name: "mpesa__stk_push"
+TOOL_PREFIX_SEPARATOR = "__"
+
+_PROVIDER_NAME = re.compile(r"^[a-z][a-z0-9-]*$")
+
+
+@dataclass(frozen=True)
+class PaymentProvider:
+    """A payment provider plugin: its tools and anything it serves next to them.
+
+    Handlers run in the gateway process, so they share its pooled HTTP
+    clients (``src.utils.http_client``), caches and metrics registry.
+    ``routes`` are mounted on the app as given (e.g. a payment callback) and
+    ``lifespan``, if set, is entered for the lifetime of the app.
+    """
+
+    name: str
+    tools: ToolRegistry
+    routes: Sequence[BaseRoute] = ()
+    lifespan: Optional[Callable[[], AsyncContextManager[None]]] = None
+
+
+def parse_provider_header(value: Optional[str]) -> List[str]:
+    """Provider names from a ``payment-provider`` header, in order of preference.
+
+    Accepts a plain name (``mpesa``), a comma-separated list, or the JSON
+    list the paylink SDK sends (``["mpesa"]``). Names are lowercased.
+    """
+    if not value or not value.strip():
+        return []
+    value = value.strip()
+    names: List[object] = []
+    if value.startswith("["):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, list):
+            names = parsed
+    if not names:
+        names = value.strip("[]").split(",")
+    return [n.strip().strip("'\"").lower() for n in names if isinstance(n, str) and n.strip().strip("'\"")]
+
+
+class ProviderError(ValueError):
+    """A tool call named a provider that is not loaded or does not own the tool."""
+
+
+def load_provider(spec: str) -> PaymentProvider:
+    """Import a provider from ``"package.module"`` or ``"package.module:attribute"``.
+
+    The attribute defaults to ``provider``.
+    """
+    module_name, _, attribute = spec.partition(":")
+    module = importlib.import_module(module_name)
+    provider = getattr(module, attribute or "provider", None)
+    if not isinstance(provider, PaymentProvider):
+        raise ValueError(f"'{spec}' is not a PaymentProvider")
+    return provider
+
+
+class ProviderRouter:
+    """Routes tool calls to providers by ``payment-provider`` header or tool-name prefix.
+
+    A qualified name (``<provider>__<tool>``) always selects its provider.
+    A bare name goes to the first loaded provider named in the header, or
+    the default provider when the header names none, so single-provider
+    clients keep working unchanged.
+    """
+
+    def __init__(self, providers: Sequence[PaymentProvider], default: str) -> None:
+        self._providers: Dict[str, PaymentProvider] = {}
+        for provider in providers:
+            if not _PROVIDER_NAME.match(provider.name) or TOOL_PREFIX_SEPARATOR in provider.name:
+                raise ValueError(f"Invalid provider name '{provider.name}'")
+            if provider.name in self._providers:
+                raise ValueError(f"Provider '{provider.name}' is already loaded")
+            self._providers[provider.name] = provider
+        if default not in self._providers:
+            raise ValueError(f"Default provider '{default}' is not loaded")
+        self.default = default
+        # What clients see without a payment-provider header when several providers are loaded
+        self._qualified_tools = [
+            tool.model_copy(update={"name": f"{provider.name}{TOOL_PREFIX_SEPARATOR}{tool.name}"})
+            for provider in self._providers.values()
+            for tool in provider.tools.tools()
+        ]
+
+    @property
+    def providers(self) -> List[PaymentProvider]:
+        return list(self._providers.values())
+
+    def names(self) -> frozenset[str]:
+        return frozenset(self._providers)
+
+    def _requested(self, header_provider: Optional[str]) -> List[str]:
+        """Loaded providers named by the header; unknown names are ignored."""
+        names = parse_provider_header(header_provider)
+        loaded = [name for name in names if name in self._providers]
+        if names and not loaded:
+            logger.debug("payment-provider header %r names no loaded provider; using '%s'", header_provider, self.default)
+        return loaded
+
+    def resolve(self, tool_name: str, header_provider: Optional[str] = None) -> Tuple[str, Optional[RegisteredTool]]:
+        """Return the provider name and its tool for ``tool_name`` (``None`` if it has no such tool)."""
+        requested = self._requested(header_provider)
+        prefix, separator, bare_name = tool_name.partition(TOOL_PREFIX_SEPARATOR)
+        if separator and prefix in self._providers:
+            if requested and prefix not in requested:
+                raise ProviderError(
+                    f"Tool '{tool_name}' belongs to provider '{prefix}' but the payment-provider header selects "
+                    f"{', '.join(repr(name) for name in requested)}"
+                )
+            return prefix, self._providers[prefix].tools.get(bare_name)
+
+        provider = self._providers[requested[0] if requested else self.default]
+        return provider.name, provider.tools.get(tool_name)
+
+    def list_tools(self, header_provider: Optional[str] = None) -> List[Tool]:
+        """Tools to advertise: one provider's bare names, or every tool qualified by provider.
+
+        Never raises: a header naming no loaded provider is treated as absent.
+        """
+        requested = self._requested(header_provider)
+        if requested:
+            return self._providers[requested[0]].tools.tools()
+        if len(self._providers) == 1:
+            return self._providers[self.default].tools.tools()
+        return list(self._qualified_tools)
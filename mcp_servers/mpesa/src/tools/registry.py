@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from mcp.types import Tool
+
+from src.tools.validation import Validator, compile_schema
+from src.utils.credentials import RequestHeaders
+
+# Tool handlers take the call arguments and the parsed request headers
+ToolHandler = Callable[[Dict[str, Any], RequestHeaders], Awaitable[Any]]
+
+
+class ToolInputError(ValueError):
+    """Tool arguments do not match the tool's input schema."""
+
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class RegisteredTool:
+    tool: Tool
+    handler: ToolHandler
+    validator: Validator
+
+    def validate(self, arguments: Dict[str, Any]) -> None:
+        """Raise ``ToolInputError`` listing every field that violates the schema."""
+        errors: List[str] = []
+        self.validator(arguments, "", errors)
+        if errors:
+            raise ToolInputError(errors)
+
+
+class ToolRegistry:
+    """Tool definitions and their handlers, with input schemas compiled at registration."""
+
+    def __init__(self) -> None:
+        self._tools: Dict[str, RegisteredTool] = {}
+
+    def register(self, tool: Tool, handler: ToolHandler) -> None:
+        if tool.name in self._tools:
+            raise ValueError(f"Tool '{tool.name}' is already registered")
+        self._tools[tool.name] = RegisteredTool(tool, handler, compile_schema(tool.inputSchema))
+
+    def get(self, name: str) -> Optional[RegisteredTool]:
+        return self._tools.get(name)
+
+    def tools(self) -> List[Tool]:
+        return [entry.tool for entry in self._tools.values()]
+
+    def names(self) -> frozenset[str]:
+        return frozenset(self._tools)
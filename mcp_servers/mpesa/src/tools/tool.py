@@ -1,41 +1,177 @@
 from mcp.types import Tool
 
+from src.tools.registry import ToolRegistry
+from src.handlers.stk_push import stk_push_handler
+from src.handlers.stk_push_batch import (
+    MPESA_BATCH_CONCURRENCY,
+    MPESA_BATCH_MAX_CONCURRENCY,
+    MPESA_BATCH_MAX_SIZE,
+    stk_push_batch_handler,
+)
+from src.handlers.payment_status import payment_status_handler
+from src.handlers.stk_query import stk_query_handler
+from src.handlers.job_status import job_status_handler
 
-def get_mpesa_tools() -> list[Tool]:
-    return [
-        Tool(
-            name="stk_push",
-            description="Initiates M-Pesa Express (STK Push) payment on behalf of a customer. Sends a payment prompt to the customer's phone requesting them to enter their M-Pesa PIN to authorize and complete payment.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "amount": {
-                        "type": "string",
-                        "description": "Amount to be transacted (only whole numbers supported).",
-                        "pattern": "^[0-9]+$",
-                    },
-                    "phone_number": {
-                        "type": "string",
-                        "description": "Customer's M-Pesa registered phone number to receive the payment prompt (format: 2547XXXXXXXX).",
-                        "pattern": "^2547[0-9]{8}$",
-                    },
-                    "account_reference": {
-                        "type": "string",
-                        "description": "Reference identifier for the transaction (max 12 characters). This will be displayed to the customer in the payment prompt.",
-                        "maxLength": 12,
-                    },
-                    "transaction_desc": {
-                        "type": "string",
-                        "description": "Description of what the payment is for (max 13 characters).",
-                        "maxLength": 13,
+
+# Shared by `stk_push` and each item of `stk_push_batch`
+PAYMENT_PROPERTIES = {
+    "amount": {
+        "type": "string",
+        "description": "Amount to be transacted (only whole numbers supported).",
+        "pattern": "^[0-9]+$",
+    },
+    "phone_number": {
+        "type": "string",
+        "description": "Customer's M-Pesa registered phone number to receive the payment prompt (format: 2547XXXXXXXX).",
+        "pattern": "^2547[0-9]{8}$",
+    },
+    "account_reference": {
+        "type": "string",
+        "description": "Reference identifier for the transaction (max 12 characters). This will be displayed to the customer in the payment prompt.",
+        "maxLength": 12,
+    },
+    "transaction_desc": {
+        "type": "string",
+        "description": "Description of what the payment is for (max 13 characters).",
+        "maxLength": 13,
+    },
+}
+
+IDEMPOTENCY_KEY_PROPERTY = {
+    "type": "string",
+    "description": "Optional unique key for this payment. Retrying with the same key returns the original result instead of sending a second prompt; reusing it for a different payment is rejected. Without a key, an identical payment (same phone, amount and reference) sent again within a short window is treated as a retry.",
+    "maxLength": 128,
+}
+
+SUBMIT_ASYNC_PROPERTY = {
+    "type": "boolean",
+    "description": "Queue the payment and return a job_id at once instead of waiting for M-Pesa to accept the prompt. Check the outcome with get_job_status. Only available when the server has a job journal configured.",
+}
+
+PAYMENT_REQUIRED = [
+    "amount",
+    "phone_number",
+    "account_reference",
+    "transaction_desc",
+]
+
+
+# Every M-Pesa tool, with its handler; adding a tool is one register() call
+mpesa_tools = ToolRegistry()
+
+mpesa_tools.register(
+    Tool(
+        name="stk_push",
+        description="Initiates M-Pesa Express (STK Push) payment on behalf of a customer. Sends a payment prompt to the customer's phone requesting them to enter their M-Pesa PIN to authorize and complete payment.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                **PAYMENT_PROPERTIES,
+                "idempotency_key": IDEMPOTENCY_KEY_PROPERTY,
+                "submit_async": SUBMIT_ASYNC_PROPERTY,
+            },
+            "required": PAYMENT_REQUIRED,
+        },
+    ),
+    stk_push_handler,
+)
+
+mpesa_tools.register(
+    Tool(
+        name="stk_push_batch",
+        description="Initiates several M-Pesa Express (STK Push) payments in one call, e.g. for group bills or event tickets. All payments are validated before any prompt is sent; prompts are then sent in parallel. Returns one result per payment, in input order, with an overall status of 'success', 'partial' or 'error'.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "payments": {
+                    "type": "array",
+                    "description": f"Payments to initiate (max {MPESA_BATCH_MAX_SIZE}).",
+                    "minItems": 1,
+                    "maxItems": MPESA_BATCH_MAX_SIZE,
+                    "items": {
+                        "type": "object",
+                        "properties": {**PAYMENT_PROPERTIES, "idempotency_key": IDEMPOTENCY_KEY_PROPERTY},
+                        "required": PAYMENT_REQUIRED,
                     },
                 },
-                "required": [
-                    "amount",
-                    "phone_number",
-                    "account_reference",
-                    "transaction_desc",
-                ],
+                "max_concurrency": {
+                    "type": "integer",
+                    "description": f"Maximum number of payment prompts sent at the same time (default {MPESA_BATCH_CONCURRENCY}, max {MPESA_BATCH_MAX_CONCURRENCY}).",
+                    "minimum": 1,
+                    "maximum": MPESA_BATCH_MAX_CONCURRENCY,
+                },
             },
-        )
-    ]
+            "required": ["payments"],
+        },
+    ),
+    stk_push_batch_handler,
+)
+
+mpesa_tools.register(
+    Tool(
+        name="get_payment_status",
+        description="Returns the latest known outcome of an M-Pesa Express (STK Push) payment started by this server, as reported by the M-Pesa callback. Look up by checkout_request_id (preferred), merchant_request_id, phone_number or account_reference; phone and reference return the most recent matching payment. payment_status is one of 'pending', 'completed', 'cancelled' or 'failed'. Only payments started with the same M-Pesa credentials are returned. Does not contact M-Pesa.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "checkout_request_id": {
+                    "type": "string",
+                    "description": "CheckoutRequestID returned by stk_push.",
+                },
+                "merchant_request_id": {
+                    "type": "string",
+                    "description": "MerchantRequestID returned by stk_push.",
+                },
+                "phone_number": {
+                    "type": "string",
+                    "description": "Customer phone number used for the payment (format: 2547XXXXXXXX).",
+                },
+                "account_reference": {
+                    "type": "string",
+                    "description": "Account reference used for the payment.",
+                },
+            },
+        },
+    ),
+    payment_status_handler,
+)
+
+mpesa_tools.register(
+    Tool(
+        name="stk_query",
+        description="Checks with M-Pesa whether an M-Pesa Express (STK Push) payment has been completed, cancelled or failed. Use the checkout_request_id returned by stk_push. payment_status is 'pending' while the customer has not yet responded to the prompt; repeated queries for the same payment are answered from a short-lived cache.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "checkout_request_id": {
+                    "type": "string",
+                    "description": "CheckoutRequestID returned by stk_push.",
+                },
+            },
+            "required": ["checkout_request_id"],
+        },
+    ),
+    stk_query_handler,
+)
+
+mpesa_tools.register(
+    Tool(
+        name="get_job_status",
+        description="Returns the state of a payment queued with stk_push submit_async: 'queued', 'running' or 'sending' while the prompt is on its way, 'done' with the stk_push result (including checkout_request_id on success) once M-Pesa has answered, or 'unknown' if the server stopped while sending it. Use get_payment_status or stk_query with the checkout_request_id to follow the payment itself.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "job_id returned by stk_push with submit_async.",
+                },
+            },
+            "required": ["job_id"],
+        },
+    ),
+    job_status_handler,
+)
+
+
+def get_mpesa_tools() -> list[Tool]:
+    return mpesa_tools.tools()
@@ -0,0 +1,162 @@
+import re
+from typing import Any, Callable, Dict, List
+
+# Validator: (value, path, errors) -> None, appending "path: problem" messages
+Validator = Callable[[Any, str, List[str]], None]
+
+# Keywords that only document the schema
+_ANNOTATIONS = frozenset({"description", "title", "examples", "default", "$schema"})
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def _ecma_pattern(pattern: str) -> "re.Pattern[str]":
+    """Compile a JSON Schema ``pattern`` with ECMA-262 anchoring.
+
+    In ECMA ``$`` matches only at the end of the input, while Python's also
+    matches before a trailing newline, so ``"254712345678\\n"`` would pass
+    ``^2547[0-9]{8}$``. Unescaped ``$`` outside character classes becomes
+    ``\\Z``; the match stays unanchored otherwise, as JSON Schema requires.
+    """
+    out: List[str] = []
+    in_class = escaped = False
+    for ch in pattern:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "$":
+            ch = r"\Z"
+        out.append(ch)
+    return re.compile("".join(out))
+
+
+def _field(path: str, name: str) -> str:
+    return f"{path}.{name}" if path else name
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """Compile the JSON Schema subset used by tool ``inputSchema``s into a validator.
+
+    Checks are built once (patterns compiled, properties resolved) so each call
+    only runs plain Python comparisons. Unsupported keywords raise
+    ``ValueError`` at compile time rather than being silently ignored.
+    """
+    checks: List[Validator] = []
+    unsupported = set(schema) - _ANNOTATIONS - {
+        "type", "properties", "required", "additionalProperties", "items",
+        "pattern", "minLength", "maxLength", "minimum", "maximum",
+        "minItems", "maxItems", "enum",
+    }
+    if unsupported:
+        raise ValueError(f"Unsupported schema keywords: {', '.join(sorted(unsupported))}")
+
+    schema_type = schema.get("type")
+    if schema_type is not None and schema_type not in _TYPE_CHECKS:
+        raise ValueError(f"Unsupported schema type: {schema_type!r}")
+    if schema_type is not None:
+        type_check = _TYPE_CHECKS[schema_type]
+
+        def check_type(value: Any, path: str, errors: List[str]) -> bool:
+            if type_check(value):
+                return True
+            errors.append(f"{path or 'arguments'}: expected {schema_type}, got {type(value).__name__}")
+            return False
+    else:
+        def check_type(value: Any, path: str, errors: List[str]) -> bool:
+            return True
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value: Any, path: str, errors: List[str]) -> None:
+            if value not in allowed:
+                errors.append(f"{path}: must be one of {allowed}")
+
+        checks.append(check_enum)
+
+    if schema_type == "string":
+        if "pattern" in schema:
+            pattern = _ecma_pattern(schema["pattern"])
+            raw = schema["pattern"]
+
+            def check_pattern(value: str, path: str, errors: List[str]) -> None:
+                if pattern.search(value) is None:
+                    errors.append(f"{path}: does not match pattern {raw}")
+
+            checks.append(check_pattern)
+        min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+        if min_length is not None or max_length is not None:
+
+            def check_length(value: str, path: str, errors: List[str]) -> None:
+                if min_length is not None and len(value) < min_length:
+                    errors.append(f"{path}: must be at least {min_length} characters")
+                if max_length is not None and len(value) > max_length:
+                    errors.append(f"{path}: must be at most {max_length} characters (got {len(value)})")
+
+            checks.append(check_length)
+
+    if schema_type in ("integer", "number"):
+        minimum, maximum = schema.get("minimum"), schema.get("maximum")
+        if minimum is not None or maximum is not None:
+
+            def check_range(value: float, path: str, errors: List[str]) -> None:
+                if minimum is not None and value < minimum:
+                    errors.append(f"{path}: must be >= {minimum}")
+                if maximum is not None and value > maximum:
+                    errors.append(f"{path}: must be <= {maximum}")
+
+            checks.append(check_range)
+
+    if schema_type == "array":
+        min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+        item_validator = compile_schema(schema["items"]) if "items" in schema else None
+
+        def check_array(value: list, path: str, errors: List[str]) -> None:
+            if min_items is not None and len(value) < min_items:
+                errors.append(f"{path}: must contain at least {min_items} item(s)")
+            if max_items is not None and len(value) > max_items:
+                errors.append(f"{path}: must contain at most {max_items} items (got {len(value)})")
+            if item_validator is not None:
+                for i, item in enumerate(value):
+                    item_validator(item, f"{path}[{i}]", errors)
+
+        checks.append(check_array)
+
+    if schema_type == "object":
+        properties = {name: compile_schema(sub) for name, sub in schema.get("properties", {}).items()}
+        required = tuple(schema.get("required", ()))
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value: dict, path: str, errors: List[str]) -> None:
+            for name in required:
+                if name not in value:
+                    errors.append(f"{_field(path, name)}: required field is missing")
+            for name, item in value.items():
+                validator = properties.get(name)
+                if validator is not None:
+                    validator(item, _field(path, name), errors)
+                elif closed:
+                    errors.append(f"{_field(path, name)}: unexpected field")
+
+        checks.append(check_object)
+
+    def validate(value: Any, path: str, errors: List[str]) -> None:
+        if not check_type(value, path, errors):
+            return
+        for check in checks:
+            check(value, path, errors)
+
+    return validate
@@ -0,0 +1,231 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+import contextlib
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from src.utils.credentials import RequestHeaders
+
+logger = logging.getLogger(__name__)
+
+# Tool calls running at once across all tenants; 0 disables admission control
+MPESA_MAX_CONCURRENT_CALLS = int(os.getenv("MPESA_MAX_CONCURRENT_CALLS", "100"))
+# Calls allowed to wait for a slot; beyond this the busiest tenant's newest call is shed
+MPESA_ADMISSION_MAX_QUEUE = int(os.getenv("MPESA_ADMISSION_MAX_QUEUE", "1000"))
+# Longest a call may wait for a slot before it is shed
+MPESA_ADMISSION_MAX_WAIT = float(os.getenv("MPESA_ADMISSION_MAX_WAIT", "5"))
+# Calls admitted per scheduling turn, by tenant; others get 1, e.g. "174379=4,600000=2"
+MPESA_TENANT_WEIGHTS = os.getenv("MPESA_TENANT_WEIGHTS", "")
+
+# Weight of the service-time sample in the moving average used for Retry-After
+_SERVICE_TIME_ALPHA = 0.1
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """Parse ``"tenant=weight,..."`` into a mapping of positive integer weights."""
+    weights: Dict[str, int] = {}
+    for item in spec.split(","):
+        name, sep, weight = item.strip().partition("=")
+        if not sep or not name:
+            continue
+        try:
+            weights[name.strip()] = max(1, int(weight))
+        except ValueError:
+            continue
+    return weights
+
+
+def tenant_for(request: RequestHeaders) -> str:
+    """Scheduling key: the business shortcode, else a digest of the Paylink API key."""
+    if request.business_short_code:
+        return request.business_short_code
+    api_key = request.headers.get("paylink-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return "anonymous"
+
+
+class Overloaded(Exception):
+    """Raised when a tool call is shed instead of waiting for a slot."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def overloaded_result(e: Overloaded) -> Dict[str, Any]:
+    """Tool result for a call shed by admission control."""
+    return {
+        "status": "error",
+        "message": f"{e}. Try again shortly.",
+        "retryable": True,
+        "retry_after": e.retry_after,
+    }
+
+
+class AdmissionController:
+    """Caps in-flight tool calls and hands free slots to tenants in weighted round-robin.
+
+    While slots are free, calls start at once. Otherwise each tenant waits
+    in its own FIFO queue. A released slot goes to the tenant whose turn
+    it is. Each tenant gets up to its weight in slots per turn, so a tenant
+    with a bulk run cannot starve the others. When the shared queue is
+    full, the newest call of the tenant with the most queued calls is shed.
+    That is usually the noisy tenant, not the one arriving. Shed calls fail
+    fast with a ``retry_after`` estimated from the queue length and recent
+    call durations.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MPESA_MAX_CONCURRENT_CALLS,
+        max_queue: int = MPESA_ADMISSION_MAX_QUEUE,
+        max_wait: float = MPESA_ADMISSION_MAX_WAIT,
+        weights: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.weights = weights or {}
+        self.in_flight = 0
+        self.queued = 0
+        # Tenants with waiting calls, in round-robin order; the first one has the turn
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._credit: Dict[str, int] = {}
+        self._service_time = 0.1
+        # Stats
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, at least 1."""
+        backlog = (self.queued + 1) * self._service_time / max(1, self.max_in_flight)
+        return max(1, math.ceil(backlog))
+
+    def _weight(self, tenant: str) -> int:
+        return self.weights.get(tenant, 1)
+
+    def _shed_busiest(self, tenant: str) -> bool:
+        """Make room by shedding the busiest other tenant's newest call; False if ``tenant`` is the busiest."""
+        busiest = max(self._queues, key=lambda t: len(self._queues[t]))
+        own = len(self._queues.get(tenant, ()))
+        if busiest == tenant or len(self._queues[busiest]) <= own:
+            return False
+        waiter = self._queues[busiest].pop()
+        self._discard_if_empty(busiest)
+        self.queued -= 1
+        waiter.set_exception(Overloaded("Server is busy; request was shed for fairness", self.retry_after()))
+        return True
+
+    def _discard_if_empty(self, tenant: str) -> None:
+        if not self._queues[tenant]:
+            del self._queues[tenant]
+            self._credit.pop(tenant, None)
+
+    def _remove(self, tenant: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            self._discard_if_empty(tenant)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_in_flight and self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            credit = self._credit.get(tenant, self._weight(tenant)) - 1
+            if not queue:
+                self._discard_if_empty(tenant)
+            elif credit <= 0:
+                # Turn over: to the back of the line with a fresh allowance
+                self._queues.move_to_end(tenant)
+                self._credit[tenant] = self._weight(tenant)
+            else:
+                self._credit[tenant] = credit
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, tenant: str) -> None:
+        """Wait for a slot in ``tenant``'s turn.
+
+        Raises:
+            Overloaded: If the queue is full or no slot came free within ``max_wait``
+        """
+        if self.in_flight < self.max_in_flight and not self._queues:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if self.queued >= self.max_queue and not (self._queues and self._shed_busiest(tenant)):
+            self.shed += 1
+            raise Overloaded("Server is busy", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        self.queued += 1
+        self.waited += 1
+        try:
+            # Not wait_for: before 3.12 it swallows a cancel that lands after the slot was granted
+            async with asyncio.timeout(self.max_wait):
+                await asyncio.shield(waiter)
+        except TimeoutError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.admitted += 1
+                return  # granted as the wait ran out
+            self._remove(tenant, waiter)
+            self.shed += 1
+            raise Overloaded(f"Server is busy; no slot within {self.max_wait:g}s", self.retry_after())
+        except Overloaded:
+            self.shed += 1
+            raise
+        except asyncio.CancelledError:
+            # The caller went away: give back a slot granted meanwhile, or leave the queue
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(0.0)
+            else:
+                self._remove(tenant, waiter)
+            raise
+        self.admitted += 1
+
+    def release(self, elapsed: float) -> None:
+        """Free a slot taken by :meth:`acquire` after a call that ran ``elapsed`` seconds."""
+        self.in_flight -= 1
+        self._service_time += _SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant: str) -> AsyncIterator[None]:
+        """Hold a slot for the body; a no-op when admission control is disabled."""
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(tenant)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "tenants_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "shed": self.shed,
+        }
+
+
+# Process-wide; shared by every tool call
+admission = AdmissionController(weights=parse_weights(MPESA_TENANT_WEIGHTS))
@@ -1,38 +1,93 @@
 import os
+import time
+import asyncio
+import hashlib
 import logging
 import base64
+import random
 import httpx
-from contextvars import ContextVar
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Dict, Any
 
-from dotenv import load_dotenv
+from src.utils.daraja import daraja_request
+from src.utils.metrics import TOKEN_CACHE_HIT, TOKEN_CACHE_MISS, TOKEN_CACHE_SHARED_HIT
+from src.utils.token_store import SqliteTokenStore, get_token_store, store_key
+
+if TYPE_CHECKING:
+    from src.utils.credentials import MpesaCredentials
 
 logger = logging.getLogger(__name__)
 
-# Load environment variables from .env if present
-load_dotenv()
+# Tokens are treated as expired this many seconds before Daraja says they are
+TOKEN_EXPIRY_SKEW_SECONDS = 60
+# Poll interval while another worker process refreshes a shared token
+SHARED_TOKEN_POLL_SECONDS = 0.05
+
+# Tenants whose tokens are cached, and kept fresh in the background, per process (LRU)
+MPESA_TOKEN_CACHE_SIZE = int(os.getenv("MPESA_TOKEN_CACHE_SIZE", "1024"))
+
+# Background refresh point as a fraction of a token's lifetime (0 disables the refresher)
+MPESA_TOKEN_REFRESH_FRACTION = float(os.getenv("MPESA_TOKEN_REFRESH_FRACTION", "0.8"))
+# Random spread around the refresh point, as a fraction of the lifetime
+MPESA_TOKEN_REFRESH_JITTER = float(os.getenv("MPESA_TOKEN_REFRESH_JITTER", "0.05"))
+# Tenants without token lookups for this many seconds are no longer refreshed
+MPESA_TOKEN_IDLE_TTL = float(os.getenv("MPESA_TOKEN_IDLE_TTL", "1800"))
+# Seconds before retrying a failed background refresh
+MPESA_TOKEN_REFRESH_RETRY = float(os.getenv("MPESA_TOKEN_REFRESH_RETRY", "15"))
+
+# (base_url, consumer_key, sha256(consumer_secret))
+TokenCacheKey = tuple[str, str, str]
+
+
+@dataclass(slots=True)
+class _CachedToken:
+    access_token: str
+    expires_at: float  # time.monotonic() deadline, skew already applied
+    refresh_at: float  # when the background refresher renews it
+
 
-# Context variables for request-scoped data
-mpesa_access_token_context: ContextVar[str] = ContextVar("mpesa_access_token")
-mpesa_token_expiry_context: ContextVar[datetime] = ContextVar("mpesa_token_expiry")
+@dataclass(slots=True)
+class _Tenant:
+    basic_auth: str
+    base_url: str
+    last_used: float
 
 
-def _create_basic_auth_header(consumer_key: str, consumer_secret: str) -> str:
+@dataclass(slots=True)
+class _Refresh:
+    lock: asyncio.Lock
+    users: int = 0  # callers holding or waiting for the lock
+
+
+# Process-wide token cache shared by every request and tenant (LRU)
+_token_cache: "OrderedDict[TokenCacheKey, _CachedToken]" = OrderedDict()
+# One lock per tenant so concurrent misses trigger a single upstream refresh; dropped when unused
+_refresh_locks: Dict[TokenCacheKey, _Refresh] = {}
+# Tenants the background refresher keeps warm (only tracked while it runs; LRU)
+_active_tenants: "OrderedDict[TokenCacheKey, _Tenant]" = OrderedDict()
+
+
+def create_basic_auth_header(consumer_key: str, consumer_secret: str) -> str:
     """Create Basic Auth header for M-Pesa API authentication."""
     credentials = f"{consumer_key}:{consumer_secret}"
     encoded_credentials = base64.b64encode(credentials.encode()).decode()
     return f"Basic {encoded_credentials}"
 
 
-def _is_token_expired() -> bool:
-    """Check if the current access token has expired."""
-    try:
-        expiry = mpesa_token_expiry_context.get()
-        # Add 60 seconds buffer to avoid edge cases
-        return datetime.now() >= (expiry - timedelta(seconds=60))
-    except LookupError:
-        return True
+def token_cache_key(consumer_key: str, consumer_secret: str, base_url: str) -> TokenCacheKey:
+    """Build the tenant cache key; the secret is only kept as a digest."""
+    secret_digest = hashlib.sha256(consumer_secret.encode()).hexdigest()
+    return (base_url.rstrip("/"), consumer_key, secret_digest)
+
+
+def _get_valid_token(key: TokenCacheKey) -> Optional[_CachedToken]:
+    """Return the cached token for a tenant if it has not (nearly) expired."""
+    cached = _token_cache.get(key)
+    if cached is None or time.monotonic() >= cached.expires_at:
+        return None
+    _token_cache.move_to_end(key)
+    return cached
 
 
 async def get_mpesa_access_token(
@@ -41,6 +96,10 @@ async def get_mpesa_access_token(
     """
     Get a valid M-Pesa access token, refreshing if necessary.
 
+    Tokens are cached for the whole process per tenant, i.e. per
+    (base_url, consumer_key, secret digest). Concurrent misses for the same
+    tenant share a single refresh request.
+
     Args:
         consumer_key: M-Pesa consumer key
         consumer_secret: M-Pesa consumer secret
@@ -52,20 +111,127 @@ async def get_mpesa_access_token(
 
     Raises:
         RuntimeError: If unable to obtain credentials or token
-        requests.RequestException: If the API request fails
+        CircuitOpenError: If the OAuth endpoint's circuit breaker is open
     """
-    # Check if we have a valid token in context
+    key = token_cache_key(consumer_key, consumer_secret, base_url)
+    basic_auth = create_basic_auth_header(consumer_key, consumer_secret)
+    if token_refresher.running:
+        _touch_tenant(key, basic_auth, base_url)
+    return await _get_access_token(key, basic_auth, base_url, force_refresh)
+
+
+async def get_access_token(credentials: "MpesaCredentials", force_refresh: bool = False) -> str:
+    """Same as :func:`get_mpesa_access_token`, using the tenant's precomputed
+    cache key and Basic auth header."""
+    if token_refresher.running:
+        _touch_tenant(credentials.token_cache_key, credentials.basic_auth, credentials.base_url)
+    return await _get_access_token(
+        credentials.token_cache_key, credentials.basic_auth, credentials.base_url, force_refresh
+    )
+
+
+async def _get_access_token(
+    key: TokenCacheKey, basic_auth: str, base_url: str, force_refresh: bool
+) -> str:
+    # Fast path: valid token already cached for this tenant
+    stale = _token_cache.get(key)
     if not force_refresh:
-        try:
-            if not _is_token_expired():
-                return mpesa_access_token_context.get()
-        except LookupError:
-            pass
+        cached = _get_valid_token(key)
+        if cached is not None:
+            TOKEN_CACHE_HIT.inc()
+            return cached.access_token
+
+    refresh = _refresh_locks.get(key)
+    if refresh is None:
+        refresh = _refresh_locks[key] = _Refresh(asyncio.Lock())
+    refresh.users += 1
+    try:
+        async with refresh.lock:
+            # Another caller may have refreshed while we were waiting for the lock
+            cached = _get_valid_token(key)
+            if cached is not None and (not force_refresh or cached is not stale):
+                TOKEN_CACHE_HIT.inc()
+                return cached.access_token
+
+            store = get_token_store()
+            if store is not None:
+                reject = stale.access_token if force_refresh and stale is not None else None
+                return await _get_shared_access_token(store, key, basic_auth, base_url, reject)
+
+            TOKEN_CACHE_MISS.inc()
+            access_token, _ = await _request_access_token(key, basic_auth, base_url)
+            return access_token
+    finally:
+        refresh.users -= 1
+        if not refresh.users:
+            del _refresh_locks[key]
+
+
+def _touch_tenant(key: TokenCacheKey, basic_auth: str, base_url: str) -> None:
+    """Mark a tenant as active so its token is refreshed in the background."""
+    tenant = _active_tenants.get(key)
+    if tenant is None:
+        _active_tenants[key] = _Tenant(basic_auth, base_url, time.monotonic())
+        if len(_active_tenants) > MPESA_TOKEN_CACHE_SIZE:
+            _active_tenants.popitem(last=False)
+    else:
+        tenant.last_used = time.monotonic()
+        _active_tenants.move_to_end(key)
+
 
+def _cache_token(key: TokenCacheKey, access_token: str, expires_in: float) -> None:
+    now = time.monotonic()
+    expires_at = now + expires_in
+    # Jittered so tenants fetched together do not all refresh together
+    fraction = MPESA_TOKEN_REFRESH_FRACTION + random.uniform(-MPESA_TOKEN_REFRESH_JITTER, MPESA_TOKEN_REFRESH_JITTER)
+    _token_cache[key] = _CachedToken(
+        access_token=access_token,
+        expires_at=expires_at,
+        refresh_at=min(expires_at, now + max(0.0, expires_in * fraction)),
+    )
+    _token_cache.move_to_end(key)
+    if len(_token_cache) > MPESA_TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+
+
+async def _get_shared_access_token(
+    store: SqliteTokenStore, key: TokenCacheKey, basic_auth: str, base_url: str, reject: Optional[str]
+) -> str:
+    """Take the token from the cross-process store, or refresh it if this
+    process wins the lease; otherwise wait for the worker that did."""
+    shared_key = store_key(key)
+    while True:
+        entry, leased = await asyncio.to_thread(store.acquire, shared_key, reject)
+        if entry is not None:
+            access_token, expires_at = entry
+            TOKEN_CACHE_SHARED_HIT.inc()
+            _cache_token(key, access_token, expires_at - time.time())
+            return access_token
+
+        if leased:
+            TOKEN_CACHE_MISS.inc()
+            try:
+                access_token, expires_in = await _request_access_token(key, basic_auth, base_url)
+            except BaseException:
+                # Sync on purpose: this may run while the task is being cancelled
+                store.release(shared_key)
+                raise
+            await asyncio.to_thread(store.put, shared_key, access_token, time.time() + expires_in)
+            return access_token
+
+        await asyncio.sleep(SHARED_TOKEN_POLL_SECONDS)
+
+
+async def _request_access_token(key: TokenCacheKey, basic_auth: str, base_url: str) -> tuple[str, float]:
+    """Fetch a new token from the OAuth endpoint and store it in the cache.
+
+    Returns:
+        The token and the seconds it stays cached (skew already applied)
+    """
     # Prepare the request
     url = f"{base_url}/oauth/v1/generate"
     headers = {
-        "Authorization": _create_basic_auth_header(consumer_key, consumer_secret),
+        "Authorization": basic_auth,
         "Content-Type": "application/json",
     }
     params = {"grant_type": "client_credentials"}
@@ -73,9 +239,9 @@ async def get_mpesa_access_token(
     logger.info("Requesting new M-Pesa access token")
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
+        # Token fetches are side-effect free, so timeouts and 5xx are retried too
+        response = await daraja_request("GET", base_url, url, retry_safe=True, headers=headers, params=params)
+        response.raise_for_status()
 
         token_data: Dict[str, Any] = response.json()
 
@@ -85,16 +251,13 @@ async def get_mpesa_access_token(
         access_token = token_data["access_token"]
         expires_in = int(token_data.get("expires_in", 3600))
 
-        # Calculate expiry time
-        expiry_time = datetime.now() + timedelta(seconds=expires_in)
-
-        # Store in context variables
-        mpesa_access_token_context.set(access_token)
-        mpesa_token_expiry_context.set(expiry_time)
+        # Cache until shortly before Daraja expires the token
+        cache_for = expires_in - TOKEN_EXPIRY_SKEW_SECONDS
+        _cache_token(key, access_token, cache_for)
 
         logger.info(f"M-Pesa access token obtained, expires in {expires_in} seconds")
 
-        return access_token
+        return access_token, cache_for
 
     except httpx.RequestError as e:
         logger.error(f"Failed to obtain M-Pesa access token: {e}")
@@ -107,5 +270,90 @@ async def get_mpesa_access_token(
         raise RuntimeError(f"Invalid response format from M-Pesa OAuth endpoint: {e}")
 
 
+class TokenRefresher:
+    """Background task that renews active tenants' tokens before they expire.
+
+    Every tenant looked up while the refresher runs is tracked; its token is
+    re-fetched once past its (jittered) refresh point, so requests keep
+    hitting the cache. Tenants idle longer than ``idle_ttl`` are dropped from
+    the schedule and fall back to fetching on demand.
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = MPESA_TOKEN_IDLE_TTL,
+        retry_delay: float = MPESA_TOKEN_REFRESH_RETRY,
+        max_sleep: float = 5.0,
+    ) -> None:
+        self.idle_ttl = idle_ttl
+        self.retry_delay = retry_delay
+        self.max_sleep = max_sleep
+        self.refreshed = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is None and MPESA_TOKEN_REFRESH_FRACTION > 0:
+            self._task = asyncio.create_task(self._run(), name="mpesa-token-refresher")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        _active_tenants.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(await self.refresh_due())
+
+    async def refresh_due(self) -> float:
+        """Refresh every due tenant; return seconds until the next one is due."""
+        now = time.monotonic()
+        next_due = now + self.max_sleep
+        due = []
+        for key, tenant in list(_active_tenants.items()):
+            if now - tenant.last_used > self.idle_ttl:
+                del _active_tenants[key]
+                continue
+            cached = _token_cache.get(key)
+            if cached is None:
+                # Never fetched (or failed); the request path fetches it
+                continue
+            if cached.refresh_at <= now:
+                due.append((key, tenant))
+            else:
+                next_due = min(next_due, cached.refresh_at)
+
+        if due:
+            await asyncio.gather(*(self._refresh(key, tenant) for key, tenant in due))
+        return max(0.0, next_due - time.monotonic())
+
+    async def _refresh(self, key: TokenCacheKey, tenant: _Tenant) -> None:
+        try:
+            await _get_access_token(key, tenant.basic_auth, tenant.base_url, force_refresh=True)
+            self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Background token refresh for %s failed: %s", tenant.base_url, e)
+            cached = _token_cache.get(key)
+            if cached is not None:
+                cached.refresh_at = time.monotonic() + self.retry_delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tenants": len(_active_tenants), "refreshed": self.refreshed, "failed": self.failed}
+
+
+# Started and stopped by the server lifespan
+token_refresher = TokenRefresher()
+
+
 if __name__ == "__main__":
     print(get_mpesa_access_token())
@@ -0,0 +1,173 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from src.utils.auth import TokenCacheKey, create_basic_auth_header, token_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Distinct tenant credential sets kept pre-parsed in memory
+MPESA_CREDENTIALS_CACHE_SIZE = int(os.getenv("MPESA_CREDENTIALS_CACHE_SIZE", "1024"))
+
+# Normalized header name -> position in the credential tuple
+_CREDENTIAL_HEADERS: dict[bytes, int] = {
+    b"mpesa-base-url": 0,
+    b"mpesa-business-shortcode": 1,
+    b"mpesa-passkey": 2,
+    b"mpesa-callback-url": 3,
+    b"mpesa-consumer-key": 4,
+    b"mpesa-consumer-secret": 5,
+}
+_SHORTCODE_INDEX = 1
+
+MISSING_CREDENTIALS_MESSAGE = "Missing one or more M-Pesa credentials in request headers."
+
+
+@dataclass(frozen=True, slots=True)
+class MpesaCredentials:
+    """Validated tenant credentials with derived values computed once."""
+
+    base_url: str
+    business_short_code: str
+    passkey: str
+    callback_url: str
+    consumer_key: str
+    consumer_secret: str
+    basic_auth: str
+    token_cache_key: TokenCacheKey
+    # Owner of payments, jobs and cached results made with these credentials
+    tenant_key: str
+
+    def values(self) -> tuple[str, ...]:
+        """Header values in ``credentials_from_values`` order, for rebuilding these credentials later."""
+        return (
+            self.base_url,
+            self.business_short_code,
+            self.passkey,
+            self.callback_url,
+            self.consumer_key,
+            self.consumer_secret,
+        )
+
+    def __repr__(self) -> str:
+        # Never render secrets
+        return f"MpesaCredentials(base_url={self.base_url!r}, business_short_code={self.business_short_code!r})"
+
+
+def _validate_base_url(base_url: str) -> str:
+    parts = urlsplit(base_url.strip())
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ValueError("Invalid 'mpesa-base-url' header: expected an http(s) URL")
+    return base_url.strip().rstrip("/")
+
+
+def _tenant_key(cache_key: TokenCacheKey, business_short_code: str) -> str:
+    """Fingerprint of the Daraja app and shortcode; a shortcode header alone proves nothing."""
+    return hashlib.blake2b("\0".join((*cache_key, business_short_code)).encode(), digest_size=16).hexdigest()
+
+
+def _build_credentials(values: tuple[bytes, ...]) -> MpesaCredentials:
+    base_url, shortcode, passkey, callback_url, consumer_key, consumer_secret = (v.decode() for v in values)
+    base_url = _validate_base_url(base_url)
+    cache_key = token_cache_key(consumer_key, consumer_secret, base_url)
+    return MpesaCredentials(
+        base_url=base_url,
+        business_short_code=shortcode,
+        passkey=passkey,
+        callback_url=callback_url,
+        consumer_key=consumer_key,
+        consumer_secret=consumer_secret,
+        basic_auth=create_basic_auth_header(consumer_key, consumer_secret),
+        token_cache_key=cache_key,
+        tenant_key=_tenant_key(cache_key, shortcode),
+    )
+
+
+# Fingerprint of the raw credential header bytes -> parsed credentials (LRU)
+_credentials_cache: "OrderedDict[bytes, MpesaCredentials]" = OrderedDict()
+
+
+def credentials_from_values(values: tuple[bytes, ...]) -> MpesaCredentials:
+    """Return cached credentials for the raw header values, parsing them on first sight.
+
+    Raises:
+        ValueError: If the base URL is not a valid http(s) URL
+    """
+    fingerprint = hashlib.blake2b(b"\0".join(values), digest_size=16).digest()
+    creds = _credentials_cache.get(fingerprint)
+    if creds is not None:
+        _credentials_cache.move_to_end(fingerprint)
+        return creds
+
+    creds = _build_credentials(values)
+    _credentials_cache[fingerprint] = creds
+    if len(_credentials_cache) > MPESA_CREDENTIALS_CACHE_SIZE:
+        _credentials_cache.popitem(last=False)
+    return creds
+
+
+class RequestHeaders:
+    """Headers of one MCP request, parsed once at the ASGI edge."""
+
+    __slots__ = ("headers", "business_short_code", "_credentials", "_error")
+
+    def __init__(
+        self,
+        headers: dict[str, str],
+        business_short_code: Optional[str] = None,
+        credentials: Optional[MpesaCredentials] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        self.headers = headers
+        self.business_short_code = business_short_code
+        self._credentials = credentials
+        self._error = error
+
+    @property
+    def credentials(self) -> Optional[MpesaCredentials]:
+        return self._credentials
+
+    def require_credentials(self) -> MpesaCredentials:
+        """Return the tenant credentials or raise ``ValueError`` explaining why not."""
+        if self._credentials is None:
+            raise ValueError(self._error or MISSING_CREDENTIALS_MESSAGE)
+        return self._credentials
+
+
+def parse_request_headers(raw_headers: Iterable[tuple[bytes, bytes]]) -> RequestHeaders:
+    """Normalize ASGI headers (lowercase, '_' -> '-') and extract credentials in one pass."""
+    headers: dict[str, str] = {}
+    values: list[Optional[bytes]] = [None] * len(_CREDENTIAL_HEADERS)
+
+    for k, v in raw_headers or ():
+        name = k.strip().lower()
+        if b"_" in name:
+            name = name.replace(b"_", b"-")
+        idx = _CREDENTIAL_HEADERS.get(name)
+        if idx is not None:
+            values[idx] = v
+        headers[name.decode()] = v.decode()
+
+    shortcode_raw = values[_SHORTCODE_INDEX]
+    business_short_code = shortcode_raw.decode() if shortcode_raw else None
+
+    if not all(values):
+        logger.debug(
+            "M-Pesa credential headers missing: %s",
+            [name.decode() for name, idx in _CREDENTIAL_HEADERS.items() if not values[idx]],
+        )
+        return RequestHeaders(headers, business_short_code)
+
+    try:
+        creds = credentials_from_values(tuple(values))  # type: ignore[arg-type]
+    except ValueError as e:
+        return RequestHeaders(headers, business_short_code, error=str(e))
+    return RequestHeaders(headers, business_short_code, creds)
+
+
+# Used when a tool is called without an HTTP request (e.g. over SSE)
+EMPTY_REQUEST_HEADERS = RequestHeaders({})
@@ -0,0 +1,137 @@
+import os
+import time
+import base64
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src.utils.http_client import get_http_client
+from src.utils.metrics import DARAJA_REQUEST_SECONDS, DARAJA_REQUESTS_IN_FLIGHT, daraja_endpoint
+from src.utils.resilience import (
+    MPESA_RETRY_ATTEMPTS,
+    CircuitOpenError,
+    backoff_delay,
+    circuit_breakers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Include Daraja's raw response body in error results (useful when debugging an integration)
+MPESA_INCLUDE_RAW_ERRORS = os.getenv("MPESA_INCLUDE_RAW_ERRORS", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# Statuses meaning Daraja itself is unhealthy (business errors also come back as 4xx/500)
+_UPSTREAM_FAILURE_STATUSES = frozenset({502, 503, 504})
+# Failures raised before the request reached Daraja, so retrying cannot duplicate it
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+async def daraja_request(
+    method: str,
+    base_url: str,
+    url: str,
+    *,
+    retry_safe: bool = False,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send a request to Daraja through the pooled client and the base URL's breaker.
+
+    Connect failures (request never sent) are always retried with jittered
+    exponential backoff. Calls marked ``retry_safe`` are also retried after
+    timeouts and 502/503/504 responses.
+
+    Raises:
+        CircuitOpenError: If the breaker for ``base_url`` is open
+        httpx.TransportError: If the request failed and could not be retried
+    """
+    breaker = circuit_breakers.get(base_url)
+    client = get_http_client(base_url)
+    attempts = max(1, MPESA_RETRY_ATTEMPTS)
+    endpoint = daraja_endpoint(url)
+    in_flight = DARAJA_REQUESTS_IN_FLIGHT.labels(endpoint)
+
+    for attempt in range(attempts):
+        breaker.before_call()
+        last = attempt == attempts - 1
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            DARAJA_REQUEST_SECONDS.labels(endpoint, type(e).__name__).observe(time.perf_counter() - start)
+            breaker.record_failure()
+            if last or not (retry_safe or isinstance(e, _NOT_SENT_ERRORS)):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning("Daraja %s %s failed (%s); retrying in %.2fs", method, url, type(e).__name__, delay)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.record_neutral()
+            raise
+        finally:
+            in_flight.dec()
+
+        DARAJA_REQUEST_SECONDS.labels(endpoint, str(resp.status_code)).observe(time.perf_counter() - start)
+        if resp.status_code in _UPSTREAM_FAILURE_STATUSES:
+            breaker.record_failure()
+            if retry_safe and not last:
+                delay = backoff_delay(attempt)
+                logger.warning("Daraja %s %s returned %s; retrying in %.2fs", method, url, resp.status_code, delay)
+                await asyncio.sleep(delay)
+                continue
+        else:
+            breaker.record_success()
+        return resp
+
+    raise AssertionError("unreachable")
+
+
+def stk_password(business_short_code: str, passkey: str) -> tuple[str, str]:
+    """Return (password, timestamp) for an STK push or STK query request."""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    password_string = f"{business_short_code}{passkey}{timestamp}"
+    return base64.b64encode(password_string.encode()).decode(), timestamp
+
+
+def upstream_error_result(message: str, raw: Any, **fields: Any) -> Dict[str, Any]:
+    """Tool result for an error reported by Daraja; ``raw`` is kept only if MPESA_INCLUDE_RAW_ERRORS."""
+    result: Dict[str, Any] = {"status": "error", "message": message, **fields}
+    if MPESA_INCLUDE_RAW_ERRORS:
+        result["raw"] = raw
+    return result
+
+
+def http_error_result(e: httpx.HTTPStatusError) -> Dict[str, Any]:
+    """Tool result for a non-2xx Daraja response."""
+    body = e.response.text if e.response is not None else ""
+    logger.error("HTTP error %s: %s", e.response.status_code if e.response else "?", body)
+    return upstream_error_result("HTTP request failed", body, code=e.response.status_code if e.response else None)
+
+
+def circuit_open_result(e: CircuitOpenError) -> Dict[str, Any]:
+    """Tool result when a call was not attempted because the breaker is open."""
+    return {
+        "status": "error",
+        "message": str(e),
+        "retryable": True,
+        "retry_after": e.retry_after,
+        "circuit_state": e.state,
+    }
+
+
+def request_failed_result(e: Exception, base_url: Optional[str]) -> Dict[str, Any]:
+    """Tool result for an unexpected failure, with the upstream breaker state if known.
+
+    Failures that happened before the request reached Daraja are marked
+    ``retryable``: sending it again cannot duplicate it.
+    """
+    result: Dict[str, Any] = {"status": "error", "message": f"Request failed: {e}"}
+    if isinstance(e, _NOT_SENT_ERRORS):
+        result["retryable"] = True
+    if base_url:
+        result["circuit_state"] = circuit_breakers.get(base_url).state
+    return result
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict, deque
+from contextvars import ContextVar, Token
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from mcp.server.streamable_http import EventCallback, EventId, EventMessage, EventStore, StreamId
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from mcp.types import JSONRPCMessage
+from starlette.types import Message, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Events kept per session for resumption (oldest dropped first)
+MPESA_SESSION_MAX_EVENTS = int(os.getenv("MPESA_SESSION_MAX_EVENTS", "256"))
+# Serialized event bytes held across all sessions
+MPESA_EVENT_STORE_MAX_BYTES = int(os.getenv("MPESA_EVENT_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Sessions without requests for this many seconds are closed and forgotten
+MPESA_SESSION_IDLE_TTL = float(os.getenv("MPESA_SESSION_IDLE_TTL", "1800"))
+
+# (event_id, stream_id, serialized message)
+_Event = Tuple[EventId, StreamId, bytes]
+
+_SESSION_ID_HEADER = b"mcp-session-id"
+
+
+class _SessionEvents:
+    __slots__ = ("prefix", "events", "bytes", "next_seq", "last_active", "in_flight")
+
+    def __init__(self, max_events: int) -> None:
+        # Event ids are unguessable, so one session cannot name another's events
+        self.prefix = secrets.token_hex(8)
+        self.events: Deque[_Event] = deque(maxlen=max_events)
+        self.bytes = 0
+        self.next_seq = 0
+        self.last_active = time.monotonic()
+        self.in_flight = 0
+
+
+# Events of the MCP session being served. Bound per HTTP request; a session's
+# message router is started by its first request and keeps that binding.
+_current_session: ContextVar[Optional[_SessionEvents]] = ContextVar("mcp_session_events", default=None)
+
+
+class InMemoryEventStore(EventStore):
+    """Per-session ring buffers of SSE events, bounded in count and total bytes.
+
+    Passed to the session manager as its ``event_store``. Messages are kept
+    serialized, so memory accounting is exact and idle events cost no more
+    than their JSON. When the global byte cap is hit, the oldest events of
+    the least recently active sessions go first. :meth:`track` binds each
+    request to its session's buffer, so streams with the same request id in
+    different sessions never mix and a session can only replay its own
+    events.
+    """
+
+    def __init__(
+        self,
+        max_events_per_session: int = MPESA_SESSION_MAX_EVENTS,
+        max_bytes: int = MPESA_EVENT_STORE_MAX_BYTES,
+    ) -> None:
+        self.max_events_per_session = max_events_per_session
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evicted_events = 0
+        self.evicted_sessions = 0
+        # Least recently active first
+        self._sessions: "OrderedDict[str, _SessionEvents]" = OrderedDict()
+
+    def track(self, session_id: Optional[str], send: Send) -> Tuple[Token, Send]:
+        """Bind this request to ``session_id``'s events, or to a new session's.
+
+        Returns a token for :meth:`release` and a ``send`` that registers a
+        new session under the id the manager assigns in its response.
+        """
+        if session_id:
+            return _current_session.set(self._sessions.get(session_id)), send
+
+        state = _SessionEvents(self.max_events_per_session)
+        token = _current_session.set(state)
+
+        async def send_and_register(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                for name, value in message.get("headers") or ():
+                    if name.lower() == _SESSION_ID_HEADER:
+                        self._sessions[value.decode()] = state
+                        self._sessions.move_to_end(value.decode())
+                        break
+            await send(message)
+
+        return token, send_and_register
+
+    @staticmethod
+    def release(token: Token) -> None:
+        """End the binding made by :meth:`track`."""
+        _current_session.reset(token)
+
+    def touch(self, session_id: str, in_flight_delta: int = 0) -> None:
+        """Record activity for a known session (request start/end)."""
+        state = self._sessions.get(session_id)
+        if state is not None:
+            state.last_active = time.monotonic()
+            state.in_flight += in_flight_delta
+            self._sessions.move_to_end(session_id)
+
+    def drop_session(self, session_id: str) -> None:
+        state = self._sessions.pop(session_id, None)
+        if state is not None:
+            self.total_bytes -= state.bytes
+
+    def idle_sessions(self, ttl: float) -> list[str]:
+        """Sessions with no request in flight and no activity for ``ttl`` seconds."""
+        cutoff = time.monotonic() - ttl
+        idle = []
+        for session_id, state in self._sessions.items():
+            if state.last_active > cutoff:
+                break  # ordered by activity: the rest are newer
+            if state.in_flight <= 0:
+                idle.append(session_id)
+        return idle
+
+    async def store_event(self, stream_id: StreamId, message: JSONRPCMessage) -> EventId:
+        state = _current_session.get()
+        if state is None:
+            # Not bound to a tracked session (e.g. one just evicted): nothing to resume
+            return f"{secrets.token_hex(8)}-0"
+        event_id = f"{state.prefix}-{state.next_seq}"
+        state.next_seq += 1
+
+        data = message.model_dump_json(by_alias=True, exclude_none=True).encode()
+        if len(state.events) == state.events.maxlen:
+            _, _, dropped = state.events[0]
+            state.bytes -= len(dropped)
+            self.total_bytes -= len(dropped)
+            self.evicted_events += 1
+        state.events.append((event_id, stream_id, data))
+        state.bytes += len(data)
+        self.total_bytes += len(data)
+        state.last_active = time.monotonic()
+
+        if self.total_bytes > self.max_bytes:
+            self._enforce_byte_cap()
+        return event_id
+
+    def _enforce_byte_cap(self) -> None:
+        for state in self._sessions.values():
+            while state.events and self.total_bytes > self.max_bytes:
+                _, _, dropped = state.events.popleft()
+                state.bytes -= len(dropped)
+                self.total_bytes -= len(dropped)
+                self.evicted_events += 1
+            if self.total_bytes <= self.max_bytes:
+                return
+
+    async def replay_events_after(self, last_event_id: EventId, send_callback: EventCallback) -> Optional[StreamId]:
+        state = _current_session.get()
+        if state is None or not last_event_id.startswith(f"{state.prefix}-"):
+            return None
+
+        stream_id: Optional[StreamId] = None
+        # Snapshot: sending may yield while new events are appended
+        for event_id, event_stream, data in list(state.events):
+            if stream_id is None:
+                if event_id == last_event_id:
+                    stream_id = event_stream
+                continue
+            if event_stream == stream_id:
+                await send_callback(EventMessage(JSONRPCMessage.model_validate_json(data), event_id))
+        return stream_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "events": sum(len(s.events) for s in self._sessions.values()),
+            "bytes": self.total_bytes,
+            "evicted_events": self.evicted_events,
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+
+async def terminate_session(session_manager: StreamableHTTPSessionManager, session_id: str) -> None:
+    """Close a session the way a client would, with an MCP ``DELETE`` request."""
+    scope: Scope = {
+        "type": "http",
+        "method": "DELETE",
+        "path": "/",
+        "raw_path": b"/",
+        "query_string": b"",
+        "headers": [(_SESSION_ID_HEADER, session_id.encode())],
+    }
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        pass
+
+    await session_manager.handle_request(scope, receive, send)
+
+
+async def evict_idle_sessions(
+    session_manager: StreamableHTTPSessionManager,
+    store: InMemoryEventStore,
+    idle_ttl: float = MPESA_SESSION_IDLE_TTL,
+) -> None:
+    """Periodically close idle sessions and forget their events (runs until cancelled)."""
+    interval = max(1.0, min(60.0, idle_ttl / 2))
+    while True:
+        await asyncio.sleep(interval)
+        idle = store.idle_sessions(idle_ttl)
+        for session_id in idle:
+            try:
+                await terminate_session(session_manager, session_id)
+            except Exception:
+                logger.exception("Failed to close idle MCP session")
+            store.drop_session(session_id)
+            store.evicted_sessions += 1
+        if idle:
+            logger.info("Evicted %d idle MCP sessions", len(idle))
+
+
+# Shared by the stateful session manager and the metrics endpoint
+session_events = InMemoryEventStore()
@@ -0,0 +1,137 @@
+import os
+import logging
+import importlib.util
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Base URLs (comma-separated) whose clients and connections are opened at startup
+MPESA_WARMUP_BASE_URLS = [u.strip() for u in os.getenv("MPESA_WARMUP_BASE_URLS", "").split(",") if u.strip()]
+# Per-URL limit on the warm-up request
+MPESA_WARMUP_TIMEOUT = float(os.getenv("MPESA_WARMUP_TIMEOUT", "5"))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class HttpPoolConfig:
+    """Connection pool and timeout settings for outbound Daraja calls."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls) -> "HttpPoolConfig":
+        """Read settings from MPESA_HTTP_* environment variables."""
+        return cls(
+            max_connections=int(os.getenv("MPESA_HTTP_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(
+                os.getenv("MPESA_HTTP_MAX_KEEPALIVE_CONNECTIONS", cls.max_keepalive_connections)
+            ),
+            keepalive_expiry=float(os.getenv("MPESA_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry)),
+            connect_timeout=float(os.getenv("MPESA_HTTP_CONNECT_TIMEOUT", cls.connect_timeout)),
+            read_timeout=float(os.getenv("MPESA_HTTP_READ_TIMEOUT", cls.read_timeout)),
+            http2=_env_bool("MPESA_HTTP2", cls.http2),
+        )
+
+
+class HttpClientPool:
+    """One pooled ``httpx.AsyncClient`` per upstream base URL.
+
+    Clients are created on first use (base URLs arrive per tenant in request
+    headers) and are closed together by :meth:`aclose` on server shutdown.
+    """
+
+    def __init__(self, config: Optional[HttpPoolConfig] = None) -> None:
+        self._config = config or HttpPoolConfig.from_env()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._warm = False
+
+    @property
+    def config(self) -> HttpPoolConfig:
+        return self._config
+
+    @property
+    def is_warm(self) -> bool:
+        """True once :meth:`warm_up` has finished (whether or not every URL answered)."""
+        return self._warm
+
+    def configure(self, config: HttpPoolConfig) -> None:
+        """Replace the pool settings. Only affects clients created afterwards."""
+        self._config = config
+
+    def _build_client(self) -> httpx.AsyncClient:
+        cfg = self._config
+        http2 = cfg.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                cfg.read_timeout,
+                connect=cfg.connect_timeout,
+                read=cfg.read_timeout,
+            ),
+        )
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """Return the shared client for ``base_url``, creating it if needed."""
+        key = base_url.rstrip("/")
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._build_client()
+            self._clients[key] = client
+            logger.info("Created pooled HTTP client for %s", key)
+        return client
+
+    async def warm_up(self, base_urls: Iterable[str] = (), timeout: float = MPESA_WARMUP_TIMEOUT) -> None:
+        """Create clients for ``base_urls`` and open a connection to each.
+
+        Moves TLS setup and the first handshake off the first tool call. Any
+        HTTP response counts as success; failures are logged and skipped, since
+        a slow or unreachable upstream must not keep the server from starting.
+        """
+        for base_url in base_urls:
+            try:
+                await self.get_client(base_url).get(base_url, timeout=timeout)
+            except Exception as e:
+                logger.warning("HTTP pool warm-up for %s failed: %s", base_url, e)
+        self._warm = True
+
+    async def aclose(self) -> None:
+        """Close every pooled client."""
+        self._warm = False
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception:
+                logger.exception("Error closing pooled HTTP client")
+
+
+# Process-wide pool shared by all handlers
+http_pool = HttpClientPool()
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    """Return the pooled client for ``base_url``."""
+    return http_pool.get_client(base_url)
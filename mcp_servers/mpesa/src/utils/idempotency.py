@@ -0,0 +1,136 @@
+import os
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from src.utils.cache import SingleFlight, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Window in which an identical (credentials, phone, amount, reference) push is a duplicate; 0 disables
+MPESA_IDEMPOTENCY_WINDOW = float(os.getenv("MPESA_IDEMPOTENCY_WINDOW", "120"))
+# How long a result is remembered for an explicit idempotency_key
+MPESA_IDEMPOTENCY_KEY_TTL = float(os.getenv("MPESA_IDEMPOTENCY_KEY_TTL", "86400"))
+MPESA_IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("MPESA_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+
+class IdempotencyKeyConflict(ValueError):
+    """An ``idempotency_key`` was reused with different payment details."""
+
+    def __init__(self) -> None:
+        super().__init__("idempotency_key was already used with different payment details")
+
+
+def _normalized_amount(arguments: Dict[str, Any]) -> str:
+    amount = str(arguments.get("amount", "")).strip()
+    try:
+        return str(int(amount))
+    except ValueError:
+        return amount
+
+
+def payment_fingerprint(arguments: Dict[str, Any]) -> str:
+    """Hash of the normalized payment details an idempotency key stands for."""
+    fields = (
+        str(arguments.get("phone_number", "")).strip(),
+        _normalized_amount(arguments),
+        str(arguments.get("account_reference", "")).strip(),
+        str(arguments.get("transaction_desc", "")).strip(),
+    )
+    return hashlib.sha256("\0".join(fields).encode()).hexdigest()
+
+
+def idempotency_key_for(
+    tenant_key: str, arguments: Dict[str, Any]
+) -> tuple[Optional[Hashable], float]:
+    """Return (key, ttl) for an STK push, or (None, 0) if it should not be deduplicated.
+
+    An explicit ``idempotency_key`` argument wins; otherwise the key is derived
+    from the credentials, phone, amount and account reference.
+    """
+    explicit = arguments.get("idempotency_key")
+    if explicit:
+        return ("key", tenant_key, str(explicit)), MPESA_IDEMPOTENCY_KEY_TTL
+
+    if MPESA_IDEMPOTENCY_WINDOW <= 0:
+        return None, 0.0
+
+    derived = (
+        "derived",
+        tenant_key,
+        str(arguments.get("phone_number", "")).strip(),
+        _normalized_amount(arguments),
+        str(arguments.get("account_reference", "")).strip(),
+    )
+    return derived, MPESA_IDEMPOTENCY_WINDOW
+
+
+class IdempotencyStore:
+    """Bounded LRU of tool results with TTL, plus coalescing of in-flight duplicates.
+
+    Only successful results are remembered, so a failed attempt can be retried.
+    A duplicate that arrives while the first call is still running waits for it
+    and receives the same result. Each key remembers the fingerprint of the
+    payment it was first used for, so reusing it for another payment is refused
+    rather than answered with the first payment's result.
+    """
+
+    def __init__(self, max_entries: int = MPESA_IDEMPOTENCY_MAX_ENTRIES) -> None:
+        self._results: TTLCache[tuple[Optional[str], Dict[str, Any]]] = TTLCache(max_entries)
+        self._flight = SingleFlight()
+        self._flight_fingerprints: Dict[Hashable, Optional[str]] = {}
+
+    async def run(
+        self,
+        key: Optional[Hashable],
+        ttl: float,
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+        stale: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        fingerprint: Optional[str] = None,
+    ) -> tuple[Dict[str, Any], bool]:
+        """Run ``fn`` once per key; return (result, replayed).
+
+        A remembered result for which ``stale`` returns true is forgotten
+        and ``fn`` runs again. Raises ``IdempotencyKeyConflict`` if the key is
+        remembered or in flight with a ``fingerprint`` other than this one.
+        """
+        if key is None:
+            return await fn(), False
+
+        entry = self._results.get(key)
+        if entry is not None and stale is not None and stale(entry[1]):
+            logger.info("Remembered STK push has since failed; sending a new one")
+            self._results.pop(key)
+            entry = None
+        if entry is not None:
+            self._check_fingerprint(entry[0], fingerprint)
+            logger.info("Idempotent replay of completed STK push")
+            return entry[1], True
+
+        replayed = self._flight.in_flight(key)
+        if replayed:
+            self._check_fingerprint(self._flight_fingerprints.get(key), fingerprint)
+            logger.info("Duplicate STK push is waiting for the in-flight original")
+        else:
+            self._flight_fingerprints[key] = fingerprint
+
+        async def _execute() -> Dict[str, Any]:
+            try:
+                result = await fn()
+            finally:
+                self._flight_fingerprints.pop(key, None)
+            if result.get("status") == "success":
+                self._results.set(key, (fingerprint, result), ttl)
+            return result
+
+        return await self._flight.do(key, _execute), replayed
+
+    @staticmethod
+    def _check_fingerprint(seen: Optional[str], fingerprint: Optional[str]) -> None:
+        if seen is not None and fingerprint is not None and seen != fingerprint:
+            logger.warning("idempotency_key reused with different payment details")
+            raise IdempotencyKeyConflict()
+
+
+# Process-wide store used by stk_push and stk_push_batch
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,549 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+import contextlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from src.utils import json_codec
+from src.utils.lifecycle import drain
+from src.utils.resilience import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# SQLite journal backing stk_push submit_async; unset disables async submission
+MPESA_JOB_JOURNAL_PATH = "MPESA_JOB_JOURNAL_PATH"
+# Worker tasks per process sending queued payment prompts
+MPESA_JOB_WORKERS = int(os.getenv("MPESA_JOB_WORKERS", "4"))
+# Queued jobs across all processes before new submissions are refused
+MPESA_JOB_MAX_QUEUED = int(os.getenv("MPESA_JOB_MAX_QUEUED", "10000"))
+# Tries for a job whose prompt could not be sent (rate limit, open breaker, Daraja unreachable)
+MPESA_JOB_MAX_ATTEMPTS = int(os.getenv("MPESA_JOB_MAX_ATTEMPTS", "5"))
+# A claimed job whose worker stops renewing its lease is recovered by another worker or process
+MPESA_JOB_LEASE_SECONDS = float(os.getenv("MPESA_JOB_LEASE_SECONDS", "30"))
+# How long finished jobs stay queryable
+MPESA_JOB_RETENTION = float(os.getenv("MPESA_JOB_RETENTION", "86400"))
+# Idle workers look for jobs submitted by other processes this often
+MPESA_JOB_POLL_INTERVAL = float(os.getenv("MPESA_JOB_POLL_INTERVAL", "1"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SENDING = "sending"
+JOB_DONE = "done"
+JOB_UNKNOWN = "unknown"
+JOB_STATES = (JOB_QUEUED, JOB_RUNNING, JOB_SENDING, JOB_DONE, JOB_UNKNOWN)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    tenant_key TEXT NOT NULL,
+    dedupe_key TEXT,
+    credentials TEXT,
+    arguments TEXT NOT NULL,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, not_before);
+CREATE INDEX IF NOT EXISTS jobs_by_dedupe_key ON jobs (dedupe_key);
+"""
+
+_COLUMNS = "id, state, tenant_key, credentials, arguments, result, attempts, created_at, updated_at"
+
+_UNKNOWN_RESULT = {
+    "status": "error",
+    "message": "The server stopped while this payment prompt was being sent, so it may or may not have reached "
+    "the customer. Check get_payment_status by phone_number or account_reference before sending it again.",
+}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def dedupe_key_text(key: Optional[Hashable]) -> Optional[str]:
+    """Stable text form of an idempotency key, so other processes find the same job."""
+    if key is None:
+        return None
+    return hashlib.sha256(json_codec.dumps(key).encode()).hexdigest()
+
+
+class JobQueueFull(Exception):
+    """Raised when the journal already holds ``MPESA_JOB_MAX_QUEUED`` unsent jobs."""
+
+
+class JobClaimLost(Exception):
+    """Raised before sending when another worker has taken the job over."""
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    state: str
+    # MpesaCredentials.tenant_key of the submitter; only they may read the job
+    tenant_key: str
+    credentials: Optional[Tuple[str, ...]]
+    arguments: Dict[str, Any]
+    result: Optional[Dict[str, Any]]
+    attempts: int
+    created_at: float
+    updated_at: float
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Job":
+        id_, state, tenant_key, credentials, arguments, result, attempts, created_at, updated_at = row
+        return cls(
+            id=id_,
+            state=state,
+            tenant_key=tenant_key,
+            credentials=tuple(json.loads(credentials)) if credentials else None,
+            arguments=json.loads(arguments),
+            result=json.loads(result) if result else None,
+            attempts=attempts,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Credentials never leave the journal
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "attempts": self.attempts,
+            "result": self.result,
+            "created_at": _iso(self.created_at),
+            "updated_at": _iso(self.updated_at),
+        }
+
+
+class SqliteJobJournal:
+    """Write-ahead journal of payment jobs in a local SQLite file.
+
+    A job is committed (``synchronous=FULL``) before its submitter gets the
+    job id, so it survives a crash. Workers in any process sharing the file
+    claim jobs under a lease: ``running`` jobs whose lease expires go back to
+    the queue, while ``sending`` jobs (the Daraja request may have gone out)
+    become ``unknown`` rather than being sent twice. Queued jobs hold the
+    tenant's credentials until they reach ``done`` or ``unknown``, so the file
+    is private to this user, and cleared credentials are overwritten on disk
+    (``secure_delete``, WAL truncated at each maintenance pass). Methods are
+    blocking and meant to be run via ``asyncio.to_thread``.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+        # Holds tenant credentials: keep the file private to this user
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+        os.close(fd)
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        # Zero the credentials of finished jobs instead of leaving them in free pages
+        self._conn.execute("PRAGMA secure_delete=ON")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "business_short_code" in columns:
+            # Journals written before jobs were owned by credentials; old rows match no caller
+            self._conn.execute("ALTER TABLE jobs RENAME COLUMN business_short_code TO tenant_key")
+        self._conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _get(self, conn: sqlite3.Connection, job_id: str) -> Optional[Job]:
+        row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def enqueue(
+        self,
+        tenant_key: str,
+        credentials: Tuple[str, ...],
+        arguments: Dict[str, Any],
+        dedupe_key: Optional[str] = None,
+        dedupe_ttl: float = 0.0,
+        max_queued: int = MPESA_JOB_MAX_QUEUED,
+    ) -> Tuple[Job, bool]:
+        """Journal a new job and return ``(job, False)``, or ``(existing, True)`` for a duplicate.
+
+        A duplicate is a job with the same ``dedupe_key`` submitted within
+        ``dedupe_ttl`` that has not failed.
+
+        Raises:
+            JobQueueFull: If ``max_queued`` jobs are already waiting
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if dedupe_key is not None:
+                rows = conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE dedupe_key = ? AND created_at > ? ORDER BY created_at DESC",
+                    (dedupe_key, now - dedupe_ttl),
+                ).fetchall()
+                for row in rows:
+                    job = Job.from_row(row)
+                    if job.state != JOB_DONE or (job.result or {}).get("status") == "success":
+                        return job, True
+
+            (queued,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JOB_QUEUED,)).fetchone()
+            if queued >= max_queued:
+                raise JobQueueFull(f"{queued} payment jobs are already queued")
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, state, tenant_key, dedupe_key, credentials, arguments, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, tenant_key, dedupe_key, json.dumps(list(credentials)),
+                 json_codec.dumps(arguments), now, now),
+            )
+            return self._get(conn, job_id), False  # type: ignore[return-value]
+
+    def claim(self, owner: str, lease_seconds: float) -> Optional[Job]:
+        """Take the oldest due queued job for ``owner``, or return None."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE state = ? AND not_before <= ? ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (JOB_RUNNING, owner, now + lease_seconds, now, row[0]),
+            )
+            return self._get(conn, row[0])
+
+    def mark_sending(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Record that the request is about to go out; False if ``owner`` lost the claim."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, lease_until = ?, updated_at = ? WHERE id = ? AND owner = ? AND state = ?",
+                (JOB_SENDING, now + lease_seconds, now, job_id, owner, JOB_RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def requeue(self, job_id: str, owner: str, delay: float, result: Dict[str, Any]) -> None:
+        """Put a job whose request was not sent back in the queue after ``delay`` seconds."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, not_before = ?, result = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (JOB_QUEUED, now + delay, json_codec.dumps(result), now, job_id, owner),
+            )
+
+    def finish(self, job_id: str, owner: str, result: Dict[str, Any]) -> None:
+        """Store the final result and forget the credentials.
+
+        Also applies to a job already marked ``unknown``: the real outcome wins.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, credentials = NULL, result = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (JOB_DONE, json_codec.dumps(result), now, job_id, owner),
+            )
+
+    def renew(self, owner: str, lease_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND state IN (?, ?)",
+                (now + lease_seconds, owner, JOB_RUNNING, JOB_SENDING),
+            )
+
+    def release(self, owner: str) -> int:
+        """Return ``owner``'s claimed but unsent jobs to the queue (shutdown)."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, updated_at = ? WHERE owner = ? AND state = ?",
+                (JOB_QUEUED, now, owner, JOB_RUNNING),
+            )
+            return cursor.rowcount
+
+    def recover(self) -> Tuple[int, int]:
+        """Handle jobs whose worker died; return ``(requeued, unknown)``.
+
+        Unsent jobs are queued again. Jobs that may have been sent are marked
+        ``unknown``, keeping their owner so a late result can still land.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            requeued = conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, updated_at = ? WHERE state = ? AND lease_until < ?",
+                (JOB_QUEUED, now, JOB_RUNNING, now),
+            ).rowcount
+            unknown = conn.execute(
+                "UPDATE jobs SET state = ?, credentials = NULL, result = ?, updated_at = ? WHERE state = ? AND lease_until < ?",
+                (JOB_UNKNOWN, json_codec.dumps(_UNKNOWN_RESULT), now, JOB_SENDING, now),
+            ).rowcount
+            return requeued, unknown
+
+    def purge(self, retention: float) -> int:
+        """Delete finished jobs last updated more than ``retention`` seconds ago."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (JOB_DONE, JOB_UNKNOWN, time.time() - retention),
+            )
+            return cursor.rowcount
+
+    def checkpoint(self) -> None:
+        """Copy the WAL into the database and truncate it, dropping old copies of cleared rows."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._get(self._conn, job_id)
+
+    def finished(self) -> List[Job]:
+        """Completed jobs still within retention, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE state = ? ORDER BY updated_at", (JOB_DONE,)
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_journal: Optional[SqliteJobJournal] = None
+_journal_path: Optional[str] = None
+
+
+def get_job_journal() -> Optional[SqliteJobJournal]:
+    """The journal configured by ``MPESA_JOB_JOURNAL_PATH``, opened on first use."""
+    global _journal, _journal_path
+    path = os.getenv(MPESA_JOB_JOURNAL_PATH)
+    if not path:
+        return None
+    if _journal is None or _journal_path != path:
+        _journal = SqliteJobJournal(path)
+        _journal_path = path
+        logger.info("Journaling async payment jobs in %s", path)
+    return _journal
+
+
+# Sends a job; must await the callback right before the request goes out
+JobRunner = Callable[[Job, Callable[[], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """Worker pool draining the job journal.
+
+    ``runner`` turns a job into a tool result. Results marked ``retryable``
+    (the request was not sent) are retried with backoff up to
+    ``max_attempts``. ``restore`` is called at startup with each completed
+    job, so in-memory state lost in a restart can be rebuilt. Job runs count
+    as in-flight work for the shutdown drain; queued jobs stay in the journal
+    for the next start.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        restore: Optional[Callable[[Job], None]] = None,
+        workers: int = MPESA_JOB_WORKERS,
+        max_attempts: int = MPESA_JOB_MAX_ATTEMPTS,
+        lease_seconds: float = MPESA_JOB_LEASE_SECONDS,
+        retention: float = MPESA_JOB_RETENTION,
+        poll_interval: float = MPESA_JOB_POLL_INTERVAL,
+    ) -> None:
+        self.runner = runner
+        self.restore = restore
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self._journal: Optional[SqliteJobJournal] = None
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._counts: Dict[str, int] = dict.fromkeys(JOB_STATES, 0)
+        # Stats
+        self.completed = 0
+        self.retried = 0
+        self.recovered = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(os.getenv(MPESA_JOB_JOURNAL_PATH))
+
+    def journal(self) -> SqliteJobJournal:
+        journal = self._journal or get_job_journal()
+        if journal is None:
+            raise ValueError(f"Async submission is not enabled on this server (set {MPESA_JOB_JOURNAL_PATH})")
+        return journal
+
+    async def submit(
+        self,
+        tenant_key: str,
+        credentials: Tuple[str, ...],
+        arguments: Dict[str, Any],
+        dedupe_key: Optional[Hashable] = None,
+        dedupe_ttl: float = 0.0,
+    ) -> Tuple[Job, bool]:
+        """Journal a job and wake a worker; return ``(job, replayed)``.
+
+        Raises:
+            ValueError: If no journal is configured
+            JobQueueFull: If too many jobs are waiting
+        """
+        journal = self.journal()
+        job, replayed = await asyncio.to_thread(
+            journal.enqueue, tenant_key, credentials, arguments, dedupe_key_text(dedupe_key), dedupe_ttl
+        )
+        self._wakeup.set()
+        return job, replayed
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.journal().get, job_id)
+
+    @contextlib.asynccontextmanager
+    async def running(self) -> AsyncIterator[None]:
+        """Run the workers for the lifetime of the app (a no-op without a journal)."""
+        if not self.enabled:
+            yield
+            return
+        await self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
+
+    async def start(self) -> None:
+        journal = self._journal = self.journal()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._recover)
+        if self.restore is not None:
+            for job in await asyncio.to_thread(journal.finished):
+                self.restore(job)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+        logger.info("Started %d payment job workers (%d queued)", self.workers, self._counts[JOB_QUEUED])
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        if self._journal is not None:
+            released = await asyncio.to_thread(self._journal.release, self.owner)
+            if released:
+                logger.info("Returned %d unsent payment jobs to the queue", released)
+
+    def _recover(self) -> None:
+        journal = self.journal()
+        journal.renew(self.owner, self.lease_seconds)
+        requeued, unknown = journal.recover()
+        if requeued or unknown:
+            self.recovered += requeued + unknown
+            logger.warning("Recovered payment jobs from stopped workers: %d requeued, %d outcome unknown", requeued, unknown)
+        journal.purge(self.retention)
+        journal.checkpoint()
+        self._counts = journal.counts()
+
+    async def _maintain(self) -> None:
+        # Renew our leases, recover other workers' expired ones and purge old jobs
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self._recover)
+            except sqlite3.Error as e:
+                logger.warning("Payment job maintenance failed: %s", e)
+            if self._counts[JOB_QUEUED]:
+                self._wakeup.set()
+
+    async def _work(self) -> None:
+        journal = self.journal()
+        while not drain.draining:
+            # Counted as in flight so the drain waits for a job that is being sent
+            drain.try_enter()
+            job = None
+            try:
+                self._wakeup.clear()
+                job = await asyncio.to_thread(journal.claim, self.owner, self.lease_seconds)
+                if job is not None:
+                    await self._run(journal, job)
+            except sqlite3.Error as e:
+                logger.warning("Payment job worker could not use the journal: %s", e)
+            finally:
+                drain.leave()
+            if job is None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+    async def _run(self, journal: SqliteJobJournal, job: Job) -> None:
+        lost = False
+
+        async def before_send() -> None:
+            nonlocal lost
+            if not await asyncio.to_thread(journal.mark_sending, job.id, self.owner, self.lease_seconds):
+                lost = True
+                raise JobClaimLost(job.id)
+
+        try:
+            result = await self.runner(job, before_send)
+        except Exception as e:
+            logger.exception("Payment job %s failed", job.id)
+            result = {"status": "error", "message": f"Request failed: {e}"}
+        if lost:
+            logger.warning("Payment job %s was taken over by another worker before sending", job.id)
+            return
+
+        if result.get("retryable") and job.attempts < self.max_attempts:
+            delay = max(float(result.get("retry_after") or 0), backoff_delay(job.attempts - 1))
+            self.retried += 1
+            logger.info("Payment job %s not sent (%s); retrying in %.1fs", job.id, result.get("message"), delay)
+            await asyncio.to_thread(journal.requeue, job.id, self.owner, delay, result)
+            return
+
+        await asyncio.to_thread(journal.finish, job.id, self.owner, result)
+        self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts by state as of the last maintenance pass, plus this process's counters."""
+        return {
+            "states": dict(self._counts),
+            "completed": self.completed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+        }
@@ -0,0 +1,17 @@
+import json
+from typing import Any
+
+try:  # Optional: pip install '.[perf]'
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """Serialize ``obj`` to compact JSON text, with orjson when it is installed.
+
+    Values JSON cannot represent are written with ``str()`` by both encoders.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
@@ -0,0 +1,114 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+import threading
+from types import FrameType
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest wait for in-flight tool calls once shutdown starts
+MPESA_DRAIN_GRACE_SECONDS = float(os.getenv("MPESA_DRAIN_GRACE_SECONDS", "20"))
+# After draining, how long uvicorn keeps idle connections (e.g. SSE streams) open before closing them
+MPESA_SHUTDOWN_CONNECTION_TIMEOUT = float(os.getenv("MPESA_SHUTDOWN_CONNECTION_TIMEOUT", "5"))
+
+
+def draining_result() -> Dict[str, Any]:
+    """Tool result for a call refused because this instance is shutting down."""
+    return {
+        "status": "error",
+        "message": "Server is shutting down and did not start this request; retry it.",
+        "retryable": True,
+        "retry_after": 1,
+    }
+
+
+class DrainController:
+    """Tracks in-flight tool calls and runs the shutdown drain.
+
+    On SIGTERM the server stops reporting ready and refuses new tool calls,
+    then waits (up to the grace period) for calls already running, so a
+    customer's STK prompt is never left in an unknown state. Only then is the
+    signal handed to uvicorn, which stops accepting connections and runs the
+    app's lifespan shutdown.
+    """
+
+    def __init__(self) -> None:
+        self.draining = False
+        self.in_flight = 0
+        self.rejected = 0
+        self._previous_handler: Optional[Callable[[int, Optional[FrameType]], Any]] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    def reset(self) -> None:
+        """Accept tool calls again (app startup)."""
+        self.draining = False
+
+    def try_enter(self) -> bool:
+        """Count a new tool call, or return False (and count a rejection) while draining."""
+        if self.draining:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+
+    def begin(self) -> None:
+        if not self.draining:
+            self.draining = True
+            logger.info("Draining: readiness now fails and new tool calls are refused (%d in flight)", self.in_flight)
+
+    async def wait_idle(self, timeout: float = MPESA_DRAIN_GRACE_SECONDS) -> bool:
+        """Wait until no tool call is in flight; False if ``timeout`` expired first."""
+        deadline = time.monotonic() + timeout
+        while self.in_flight > 0:
+            if time.monotonic() >= deadline:
+                logger.warning("Drain grace period (%.0fs) expired with %d tool calls in flight", timeout, self.in_flight)
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def install_signal_handler(self, grace: float = MPESA_DRAIN_GRACE_SECONDS) -> None:
+        """Drain before uvicorn's own SIGTERM handling; call from the app's lifespan startup.
+
+        uvicorn has installed its handler by then. A second SIGTERM skips
+        the rest of the drain.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            return
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(sig: int, frame: Optional[FrameType]) -> None:
+            if self.draining:
+                previous(sig, frame)
+                return
+            self.begin()
+
+            async def drain_then_exit() -> None:
+                if await self.wait_idle(grace):
+                    logger.info("Drained: no tool calls in flight")
+                previous(sig, frame)
+
+            def start() -> None:
+                self._drain_task = loop.create_task(drain_then_exit())
+
+            loop.call_soon_threadsafe(start)
+
+        self._previous_handler = previous
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def restore_signal_handler(self) -> None:
+        if self._previous_handler is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._previous_handler)
+            self._previous_handler = None
+
+
+# Process-wide: shared by the tool dispatcher, /readyz and the lifespan
+drain = DrainController()
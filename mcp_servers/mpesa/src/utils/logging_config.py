@@ -0,0 +1,203 @@
+# example_server/src/utils/logging_config.py is a copy of this module; keep the two in sync.
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import time
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+
+# "text" (human-readable) or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Records buffered between the event loop and the writer thread; excess is dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Keep only a fraction of INFO/DEBUG records per logger, e.g. "httpx=0.1,uvicorn.access=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``"logger=rate,..."`` into a mapping; rates are clamped to [0, 1]."""
+    rates: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, sep, rate = item.strip().partition("=")
+        if not sep or not name:
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop a fraction of INFO-and-below records for configured loggers.
+
+    Rates apply to the logger and its children (longest configured prefix
+    wins); WARNING and above are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+        self._resolved: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            probe = name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        rate = self._rate_for(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks: records are dropped (and counted) when full."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args (so later mutation can't change the message); the
+        # formatting itself happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """The installed queue handler and its writer thread."""
+
+    def __init__(self, handler: DroppingQueueHandler, listener: logging.handlers.QueueListener, sampler: SamplingFilter) -> None:
+        self.handler = handler
+        self.listener = listener
+        self.sampler = sampler
+        self._stopped = False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until the writer thread has written every queued record; False on timeout."""
+        pending = self.handler.queue
+        deadline = time.monotonic() + timeout
+        while pending.unfinished_tasks and not self._stopped:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        for handler in self.listener.handlers:
+            handler.flush()
+        return True
+
+    def stop(self) -> None:
+        """Flush queued records and stop the writer thread (idempotent)."""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+        }
+
+
+_pipeline: Optional[LoggingPipeline] = None
+
+
+def configure_logging(
+    level: str = "INFO",
+    log_format: str = LOG_FORMAT,
+    use_queue: bool = True,
+    queue_size: int = LOG_QUEUE_SIZE,
+    sample_rates: Optional[Dict[str, float]] = None,
+) -> Optional[LoggingPipeline]:
+    """Configure root logging.
+
+    With ``use_queue`` the root logger only gets a non-blocking queue handler;
+    a background thread writes records to stderr. Otherwise this behaves like
+    ``logging.basicConfig`` (sampling still applies).
+    """
+    global _pipeline
+
+    formatter: logging.Formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+    sampler = SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level.upper()))
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+
+    if not use_queue:
+        stream_handler.addFilter(sampler)
+        root.addHandler(stream_handler)
+        return None
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+    handler.addFilter(sampler)
+    listener = logging.handlers.QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    root.addHandler(handler)
+
+    _pipeline = LoggingPipeline(handler, listener, sampler)
+    atexit.register(_pipeline.stop)
+    return _pipeline
+
+
+def get_logging_pipeline() -> Optional[LoggingPipeline]:
+    """The active queue-based pipeline, if :func:`configure_logging` installed one."""
+    return _pipeline
@@ -0,0 +1,243 @@
+import bisect
+import math
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets (seconds) covering fast cache hits up to slow Daraja calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (labels, value) pairs reported by a scrape-time collector
+Samples = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    """Base for labelled metrics; children are created once per label set.
+
+    Updates are plain attribute arithmetic: everything runs on the event
+    loop thread, so no locks are needed.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._render_samples()]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self._children.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]) -> None:
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * len(upper_bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # Per-bucket (non-cumulative) counts; cumulated at render time
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets)) + (math.inf,)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.upper_bounds)
+
+    def _render_samples(self) -> List[str]:
+        lines: List[str] = []
+        names = self.labelnames + ("le",)
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(child.upper_bounds, child.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, values + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class _Collected:
+    """Metric family whose samples are computed at scrape time."""
+
+    def __init__(self, name: str, documentation: str, kind: str, collect: Callable[[], Samples]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics in registration order and renders the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name: str, documentation: str, collect: Callable[[], Samples], kind: str = "gauge") -> None:
+        """Register a family computed from existing state on every scrape."""
+        self._add(_Collected(name, documentation, kind, collect))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry exposed on /metrics
+metrics = MetricsRegistry()
+
+TOOL_CALL_SECONDS = metrics.histogram(
+    "mcp_tool_call_duration_seconds", "MCP tool call latency.", ("provider", "tool", "outcome")
+)
+TOOL_CALLS_IN_FLIGHT = metrics.gauge(
+    "mcp_tool_calls_in_flight", "MCP tool calls currently running.", ("provider", "tool")
+)
+HTTP_REQUESTS_IN_FLIGHT = metrics.gauge("mcp_http_requests_in_flight", "Streamable HTTP requests being handled.").labels()
+
+DARAJA_REQUEST_SECONDS = metrics.histogram(
+    "mpesa_daraja_request_duration_seconds", "Latency of individual Daraja HTTP attempts.", ("endpoint", "status")
+)
+DARAJA_REQUESTS_IN_FLIGHT = metrics.gauge(
+    "mpesa_daraja_requests_in_flight", "Daraja HTTP requests awaiting a response.", ("endpoint",)
+)
+DARAJA_RESPONSE_CODES = metrics.counter(
+    "mpesa_daraja_response_codes_total", "ResponseCode values returned by Daraja.", ("endpoint", "response_code")
+)
+TOKEN_CACHE_LOOKUPS = metrics.counter(
+    "mpesa_token_cache_lookups_total",
+    "Access token lookups by result (hit, shared_hit from another worker, or miss).",
+    ("result",),
+)
+TOKEN_CACHE_HIT = TOKEN_CACHE_LOOKUPS.labels("hit")
+TOKEN_CACHE_SHARED_HIT = TOKEN_CACHE_LOOKUPS.labels("shared_hit")
+TOKEN_CACHE_MISS = TOKEN_CACHE_LOOKUPS.labels("miss")
+
+
+def _token_cache_hit_ratio() -> Samples:
+    hits = TOKEN_CACHE_HIT.value + TOKEN_CACHE_SHARED_HIT.value
+    total = hits + TOKEN_CACHE_MISS.value
+    yield {}, (hits / total) if total else 0.0
+
+
+metrics.collector("mpesa_token_cache_hit_ratio", "Share of access token lookups served from cache.", _token_cache_hit_ratio)
+
+
+def daraja_endpoint(url: str) -> str:
+    """Low-cardinality endpoint label for a Daraja URL."""
+    if "/oauth/" in url:
+        return "oauth"
+    if url.endswith("/processrequest"):
+        return "processrequest"
+    if "/stkpushquery/" in url:
+        return "stkpushquery"
+    return "other"
+
+
+def tool_outcome(result: Optional[Dict[str, Any]]) -> str:
+    """Outcome label from a handler's result, read from its ``status`` key."""
+    status = result.get("status") if result else None
+    return status if status in ("success", "partial", "accepted", "error") else "unknown"
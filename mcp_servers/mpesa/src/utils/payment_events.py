@@ -0,0 +1,144 @@
+import os
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Set
+
+from mcp.server.session import ServerSession
+from pydantic import AnyUrl
+
+from src.utils.payment_store import PaymentRecord, payment_store
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_URI_SCHEME = "payment"
+PAYMENT_URI_TEMPLATE = "payment://{checkout_request_id}"
+# RFC 5424 severities, as used by MCP logging/setLevel (lowest first)
+_LOG_LEVELS = ("debug", "info", "notice", "warning", "error", "critical", "alert", "emergency")
+
+# Payments with live watchers; the oldest are forgotten first
+MPESA_PAYMENT_WATCH_MAX = int(os.getenv("MPESA_PAYMENT_WATCH_MAX", "10000"))
+
+
+def payment_uri(checkout_request_id: str) -> str:
+    return f"{PAYMENT_URI_SCHEME}://{checkout_request_id}"
+
+
+def checkout_request_id_from_uri(uri: Any) -> Optional[str]:
+    """The CheckoutRequestID in a ``payment://`` URI, or ``None`` for other URIs."""
+    prefix = f"{PAYMENT_URI_SCHEME}://"
+    uri = str(uri)
+    if not uri.startswith(prefix) or len(uri) == len(prefix):
+        return None
+    return uri[len(prefix):].rstrip("/")
+
+
+def checkout_request_ids(result: Dict[str, Any]) -> Iterator[str]:
+    """CheckoutRequestIDs of prompts a tool result reports as sent (single or batch)."""
+    for item in (result, *result.get("results", ())):
+        if isinstance(item, dict) and item.get("status") == "success" and item.get("checkout_request_id"):
+            yield item["checkout_request_id"]
+
+
+class _Watch:
+    __slots__ = ("subscribers", "requesters")
+
+    def __init__(self) -> None:
+        # session -> tenant_key of the credentials it used; sessions drop out once closed and collected
+        self.subscribers: "weakref.WeakKeyDictionary[ServerSession, str]" = weakref.WeakKeyDictionary()
+        self.requesters: "weakref.WeakKeyDictionary[ServerSession, str]" = weakref.WeakKeyDictionary()
+
+
+class PaymentNotifier:
+    """Pushes payment outcomes to the MCP sessions waiting for them.
+
+    A session that sent a prompt gets a ``notifications/message`` (logger
+    ``payments``) with the outcome when the Daraja callback arrives; sessions
+    subscribed to ``payment://{checkout_request_id}`` get
+    ``notifications/resources/updated`` and can read the resource. Delivery
+    needs a session that outlives the request, i.e. SSE or ``--stateful``
+    StreamableHTTP; stateless sessions are gone by then and are skipped.
+    """
+
+    def __init__(self, max_payments: int = MPESA_PAYMENT_WATCH_MAX) -> None:
+        self.max_payments = max_payments
+        self._watches: "OrderedDict[str, _Watch]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        # Minimum log level each session asked for with logging/setLevel
+        self._log_levels: "weakref.WeakKeyDictionary[ServerSession, str]" = weakref.WeakKeyDictionary()
+        self.sent = 0
+        self.failed = 0
+
+    def _watch(self, checkout_request_id: str) -> _Watch:
+        watch = self._watches.get(checkout_request_id)
+        if watch is None:
+            watch = self._watches[checkout_request_id] = _Watch()
+            while len(self._watches) > self.max_payments:
+                self._watches.popitem(last=False)
+        return watch
+
+    def watch(self, checkout_request_id: str, session: ServerSession, tenant_key: str) -> None:
+        """Notify ``session`` when the payment it started reaches an outcome."""
+        self._watch(checkout_request_id).requesters[session] = tenant_key
+
+    def subscribe(self, checkout_request_id: str, session: ServerSession, tenant_key: str) -> None:
+        self._watch(checkout_request_id).subscribers[session] = tenant_key
+
+    def unsubscribe(self, checkout_request_id: str, session: ServerSession) -> None:
+        watch = self._watches.get(checkout_request_id)
+        if watch is not None:
+            watch.subscribers.pop(session, None)
+
+    def set_log_level(self, session: ServerSession, level: str) -> None:
+        self._log_levels[session] = level
+
+    def _wants_info(self, session: ServerSession) -> bool:
+        level = self._log_levels.get(session, "info")
+        return _LOG_LEVELS.index(level) <= _LOG_LEVELS.index("info")
+
+    def on_update(self, record: PaymentRecord) -> None:
+        """Payment store listener: schedule delivery of a status change."""
+        watch = self._watches.get(record.checkout_request_id)
+        if watch is None:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._deliver(record, watch))
+        except RuntimeError:
+            return  # no event loop (e.g. store used from a script)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, record: PaymentRecord, watch: _Watch) -> None:
+        uri = payment_uri(record.checkout_request_id)
+
+        for session, tenant_key in list(watch.subscribers.items()):
+            if payment_store.visible_to(record, tenant_key):
+                await self._send(session, session.send_resource_updated(AnyUrl(uri)))
+
+        data = {"event": "payment_updated", "uri": uri, **record.to_dict()}
+        for session, tenant_key in list(watch.requesters.items()):
+            if payment_store.visible_to(record, tenant_key) and self._wants_info(session):
+                await self._send(session, session.send_log_message("info", data, logger="payments"))
+
+        # A final outcome is not sent twice to the session that made the request
+        watch.requesters.clear()
+        if not watch.subscribers:
+            self._watches.pop(record.checkout_request_id, None)
+
+    async def _send(self, session: ServerSession, notification: Any) -> None:
+        try:
+            await notification
+            self.sent += 1
+        except Exception as e:
+            # The client went away; weak references clean the session up
+            self.failed += 1
+            logger.debug("Payment notification not delivered: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        return {"payments": len(self._watches), "sent": self.sent, "failed": self.failed}
+
+
+# Process-wide; fed by payment_store whenever a payment's status changes
+payment_notifier = PaymentNotifier()
+payment_store.add_listener(payment_notifier.on_update)
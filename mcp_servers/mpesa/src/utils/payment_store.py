@@ -0,0 +1,323 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long a payment stays queryable after its last update
+MPESA_PAYMENT_STORE_TTL = float(os.getenv("MPESA_PAYMENT_STORE_TTL", "86400"))
+# Hard cap on records held in memory; oldest are evicted first
+MPESA_PAYMENT_STORE_MAX_RECORDS = int(os.getenv("MPESA_PAYMENT_STORE_MAX_RECORDS", "100000"))
+
+STATUS_PENDING = "pending"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+
+# Daraja ResultCode for "Request cancelled by user"
+_RESULT_CODE_CANCELLED = 1032
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def status_for_result_code(result_code: int) -> str:
+    if result_code == 0:
+        return STATUS_COMPLETED
+    if result_code == _RESULT_CODE_CANCELLED:
+        return STATUS_CANCELLED
+    return STATUS_FAILED
+
+
+class PaymentRecord:
+    """Compact state of one STK push, from prompt to callback."""
+
+    __slots__ = (
+        "checkout_request_id",
+        "merchant_request_id",
+        "tenant_key",
+        "phone_number",
+        "account_reference",
+        "amount",
+        "status",
+        "result_code",
+        "result_desc",
+        "mpesa_receipt_number",
+        "transaction_date",
+        "created_at",
+        "updated_at",
+        "expires_at",
+    )
+
+    def __init__(
+        self,
+        checkout_request_id: str,
+        merchant_request_id: Optional[str] = None,
+        tenant_key: Optional[str] = None,
+        phone_number: Optional[str] = None,
+        account_reference: Optional[str] = None,
+        amount: Optional[str] = None,
+    ) -> None:
+        now = time.time()
+        self.checkout_request_id = checkout_request_id
+        self.merchant_request_id = merchant_request_id
+        self.tenant_key = tenant_key
+        self.phone_number = phone_number
+        self.account_reference = account_reference
+        self.amount = amount
+        self.status = STATUS_PENDING
+        self.result_code: Optional[int] = None
+        self.result_desc: Optional[str] = None
+        self.mpesa_receipt_number: Optional[str] = None
+        self.transaction_date: Optional[str] = None
+        self.created_at = now
+        self.updated_at = now
+        self.expires_at = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "checkout_request_id": self.checkout_request_id,
+            "merchant_request_id": self.merchant_request_id,
+            "phone_number": self.phone_number,
+            "account_reference": self.account_reference,
+            "amount": self.amount,
+            "payment_status": self.status,
+            "result_code": self.result_code,
+            "result_desc": self.result_desc,
+            "mpesa_receipt_number": self.mpesa_receipt_number,
+            "transaction_date": self.transaction_date,
+            "created_at": _iso(self.created_at),
+            "updated_at": _iso(self.updated_at),
+        }
+
+
+class PaymentStatusStore:
+    """In-memory payment records indexed for O(1) lookups.
+
+    Records are keyed by CheckoutRequestID and additionally indexed by
+    MerchantRequestID, and per tenant by phone number and account reference.
+    Records expire ``ttl_seconds`` after their last update and the oldest are
+    evicted once ``max_records`` is reached. Reads are scoped to the tenant
+    that sent the prompt, identified by ``MpesaCredentials.tenant_key``.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = MPESA_PAYMENT_STORE_TTL,
+        max_records: int = MPESA_PAYMENT_STORE_MAX_RECORDS,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_records = max_records
+        # Ordered by last update, oldest first, so expiry/eviction pops from the front
+        self._by_checkout: "OrderedDict[str, PaymentRecord]" = OrderedDict()
+        self._by_merchant: Dict[str, str] = {}
+        # (shortcode, phone|reference) -> insertion-ordered set of checkout ids
+        self._by_phone: Dict[tuple, Dict[str, None]] = {}
+        self._by_reference: Dict[tuple, Dict[str, None]] = {}
+        # Called with a record whenever its status changes (e.g. to push notifications)
+        self._listeners: List[Callable[[PaymentRecord], None]] = []
+
+    def add_listener(self, listener: Callable[[PaymentRecord], None]) -> None:
+        self._listeners.append(listener)
+
+    def __len__(self) -> int:
+        return len(self._by_checkout)
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _index_add(index: Dict[tuple, Dict[str, None]], key: tuple, checkout_id: str) -> None:
+        bucket = index.setdefault(key, {})
+        bucket.pop(checkout_id, None)
+        bucket[checkout_id] = None
+
+    @staticmethod
+    def _index_discard(index: Dict[tuple, Dict[str, None]], key: tuple, checkout_id: str) -> None:
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(checkout_id, None)
+        if not bucket:
+            del index[key]
+
+    def _link(self, record: PaymentRecord) -> None:
+        cid = record.checkout_request_id
+        if record.merchant_request_id:
+            self._by_merchant[record.merchant_request_id] = cid
+        if record.phone_number:
+            self._index_add(self._by_phone, (record.tenant_key, record.phone_number), cid)
+        if record.account_reference:
+            self._index_add(self._by_reference, (record.tenant_key, record.account_reference), cid)
+
+    def _unlink(self, record: PaymentRecord) -> None:
+        cid = record.checkout_request_id
+        if record.merchant_request_id and self._by_merchant.get(record.merchant_request_id) == cid:
+            del self._by_merchant[record.merchant_request_id]
+        if record.phone_number:
+            self._index_discard(self._by_phone, (record.tenant_key, record.phone_number), cid)
+        if record.account_reference:
+            self._index_discard(self._by_reference, (record.tenant_key, record.account_reference), cid)
+
+    def _touch(self, record: PaymentRecord) -> None:
+        record.updated_at = time.time()
+        record.expires_at = time.monotonic() + self.ttl_seconds
+        self._by_checkout[record.checkout_request_id] = record
+        self._by_checkout.move_to_end(record.checkout_request_id)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._by_checkout:
+            cid, oldest = next(iter(self._by_checkout.items()))
+            if oldest.expires_at > now and len(self._by_checkout) <= self.max_records:
+                break
+            del self._by_checkout[cid]
+            self._unlink(oldest)
+
+    def _live(self, checkout_id: Optional[str]) -> Optional[PaymentRecord]:
+        if checkout_id is None:
+            return None
+        record = self._by_checkout.get(checkout_id)
+        if record is None or record.expires_at <= time.monotonic():
+            return None
+        return record
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def record_pending(
+        self,
+        checkout_request_id: str,
+        merchant_request_id: Optional[str],
+        tenant_key: Optional[str],
+        phone_number: Optional[str],
+        account_reference: Optional[str],
+        amount: Optional[str],
+    ) -> PaymentRecord:
+        """Register a prompt that Daraja accepted and that awaits its callback."""
+        record = self._by_checkout.get(checkout_request_id)
+        if record is None:
+            record = PaymentRecord(
+                checkout_request_id,
+                merchant_request_id,
+                tenant_key,
+                phone_number,
+                account_reference,
+                amount,
+            )
+            self._link(record)
+        self._touch(record)
+        self._evict()
+        return record
+
+    def apply_result(
+        self,
+        checkout_request_id: str,
+        merchant_request_id: Optional[str],
+        result_code: int,
+        result_desc: Optional[str],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Optional[PaymentRecord]:
+        """Record the final outcome of a payment.
+
+        Only prompts this process registered are updated; an unknown id
+        returns ``None``. A record made from a result alone would have no
+        tenant, so anyone could read it and the id could be forged.
+        """
+        metadata = metadata or {}
+        record = self._live(checkout_request_id)
+        if record is None:
+            return None
+
+        previous_status = record.status
+        record.result_code = result_code
+        record.result_desc = result_desc
+        record.status = status_for_result_code(result_code)
+        if metadata.get("MpesaReceiptNumber") is not None:
+            record.mpesa_receipt_number = str(metadata["MpesaReceiptNumber"])
+        if metadata.get("TransactionDate") is not None:
+            record.transaction_date = str(metadata["TransactionDate"])
+        if record.amount is None and metadata.get("Amount") is not None:
+            record.amount = str(metadata["Amount"])
+
+        self._touch(record)
+        self._evict()
+        if record.status != previous_status:
+            for listener in self._listeners:
+                try:
+                    listener(record)
+                except Exception:
+                    logger.exception("Payment listener failed")
+        return record
+
+    def apply_callback(self, body: Dict[str, Any]) -> Optional[PaymentRecord]:
+        """Parse a Daraja ``stkCallback`` body and record its outcome.
+
+        Returns ``None`` if the payment is not tracked by this process.
+
+        Raises:
+            ValueError: If the body is not a valid STK callback
+        """
+        try:
+            callback = body["Body"]["stkCallback"]
+            checkout_request_id = str(callback["CheckoutRequestID"])
+            result_code = int(callback["ResultCode"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid stkCallback body: {e}")
+
+        metadata: Dict[str, Any] = {}
+        items = (callback.get("CallbackMetadata") or {}).get("Item") or []
+        for item in items:
+            if isinstance(item, dict) and "Name" in item:
+                metadata[item["Name"]] = item.get("Value")
+
+        return self.apply_result(
+            checkout_request_id,
+            callback.get("MerchantRequestID"),
+            result_code,
+            callback.get("ResultDesc"),
+            metadata,
+        )
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    @staticmethod
+    def visible_to(record: Optional[PaymentRecord], tenant_key: Optional[str]) -> bool:
+        """Whether ``record`` may be shown to the caller whose credentials have ``tenant_key``."""
+        return (
+            record is not None
+            and record.tenant_key is not None
+            and record.tenant_key == tenant_key
+        )
+
+    def __contains__(self, checkout_request_id: str) -> bool:
+        return self._live(checkout_request_id) is not None
+
+    def get(self, checkout_request_id: str, tenant_key: Optional[str]) -> Optional[PaymentRecord]:
+        record = self._live(checkout_request_id)
+        return record if self.visible_to(record, tenant_key) else None
+
+    def get_by_merchant_request_id(
+        self, merchant_request_id: str, tenant_key: Optional[str]
+    ) -> Optional[PaymentRecord]:
+        record = self._live(self._by_merchant.get(merchant_request_id))
+        return record if self.visible_to(record, tenant_key) else None
+
+    def latest_by_phone(self, tenant_key: Optional[str], phone_number: str) -> Optional[PaymentRecord]:
+        bucket = self._by_phone.get((tenant_key, phone_number))
+        return self._live(next(reversed(bucket))) if bucket else None
+
+    def latest_by_reference(self, tenant_key: Optional[str], account_reference: str) -> Optional[PaymentRecord]:
+        bucket = self._by_reference.get((tenant_key, account_reference))
+        return self._live(next(reversed(bucket))) if bucket else None
+
+
+# Process-wide store fed by stk_push and the Daraja callback route
+payment_store = PaymentStatusStore()
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Sustained requests per second allowed per business shortcode; 0 disables limiting
+MPESA_RATE_LIMIT_RPS = float(os.getenv("MPESA_RATE_LIMIT_RPS", "5"))
+# Requests that may go out back-to-back before the sustained rate applies
+MPESA_RATE_LIMIT_BURST = int(os.getenv("MPESA_RATE_LIMIT_BURST", "10"))
+# Requests allowed to wait for a slot per shortcode
+MPESA_RATE_LIMIT_MAX_QUEUE = int(os.getenv("MPESA_RATE_LIMIT_MAX_QUEUE", "100"))
+# Longest a request may wait for a slot before it is rejected
+MPESA_RATE_LIMIT_MAX_WAIT = float(os.getenv("MPESA_RATE_LIMIT_MAX_WAIT", "10"))
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted within its deadline."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket with FIFO queued admission.
+
+    Each caller reserves a token up front; when none is available the balance
+    goes negative and the caller sleeps until its reserved token has refilled.
+    Callers that would wait longer than their deadline, or that find the queue
+    full, are rejected immediately.
+    """
+
+    def __init__(self, rate: float, burst: int, max_queue: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queued = 0
+        # Stats
+        self.admitted = 0
+        self.rejected = 0
+        self.waited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, max_wait: float) -> float:
+        """Wait for a slot; return the time spent waiting in seconds.
+
+        Raises:
+            RateLimitExceeded: If the queue is full or the wait would exceed ``max_wait``
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+
+        if self._tokens >= 0:
+            self.admitted += 1
+            return 0.0
+
+        wait = -self._tokens / self.rate
+        if wait > max_wait or self._queued >= self.max_queue:
+            self._tokens += 1
+            self.rejected += 1
+            reason = "queue is full" if self._queued >= self.max_queue else f"wait would exceed {max_wait:g}s"
+            raise RateLimitExceeded(f"Rate limit exceeded ({reason})", retry_after=round(wait, 3))
+
+        self._queued += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # Give the reserved slot back to the callers behind us
+            self._tokens += 1
+            raise
+        finally:
+            self._queued -= 1
+
+        self.admitted += 1
+        self.waited += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "queue_depth": self._queued,
+            "tokens_available": max(0.0, round(self._tokens, 3)),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waited": self.waited,
+            "total_wait_seconds": round(self.total_wait_seconds, 6),
+            "max_wait_seconds": round(self.max_wait_seconds, 6),
+        }
+
+
+class ShortcodeRateLimiter:
+    """Outbound Daraja rate limiting, one token bucket per business shortcode."""
+
+    def __init__(
+        self,
+        rate: float = MPESA_RATE_LIMIT_RPS,
+        burst: int = MPESA_RATE_LIMIT_BURST,
+        max_queue: int = MPESA_RATE_LIMIT_MAX_QUEUE,
+        max_wait: float = MPESA_RATE_LIMIT_MAX_WAIT,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    async def acquire(self, business_short_code: str) -> float:
+        """Wait for a slot for ``business_short_code``; return seconds waited."""
+        if not self.enabled:
+            return 0.0
+        bucket = self._buckets.get(business_short_code)
+        if bucket is None:
+            bucket = self._buckets[business_short_code] = TokenBucket(self.rate, self.burst, self.max_queue)
+        wait = await bucket.acquire(self.max_wait)
+        if wait:
+            logger.debug("Rate limiter delayed shortcode %s by %.3fs", business_short_code, wait)
+        return wait
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-shortcode queue depth, admission and wait-time statistics."""
+        return {code: bucket.stats() for code, bucket in self._buckets.items()}
+
+
+# Process-wide limiter in front of every Daraja STK call
+rate_limiter = ShortcodeRateLimiter()
+
+
+def rate_limited_result(e: RateLimitExceeded) -> Dict[str, Any]:
+    """Tool result for a request rejected by the limiter."""
+    return {
+        "status": "error",
+        "message": f"{e}. Try again shortly.",
+        "retryable": True,
+        "retry_after": e.retry_after,
+    }
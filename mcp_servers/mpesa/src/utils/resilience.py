@@ -0,0 +1,148 @@
+import os
+import time
+import random
+import logging
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Total attempts (first try included) for calls that are safe to retry
+MPESA_RETRY_ATTEMPTS = int(os.getenv("MPESA_RETRY_ATTEMPTS", "3"))
+MPESA_RETRY_BASE_DELAY = float(os.getenv("MPESA_RETRY_BASE_DELAY", "0.2"))
+MPESA_RETRY_MAX_DELAY = float(os.getenv("MPESA_RETRY_MAX_DELAY", "2"))
+
+# Consecutive upstream failures that open the breaker for a base URL
+MPESA_BREAKER_FAILURE_THRESHOLD = int(os.getenv("MPESA_BREAKER_FAILURE_THRESHOLD", "5"))
+# Seconds the breaker stays open before letting probe requests through
+MPESA_BREAKER_RESET_TIMEOUT = float(os.getenv("MPESA_BREAKER_RESET_TIMEOUT", "30"))
+# Probe requests allowed (and successes required to close) while half-open
+MPESA_BREAKER_HALF_OPEN_PROBES = int(os.getenv("MPESA_BREAKER_HALF_OPEN_PROBES", "2"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for retry ``attempt`` (0-based)."""
+    cap = min(MPESA_RETRY_MAX_DELAY, MPESA_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, base_url: str, state: str, retry_after: float) -> None:
+        super().__init__(f"M-Pesa API at {base_url} is unavailable (circuit {state}); failing fast")
+        self.base_url = base_url
+        self.state = state
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a cool-down.
+
+    While half-open only a few probe requests are let through; enough successes
+    close the breaker again, any failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = MPESA_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = MPESA_BREAKER_RESET_TIMEOUT,
+        half_open_probes: int = MPESA_BREAKER_HALF_OPEN_PROBES,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # Stats
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _retry_after(self) -> float:
+        return max(0.0, round(self._opened_at + self.reset_timeout - time.monotonic(), 3))
+
+    def before_call(self) -> None:
+        """Admit a call or raise :class:`CircuitOpenError`."""
+        if self.state == STATE_OPEN:
+            if time.monotonic() < self._opened_at + self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.state, self._retry_after())
+            logger.info("Circuit for %s half-open, sending probe requests", self.name)
+            self.state = STATE_HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+        if self.state == STATE_HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.state, self.reset_timeout)
+            self._probes_in_flight += 1
+
+    def record_success(self) -> None:
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                logger.info("Circuit for %s closed", self.name)
+                self.state = STATE_CLOSED
+                self._failures = 0
+        else:
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._open()
+            return
+        self._failures += 1
+        if self.state == STATE_CLOSED and self._failures >= self.failure_threshold:
+            self._open()
+
+    def record_neutral(self) -> None:
+        """Release a probe slot for a call that neither proved nor disproved health."""
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _open(self) -> None:
+        logger.warning("Circuit for %s opened after upstream failures", self.name)
+        self.state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after": self._retry_after() if self.state == STATE_OPEN else 0.0,
+        }
+
+
+class CircuitBreakerRegistry:
+    """One breaker per upstream base URL."""
+
+    def __init__(self) -> None:
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, base_url: str) -> CircuitBreaker:
+        key = base_url.rstrip("/")
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(key)
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+# Process-wide breakers shared by every Daraja call
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,149 @@
+import logging
+from typing import Any, Awaitable, Callable
+
+from src.utils.auth import get_access_token
+from src.utils.credentials import MpesaCredentials
+from src.utils.daraja import daraja_request, stk_password, upstream_error_result
+from src.utils.metrics import DARAJA_RESPONSE_CODES
+from src.utils.payment_store import STATUS_CANCELLED, STATUS_FAILED, payment_store
+from src.utils.idempotency import idempotency_key_for, idempotency_store, payment_fingerprint
+from src.utils.rate_limit import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_PAYMENT_FIELDS = ("amount", "phone_number", "account_reference", "transaction_desc")
+
+
+def validate_payment(arguments: dict[str, Any]) -> None:
+    """Validate required tool args for a single payment."""
+    for field in REQUIRED_PAYMENT_FIELDS:
+        if not arguments.get(field):
+            logger.warning("Missing required field: '%s'", field)
+            raise ValueError(f"Missing required field: '{field}'")
+
+
+async def _send_stk_push(
+    creds: MpesaCredentials,
+    access_token: str,
+    arguments: dict[str, Any],
+    before_send: Callable[[], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """Send one STK push request and map the Daraja response to a tool result.
+
+    ``before_send`` is awaited once the request is ready to go out.
+    Raises ``httpx`` errors for transport failures and non-2xx responses.
+    """
+    base_url = creds.base_url
+    business_short_code = creds.business_short_code
+    transaction_type = "CustomerPayBillOnline"
+
+    # Generate technical parameters
+    password, timestamp = stk_password(business_short_code, creds.passkey)
+
+    # Ensure amount is a string/int as expected by API
+    amount = arguments["amount"]
+    # Optional: coerce to int (Safaricom accepts numeric); comment out if you prefer raw
+    try:
+        amount = int(str(amount))
+    except Exception:
+        pass
+
+    phone = str(arguments["phone_number"])
+
+    payload = {
+        "BusinessShortCode": business_short_code,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": transaction_type,
+        "Amount": amount,
+        "PartyA": phone,
+        "PartyB": business_short_code,
+        "PhoneNumber": phone,
+        "CallBackURL": creds.callback_url,
+        "AccountReference": arguments["account_reference"],
+        "TransactionDesc": arguments["transaction_desc"],
+    }
+
+    url = f"{base_url}/mpesa/stkpush/v1/processrequest"
+    headers_ = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+
+    # Stay within the shortcode's Daraja quota; may wait in the limiter queue
+    await rate_limiter.acquire(business_short_code)
+    if before_send is not None:
+        await before_send()
+
+    # Only connect failures are retried: a sent STK request must never be repeated
+    resp = await daraja_request("POST", base_url, url, json=payload, headers=headers_)
+    resp.raise_for_status()
+    data = resp.json()
+    DARAJA_RESPONSE_CODES.labels("processrequest", str(data.get("ResponseCode"))).inc()
+
+    # Success per API contract: ResponseCode == "0"
+    if data.get("ResponseCode") != "0":
+        error_msg = data.get("ResponseDescription", "Unknown error")
+        logger.warning("STK push failed: code=%s msg=%s", data.get("ResponseCode"), error_msg)
+        return upstream_error_result(error_msg, data)
+
+    result = {
+        "status": "success",
+        "message": data.get("CustomerMessage", "Payment prompt sent successfully"),
+        "merchant_request_id": data.get("MerchantRequestID"),
+        "checkout_request_id": data.get("CheckoutRequestID"),
+        "amount": str(amount),
+        "phone_number": phone,
+        "reference": arguments["account_reference"],
+    }
+
+    # Track the prompt so the Daraja callback and get_payment_status can find it
+    if result["checkout_request_id"]:
+        payment_store.record_pending(
+            result["checkout_request_id"],
+            result["merchant_request_id"],
+            creds.tenant_key,
+            phone,
+            arguments["account_reference"],
+            result["amount"],
+        )
+
+    logger.info("STK push successful for %s KES to %s", result["amount"], result["phone_number"])
+    return result
+
+
+async def send_stk_push_idempotent(
+    creds: MpesaCredentials,
+    arguments: dict[str, Any],
+    access_token: str | None = None,
+    before_send: Callable[[], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """Send an STK push unless an identical one already succeeded or is in flight.
+
+    Duplicates get the original result back (flagged with ``idempotent_replay``)
+    without another Daraja call. Without an explicit ``idempotency_key``, a
+    prompt the customer already cancelled or that failed is not replayed:
+    the identical push is a new attempt. Reusing an explicit key for a
+    different payment raises ``IdempotencyKeyConflict``.
+    """
+    key, ttl = idempotency_key_for(creds.tenant_key, arguments)
+    # An explicit key must always stand for the same payment
+    fingerprint = payment_fingerprint(arguments) if key is not None and key[0] == "key" else None
+
+    def _finished_unpaid(result: dict[str, Any]) -> bool:
+        if key is None or key[0] != "derived":
+            return False
+        record = payment_store.get(str(result.get("checkout_request_id")), creds.tenant_key)
+        return record is not None and record.status in (STATUS_CANCELLED, STATUS_FAILED)
+
+    async def _push() -> dict[str, Any]:
+        # Access token using dynamic credentials
+        token = access_token or await get_access_token(creds)
+        return await _send_stk_push(creds, token, arguments, before_send)
+
+    result, replayed = await idempotency_store.run(
+        key, ttl, _push, stale=_finished_unpaid, fingerprint=fingerprint
+    )
+    if replayed:
+        result = {**result, "idempotent_replay": True}
+    return result
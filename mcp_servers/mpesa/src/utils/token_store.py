@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQLite file shared by every worker process; unset keeps tokens per process
+MPESA_TOKEN_STORE_PATH = "MPESA_TOKEN_STORE_PATH"
+# How long one worker may hold the refresh lease before another takes over
+MPESA_TOKEN_STORE_LEASE_SECONDS = float(os.getenv("MPESA_TOKEN_STORE_LEASE_SECONDS", "15"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY,
+    access_token TEXT,
+    expires_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def store_key(key: Tuple[str, ...]) -> str:
+    """Stable text key for a tenant token cache key."""
+    return hashlib.sha256("\0".join(key).encode()).hexdigest()
+
+
+class SqliteTokenStore:
+    """Access tokens shared between processes through a local SQLite file.
+
+    Expiry is stored as wall-clock time since monotonic clocks are not
+    comparable across processes. A per-tenant lease ensures only one process
+    refreshes a token at a time; the others wait for its result. Methods are
+    blocking and meant to be run via ``asyncio.to_thread``.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = MPESA_TOKEN_STORE_LEASE_SECONDS) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+
+        # Tokens are credentials: keep the file private to this user
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+        os.close(fd)
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+
+    def acquire(self, key: str, reject_token: Optional[str] = None) -> Tuple[Optional[Tuple[str, float]], bool]:
+        """Return ``((token, expires_at), False)`` if a valid token is stored,
+        ``(None, True)`` if the caller now holds the refresh lease, or
+        ``(None, False)`` if another process is refreshing.
+
+        ``reject_token`` is treated as invalid (the caller saw it rejected).
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT access_token, expires_at, lease_until FROM tokens WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    token, expires_at, lease_until = row
+                    if token and expires_at > now and token != reject_token:
+                        conn.execute("COMMIT")
+                        return (token, expires_at), False
+                    if lease_until > now:
+                        conn.execute("COMMIT")
+                        return None, False
+                conn.execute(
+                    "INSERT INTO tokens (key, lease_until) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET lease_until = excluded.lease_until",
+                    (key, now + self.lease_seconds),
+                )
+                conn.execute("COMMIT")
+                return None, True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def put(self, key: str, access_token: str, expires_at: float) -> None:
+        """Store a fresh token and release the refresh lease."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tokens (key, access_token, expires_at, lease_until) VALUES (?, ?, ?, 0) "
+                "ON CONFLICT(key) DO UPDATE SET access_token = excluded.access_token, "
+                "expires_at = excluded.expires_at, lease_until = 0",
+                (key, access_token, expires_at),
+            )
+
+    def release(self, key: str) -> None:
+        """Give up the refresh lease after a failed fetch."""
+        with self._lock:
+            self._conn.execute("UPDATE tokens SET lease_until = 0 WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[SqliteTokenStore] = None
+_store_path: Optional[str] = None
+
+
+def get_token_store() -> Optional[SqliteTokenStore]:
+    """The shared store configured by ``MPESA_TOKEN_STORE_PATH``, opened on first use."""
+    global _store, _store_path
+    path = os.getenv(MPESA_TOKEN_STORE_PATH)
+    if not path:
+        return None
+    if _store is None or _store_path != path:
+        _store = SqliteTokenStore(path)
+        _store_path = path
+        logger.info("Sharing M-Pesa access tokens through %s", path)
+    return _store
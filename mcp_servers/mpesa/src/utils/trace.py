@@ -0,0 +1,105 @@
+import contextvars
+from typing import Any, Dict, Optional
+
+from starlette.types import Scope
+
+# Credential headers never forwarded to the tracer or logs
+REDACTED_HEADERS = frozenset(
+    {
+        "authorization",
+        "proxy-authorization",
+        "cookie",
+        "mpesa-consumer-key",
+        "mpesa-consumer-secret",
+        "mpesa-passkey",
+    }
+)
+# URL headers whose query string may hold a secret (the callback ?token=); only the query is hidden
+QUERY_REDACTED_HEADERS = frozenset({"mpesa-callback-url"})
+# Also hidden from logs; the tracer reads it to authenticate its own export
+LOG_REDACTED_HEADERS = REDACTED_HEADERS | {"paylink-api-key"}
+
+REDACTED = "[REDACTED]"
+
+
+def _redact_query(url: str) -> str:
+    base, sep, _ = url.partition("?")
+    return f"{base}?{REDACTED}" if sep else url
+
+
+def redact_headers(headers: Dict[str, str], denylist: frozenset = REDACTED_HEADERS) -> Dict[str, str]:
+    """Copy of ``headers`` with credential values and secret-bearing URL queries replaced."""
+    return {
+        k: REDACTED if k in denylist else _redact_query(v) if k in QUERY_REDACTED_HEADERS else v
+        for k, v in headers.items()
+    }
+
+
+class LazyTraceContext:
+    """Per-request trace context that is only turned into a dict when read.
+
+    Holds references to the ASGI scope and parsed headers; nothing is copied or
+    formatted unless the tracer asks for :meth:`to_dict` or a log record that
+    includes it is actually emitted.
+    """
+
+    __slots__ = ("_scope", "_headers", "_dict")
+
+    def __init__(self, scope: Scope, headers: Dict[str, str]) -> None:
+        self._scope = scope
+        self._headers = headers
+        self._dict: Optional[Dict[str, Any]] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Parsed request headers, unredacted (for routing decisions, never for output)."""
+        return self._headers
+
+    def _build(self, headers: Dict[str, str]) -> Dict[str, Any]:
+        scope = self._scope
+        client = scope.get("client") or ["", ""]
+        server = scope.get("server") or ["", ""]
+        query_string = scope.get("query_string", b"")
+        if isinstance(query_string, bytes):
+            query_string = query_string.decode()
+
+        return {
+            "request": {
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "query_string": query_string,
+                "client": {"ip": client[0], "port": client[1] if len(client) > 1 else None},
+                "server": {"host": server[0], "port": server[1] if len(server) > 1 else None},
+                "headers": headers,
+            },
+            "environment": {
+                "mcp_protocol_version": self._headers.get("mcp-protocol-version"),
+                "payment_provider": self._headers.get("payment-provider"),
+            },
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Trace context for ``paylink_tracer``, with credential headers redacted."""
+        if self._dict is None:
+            self._dict = self._build(redact_headers(self._headers))
+        return self._dict
+
+    def __repr__(self) -> str:
+        return repr(self._build(redact_headers(self._headers, LOG_REDACTED_HEADERS)))
+
+
+class TraceContextProvider:
+    """ContextVar stand-in for ``set_trace_context_provider``.
+
+    ``paylink_tracer`` only calls ``.get(default)``; this materializes the lazy
+    context at that point.
+    """
+
+    __slots__ = ("_var",)
+
+    def __init__(self, var: "contextvars.ContextVar[LazyTraceContext]") -> None:
+        self._var = var
+
+    def get(self, default: Any = None) -> Any:
+        ctx = self._var.get(None)
+        return ctx.to_dict() if ctx is not None else default
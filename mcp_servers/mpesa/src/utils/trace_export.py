@@ -0,0 +1,245 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+import contextlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import paylink_tracer.tracer as paylink_tracer_module
+from paylink_tracer.constants import API_ENDPOINT_PATH, DEFAULT_BASE_URL, REQUEST_TIMEOUT
+from paylink_tracer.utils import build_trace_payload, get_config_from_headers
+
+from src.utils import json_codec
+from src.utils.http_client import get_http_client
+from src.utils.logging_config import parse_sample_rates
+from src.utils.trace import LazyTraceContext
+
+logger = logging.getLogger(__name__)
+
+# Share of tool calls traced, decided when each call starts
+MPESA_TRACE_SAMPLE_RATE = float(os.getenv("MPESA_TRACE_SAMPLE_RATE", "1.0"))
+# Per-tenant rates by business shortcode, e.g. "174379=1.0,600000=0.01"
+MPESA_TRACE_TENANT_SAMPLE_RATES = os.getenv("MPESA_TRACE_TENANT_SAMPLE_RATES", "")
+# Calls at least this slow (ms) are always exported, like errors
+MPESA_TRACE_SLOW_MS = float(os.getenv("MPESA_TRACE_SLOW_MS", "2000"))
+# Traces waiting for export; new ones are dropped when full
+MPESA_TRACE_BUFFER_SIZE = int(os.getenv("MPESA_TRACE_BUFFER_SIZE", "10000"))
+# Traces sent per export round, and the longest a trace waits for a round
+MPESA_TRACE_BATCH_SIZE = int(os.getenv("MPESA_TRACE_BATCH_SIZE", "50"))
+MPESA_TRACE_FLUSH_INTERVAL = float(os.getenv("MPESA_TRACE_FLUSH_INTERVAL", "2"))
+
+TRACE_ENDPOINT = f"{DEFAULT_BASE_URL.rstrip('/')}{API_ENDPOINT_PATH}/"
+
+_SHORTCODE_HEADER = "mpesa-business-shortcode"
+# Tool result statuses that are kept like errors (e.g. a partly failed batch)
+_OK_RESPONSE_STATUSES = frozenset({"success", "accepted"})
+
+
+# A tool call: (name, arguments) -> result
+ToolCall = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class TraceSampler:
+    """Decides which tool calls get a ``paylink_tracer`` trace.
+
+    The decision is made when the call starts, from the tenant's rate (or
+    ``rate`` for tenants without one), before any trace is built. A call
+    that was not sampled but ends in an error (an error status or a partial
+    result) or takes at least ``slow_ms`` is still traced afterwards.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        tenant_rates: Optional[Dict[str, float]] = None,
+        slow_ms: float = MPESA_TRACE_SLOW_MS,
+    ) -> None:
+        self.rate = min(1.0, max(0.0, rate))
+        self.tenant_rates = tenant_rates or {}
+        self.slow_ms = slow_ms
+
+    @classmethod
+    def from_env(cls) -> "TraceSampler":
+        return cls(MPESA_TRACE_SAMPLE_RATE, parse_sample_rates(MPESA_TRACE_TENANT_SAMPLE_RATES), MPESA_TRACE_SLOW_MS)
+
+    def sample(self, headers: Dict[str, str]) -> bool:
+        """Head decision for a call about to start."""
+        rate = self.tenant_rates.get(headers.get(_SHORTCODE_HEADER), self.rate)
+        return rate >= 1.0 or random.random() < rate
+
+    def must_keep(self, result: Any, duration_ms: float) -> bool:
+        """Whether a finished call that was not sampled is traced anyway."""
+        if isinstance(result, dict) and result.get("status", "success") not in _OK_RESPONSE_STATUSES:
+            return True
+        return duration_ms >= self.slow_ms
+
+
+class TraceExporter:
+    """Samples tool calls for ``paylink_tracer`` and exports traces off the request path.
+
+    :meth:`call` runs the traced variant of a tool call only if the sampler
+    keeps it. The SDK posts every trace from inside the traced call, using a
+    new blocking ``httpx.Client`` on the event loop; while started, the
+    exporter replaces the SDK's ``send_trace_to_api`` (the tracer module has
+    no export hook): traces go into a bounded buffer, and a background task
+    sends them in batches through the shared connection pool. The trace API
+    accepts one trace per request, so a batch is sent as concurrent requests
+    over pooled connections.
+    """
+
+    def __init__(
+        self,
+        sampler: TraceSampler,
+        buffer_size: int = MPESA_TRACE_BUFFER_SIZE,
+        batch_size: int = MPESA_TRACE_BATCH_SIZE,
+        flush_interval: float = MPESA_TRACE_FLUSH_INTERVAL,
+    ) -> None:
+        self.sampler = sampler
+        self.buffer_size = buffer_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: Deque[Tuple[Dict[str, Any], Optional[str]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sdk_send: Optional[Callable[..., None]] = None
+        self._stopping = False
+        # Stats
+        self.sampled_out = 0
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+
+    async def call(
+        self,
+        run: ToolCall,
+        traced_run: ToolCall,
+        name: str,
+        arguments: Dict[str, Any],
+        trace_ctx: Optional[LazyTraceContext],
+    ) -> Dict[str, Any]:
+        """Run a tool call, through ``traced_run`` only if it is sampled."""
+        if trace_ctx is None or self.sampler.sample(trace_ctx.headers):
+            return await traced_run(name, arguments)
+
+        start = time.time()
+        result = await run(name, arguments)
+        duration_ms = round((time.time() - start) * 1000, 2)
+        if self.sampler.must_keep(result, duration_ms):
+            self._trace_after(trace_ctx, name, arguments, result, duration_ms)
+        else:
+            self.sampled_out += 1
+        return result
+
+    def _trace_after(
+        self,
+        trace_ctx: LazyTraceContext,
+        name: str,
+        arguments: Dict[str, Any],
+        result: Dict[str, Any],
+        duration_ms: float,
+    ) -> None:
+        # Same payload and opt-in rules as the SDK decorator, for a call that already ran
+        ctx = trace_ctx.to_dict()
+        headers = ctx["request"]["headers"]
+        config = get_config_from_headers(headers)
+        if not config["enabled"] or not config["api_key"] or not config["project_name"]:
+            return
+        status = str(result.get("status", "")).lower()
+        trace = build_trace_payload(
+            trace_id=str(uuid.uuid4()),
+            request_id=f"req_{uuid.uuid4().hex[:10]}",
+            tool_name=name,
+            project_name=config["project_name"],
+            payment_provider=config["payment_provider"] or "mpesa",
+            arguments=arguments,
+            response=result,
+            status=status if status in ("success", "error", "failed", "failure") else "success",
+            duration_ms=duration_ms,
+            trace_ctx=ctx,
+            headers=headers,
+        )
+        self.submit(trace, config["api_key"])
+
+    def submit(self, trace: Dict[str, Any], api_key: Optional[str] = None) -> None:
+        """Drop-in for the SDK's ``send_trace_to_api``: buffer, never block."""
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            return
+        self._buffer.append((trace, api_key))
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Take over export from the SDK; call from the app's lifespan startup."""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._sdk_send = paylink_tracer_module.send_trace_to_api
+        paylink_tracer_module.send_trace_to_api = self.submit
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Send what is buffered (for up to ``timeout`` seconds) and hand export back to the SDK."""
+        if self._task is None:
+            return
+        paylink_tracer_module.send_trace_to_api = self._sdk_send
+        self._stopping = True
+        self._wakeup.set()  # type: ignore[union-attr]
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self.dropped += len(self._buffer)
+            logger.warning("Trace flush timed out; %d traces dropped", len(self._buffer))
+            self._buffer.clear()
+        self._task = None
+        self._wakeup = None
+        self._stopping = False
+
+    async def _run(self) -> None:
+        wakeup = self._wakeup
+        while not self._stopping:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(wakeup.wait(), self.flush_interval)  # type: ignore[union-attr]
+            wakeup.clear()  # type: ignore[union-attr]
+            await self._export_buffered()
+        # Whatever was buffered when stop() was called, even before the first round
+        await self._export_buffered()
+
+    async def _export_buffered(self) -> None:
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            await asyncio.gather(*(self._send(trace, api_key) for trace, api_key in batch))
+
+    async def _send(self, trace: Dict[str, Any], api_key: Optional[str]) -> None:
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        try:
+            response = await get_http_client(DEFAULT_BASE_URL).post(
+                TRACE_ENDPOINT, content=json_codec.dumps(trace), headers=headers, timeout=REQUEST_TIMEOUT
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Error sending trace: %s", e)
+            return
+        if response.status_code >= 400:
+            self.failed += 1
+            logger.warning("Failed to send trace: HTTP %d", response.status_code)
+        else:
+            self.exported += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._buffer),
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "exported": self.exported,
+            "failed": self.failed,
+        }
+
+
+# Process-wide; started and flushed by the app's lifespan
+trace_exporter = TraceExporter(TraceSampler.from_env())
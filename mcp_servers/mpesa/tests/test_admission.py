@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from src.utils.admission import AdmissionController, Overloaded, parse_weights
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _queue_calls(controller, tenants, admitted):
+    async def call(tenant):
+        await controller.acquire(tenant)
+        admitted.append(tenant)
+
+    return [asyncio.ensure_future(call(tenant)) for tenant in tenants]
+
+
+def test_free_slots_go_to_tenants_in_weighted_round_robin():
+    controller = AdmissionController(max_in_flight=1, max_queue=100, max_wait=5, weights={"bulk": 2})
+    admitted = []
+
+    async def scenario():
+        await controller.acquire("holder")
+        tasks = _queue_calls(controller, ["bulk"] * 4 + ["shop"] * 2, admitted)
+        await _settle()
+        for _ in tasks:
+            controller.release(0.0)
+            await _settle()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert admitted == ["bulk", "bulk", "shop", "bulk", "bulk", "shop"]
+    assert controller.stats()["queued"] == 0
+
+
+def test_full_queue_sheds_the_busiest_tenant_not_the_newcomer():
+    controller = AdmissionController(max_in_flight=1, max_queue=2, max_wait=5)
+    admitted = []
+
+    async def scenario():
+        await controller.acquire("holder")
+        bulk = _queue_calls(controller, ["bulk", "bulk"], admitted)
+        await _settle()
+        shop = _queue_calls(controller, ["shop"], admitted)
+        await _settle()
+        with pytest.raises(Overloaded, match="fairness") as exc:
+            await bulk[1]
+        assert exc.value.retry_after >= 1
+
+        # The busiest tenant itself is refused outright
+        with pytest.raises(Overloaded, match="busy"):
+            await controller.acquire("bulk")
+
+        controller.release(0.0)
+        await _settle()
+        controller.release(0.0)
+        await asyncio.gather(bulk[0], *shop)
+
+    asyncio.run(scenario())
+    assert admitted == ["bulk", "shop"]
+    assert controller.shed == 2
+
+
+def test_waiter_is_shed_when_no_slot_comes_free_in_time():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, max_wait=0.05)
+
+    async def scenario():
+        await controller.acquire("holder")
+        with pytest.raises(Overloaded, match="no slot within"):
+            await controller.acquire("shop")
+
+    asyncio.run(scenario())
+    assert controller.stats() == {"in_flight": 1, "queued": 0, "tenants_waiting": 0, "admitted": 1, "waited": 1, "shed": 1}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, max_wait=5)
+
+    async def scenario():
+        await controller.acquire("holder")
+        waiter = asyncio.ensure_future(controller.acquire("shop"))
+        await _settle()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        controller.release(0.0)
+
+    asyncio.run(scenario())
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["queued"] == 0
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, max_wait=5)
+    admitted = []
+
+    async def scenario():
+        await controller.acquire("holder")
+        first = asyncio.ensure_future(controller.acquire("shop"))
+        second = _queue_calls(controller, ["other"], admitted)
+        await _settle()
+        # The slot is handed to the first waiter, which is cancelled before it resumes
+        controller.release(0.0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.gather(*second)
+
+    asyncio.run(scenario())
+    assert admitted == ["other"]
+    assert controller.stats()["in_flight"] == 1
+
+
+def test_parse_weights_ignores_malformed_entries():
+    assert parse_weights("174379=4, 600000=0,bad,=3,x=y") == {"174379": 4, "600000": 1}
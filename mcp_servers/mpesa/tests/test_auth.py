@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.utils import auth
+from src.utils.auth import TokenRefresher, _get_access_token, _touch_tenant, token_cache_key
+
+BASE_URL = "https://sandbox.example"
+KEY = token_cache_key("ck", "cs", BASE_URL)
+BASIC = auth.create_basic_auth_header("ck", "cs")
+LIFETIME = 3600
+
+
+class FakeOAuth:
+    """Stands in for the Daraja OAuth endpoint."""
+
+    def __init__(self) -> None:
+        self.issued: list[str] = []
+        self.failing = False
+
+    async def request(self, method, base_url, url, **kwargs):
+        await asyncio.sleep(0.01)
+        if self.failing:
+            raise httpx.ConnectError("refused")
+        self.issued.append(f"token-{len(self.issued) + 1}")
+        return httpx.Response(
+            200, json={"access_token": self.issued[-1], "expires_in": LIFETIME}, request=httpx.Request(method, url)
+        )
+
+
+@pytest.fixture
+def oauth(monkeypatch):
+    monkeypatch.delenv("MPESA_TOKEN_STORE_PATH", raising=False)
+    fake = FakeOAuth()
+    monkeypatch.setattr(auth, "daraja_request", fake.request)
+    for cache in (auth._token_cache, auth._refresh_locks, auth._active_tenants):
+        cache.clear()
+    yield fake
+    for cache in (auth._token_cache, auth._refresh_locks, auth._active_tenants):
+        cache.clear()
+
+
+def test_refresh_point_is_a_jittered_fraction_of_the_lifetime(oauth):
+    before = time.monotonic()
+    asyncio.run(_get_access_token(KEY, BASIC, BASE_URL, False))
+
+    cached = auth._token_cache[KEY]
+    cache_for = LIFETIME - auth.TOKEN_EXPIRY_SKEW_SECONDS
+    low = auth.MPESA_TOKEN_REFRESH_FRACTION - auth.MPESA_TOKEN_REFRESH_JITTER
+    high = auth.MPESA_TOKEN_REFRESH_FRACTION + auth.MPESA_TOKEN_REFRESH_JITTER
+    assert before + cache_for * low <= cached.refresh_at <= time.monotonic() + cache_for * high
+    assert cached.refresh_at < cached.expires_at
+
+
+def test_due_tenant_is_refreshed_and_next_wake_up_is_bounded(oauth):
+    refresher = TokenRefresher(max_sleep=5.0)
+
+    async def scenario():
+        await _get_access_token(KEY, BASIC, BASE_URL, False)
+        _touch_tenant(KEY, BASIC, BASE_URL)
+        # Not due yet: sleep until the refresh point, at most max_sleep
+        assert 0 < await refresher.refresh_due() <= 5.0
+        assert oauth.issued == ["token-1"]
+
+        auth._token_cache[KEY].refresh_at = time.monotonic() - 1
+        await refresher.refresh_due()
+        return await _get_access_token(KEY, BASIC, BASE_URL, False)
+
+    assert asyncio.run(scenario()) == "token-2"
+    assert oauth.issued == ["token-1", "token-2"]
+    assert refresher.stats() == {"tenants": 1, "refreshed": 1, "failed": 0}
+
+
+def test_idle_tenant_is_dropped_from_the_schedule(oauth):
+    refresher = TokenRefresher(idle_ttl=60)
+
+    async def scenario():
+        await _get_access_token(KEY, BASIC, BASE_URL, False)
+        _touch_tenant(KEY, BASIC, BASE_URL)
+        auth._active_tenants[KEY].last_used -= 61
+        auth._token_cache[KEY].refresh_at = time.monotonic() - 1
+        await refresher.refresh_due()
+
+    asyncio.run(scenario())
+    assert oauth.issued == ["token-1"]
+    assert refresher.stats()["tenants"] == 0
+
+
+def test_failed_refresh_keeps_the_token_and_retries_later(oauth):
+    refresher = TokenRefresher(retry_delay=15)
+
+    async def scenario():
+        await _get_access_token(KEY, BASIC, BASE_URL, False)
+        _touch_tenant(KEY, BASIC, BASE_URL)
+        auth._token_cache[KEY].refresh_at = time.monotonic() - 1
+        oauth.failing = True
+        await refresher.refresh_due()
+        return await _get_access_token(KEY, BASIC, BASE_URL, False)
+
+    assert asyncio.run(scenario()) == "token-1"
+    assert refresher.failed == 1
+    assert auth._token_cache[KEY].refresh_at == pytest.approx(time.monotonic() + 15, abs=1)
+
+
+def test_token_cache_and_refresh_schedule_are_bounded(oauth, monkeypatch):
+    monkeypatch.setattr(auth, "MPESA_TOKEN_CACHE_SIZE", 2)
+    keys = [token_cache_key(f"ck{i}", "cs", BASE_URL) for i in range(3)]
+
+    async def scenario():
+        for key in keys:
+            await _get_access_token(key, BASIC, BASE_URL, False)
+            _touch_tenant(key, BASIC, BASE_URL)
+        # A cache hit makes that tenant the most recently used
+        await _get_access_token(keys[1], BASIC, BASE_URL, False)
+
+    asyncio.run(scenario())
+    assert list(auth._token_cache) == [keys[2], keys[1]]
+    assert list(auth._active_tenants) == [keys[1], keys[2]]
+    assert auth._refresh_locks == {}
+
+
+def test_concurrent_misses_share_one_token_request(oauth):
+    async def scenario():
+        return await asyncio.gather(*(_get_access_token(KEY, BASIC, BASE_URL, False) for _ in range(20)))
+
+    assert asyncio.run(scenario()) == ["token-1"] * 20
+    assert oauth.issued == ["token-1"]
+    assert auth._refresh_locks == {}
+
+
+def test_concurrent_forced_refreshes_of_the_same_token_share_one_request(oauth):
+    async def scenario():
+        await _get_access_token(KEY, BASIC, BASE_URL, False)
+        # Every caller saw token-1 rejected; only the first one fetches a new token
+        return await asyncio.gather(*(_get_access_token(KEY, BASIC, BASE_URL, True) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["token-2"] * 5
+    assert oauth.issued == ["token-1", "token-2"]
+
+
+def test_failed_fetch_is_retried_by_the_next_caller(oauth):
+    async def scenario():
+        oauth.failing = True
+        results = await asyncio.gather(
+            *(_get_access_token(KEY, BASIC, BASE_URL, False) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        oauth.failing = False
+        return await _get_access_token(KEY, BASIC, BASE_URL, False)
+
+    assert asyncio.run(scenario()) == "token-1"
+
+
+def test_cancelled_fetch_releases_the_tenant_lock(oauth):
+    async def scenario():
+        leader = asyncio.ensure_future(_get_access_token(KEY, BASIC, BASE_URL, False))
+        follower = asyncio.ensure_future(_get_access_token(KEY, BASIC, BASE_URL, False))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "token-1"
+    assert auth._refresh_locks == {}
@@ -0,0 +1,59 @@
+import asyncio
+
+from mcp.types import JSONRPCMessage, JSONRPCNotification
+
+from src.utils.event_store import InMemoryEventStore
+
+
+def _message(n: int) -> JSONRPCMessage:
+    return JSONRPCMessage(JSONRPCNotification(jsonrpc="2.0", method="notifications/progress", params={"n": n}))
+
+
+async def _new_session(store: InMemoryEventStore, session_id: str, stream_id: str) -> list[str]:
+    """Store three events the way a session's first request would."""
+
+    async def send(message):
+        pass
+
+    token, send_and_register = store.track(None, send)
+    try:
+        await send_and_register({"type": "http.response.start", "status": 200, "headers": [(b"mcp-session-id", session_id.encode())]})
+        return [await store.store_event(stream_id, _message(n)) for n in range(3)]
+    finally:
+        store.release(token)
+
+
+async def _replay(store: InMemoryEventStore, session_id: str, last_event_id: str) -> tuple[str | None, list[str]]:
+    replayed: list[str] = []
+
+    async def collect(event):
+        replayed.append(event.event_id)
+
+    token, _ = store.track(session_id, None)
+    try:
+        return await store.replay_events_after(last_event_id, collect), replayed
+    finally:
+        store.release(token)
+
+
+def test_sessions_replay_only_their_own_events():
+    store = InMemoryEventStore()
+
+    async def scenario():
+        a = await _new_session(store, "a", "1")
+        b = await _new_session(store, "b", "1")
+        assert await _replay(store, "a", a[0]) == ("1", a[1:])
+        # Same stream id in another session, and another session's event id
+        assert await _replay(store, "b", b[1]) == ("1", b[2:])
+        assert await _replay(store, "b", a[0]) == (None, [])
+
+    asyncio.run(scenario())
+    assert store.stats()["sessions"] == 2
+
+
+def test_dropped_session_releases_its_bytes():
+    store = InMemoryEventStore()
+    asyncio.run(_new_session(store, "a", "1"))
+    assert store.total_bytes > 0
+    store.drop_session("a")
+    assert store.total_bytes == 0 and store.stats()["sessions"] == 0
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from src.utils.idempotency import IdempotencyKeyConflict, IdempotencyStore, idempotency_key_for, payment_fingerprint
+
+
+def test_stale_result_is_forgotten_and_sent_again():
+    store = IdempotencyStore()
+    sent = []
+
+    async def push():
+        sent.append(len(sent) + 1)
+        return {"status": "success", "checkout_request_id": f"ws_CO_{len(sent)}"}
+
+    async def scenario():
+        first, _ = await store.run("k", 60, push)
+        replay, replayed = await store.run("k", 60, push, stale=lambda result: False)
+        assert replayed and replay == first
+        fresh, replayed = await store.run("k", 60, push, stale=lambda result: result is first)
+        assert not replayed and fresh["checkout_request_id"] == "ws_CO_2"
+
+    asyncio.run(scenario())
+    assert sent == [1, 2]
+
+
+def test_explicit_key_reused_for_another_payment_is_refused():
+    store = IdempotencyStore()
+    payment = {"phone_number": "254712345678", "amount": "10", "account_reference": "INV-1", "transaction_desc": "Order"}
+    key, ttl = idempotency_key_for("tenant-a", {**payment, "idempotency_key": "order-1"})
+    sent = []
+
+    async def push():
+        sent.append(1)
+        return {"status": "success", "checkout_request_id": "ws_CO_1"}
+
+    async def scenario():
+        await store.run(key, ttl, push, fingerprint=payment_fingerprint(payment))
+        # Same payment, amount spelled differently: still a replay
+        _, replayed = await store.run(key, ttl, push, fingerprint=payment_fingerprint({**payment, "amount": 10}))
+        assert replayed
+        with pytest.raises(IdempotencyKeyConflict):
+            await store.run(key, ttl, push, fingerprint=payment_fingerprint({**payment, "amount": "500"}))
+
+    asyncio.run(scenario())
+    assert sent == [1]
+
+
+def test_in_flight_key_reused_for_another_payment_is_refused():
+    store = IdempotencyStore()
+    release = asyncio.Event()
+
+    async def push():
+        await release.wait()
+        return {"status": "success"}
+
+    async def scenario():
+        first = asyncio.ensure_future(store.run("k", 60, push, fingerprint="a"))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyKeyConflict):
+            await store.run("k", 60, push, fingerprint="b")
+        release.set()
+        assert (await first)[0] == {"status": "success"}
+
+    asyncio.run(scenario())
+
+
+def test_keys_are_scoped_to_credentials():
+    arguments = {"idempotency_key": "order-1"}
+    assert idempotency_key_for("tenant-a", arguments)[0] != idempotency_key_for("tenant-b", arguments)[0]
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.utils import job_queue
+from src.utils.daraja import request_failed_result
+from src.utils.job_queue import (
+    JOB_DONE,
+    JOB_QUEUED,
+    JOB_UNKNOWN,
+    JobQueue,
+    JobQueueFull,
+    SqliteJobJournal,
+)
+
+CREDENTIALS = ("https://sandbox.safaricom.co.ke", "ck", "super-secret", "pk", "174379", "https://example.com/cb")
+PAYMENT = {"amount": "10", "phone_number": "254712345678", "account_reference": "INV-1", "transaction_desc": "Order"}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = SqliteJobJournal(str(tmp_path / "jobs.sqlite3"))
+    yield journal
+    journal.close()
+
+
+def test_duplicate_submission_replays_the_journaled_job(journal):
+    job, replayed = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, "key-1", 60)
+    again, replayed_again = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, "key-1", 60)
+
+    assert not replayed and replayed_again
+    assert again.id == job.id
+    assert journal.counts()[JOB_QUEUED] == 1
+
+
+def test_failed_job_is_not_replayed(journal):
+    job, _ = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, "key-1", 60)
+    journal.claim("worker", 30)
+    journal.finish(job.id, "worker", {"status": "error", "message": "Insufficient balance"})
+
+    again, replayed = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, "key-1", 60)
+    assert not replayed and again.id != job.id
+
+
+def test_full_queue_refuses_new_jobs(journal):
+    journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, max_queued=1)
+    with pytest.raises(JobQueueFull):
+        journal.enqueue("tenant-a", CREDENTIALS, PAYMENT, max_queued=1)
+
+
+def test_expired_leases_requeue_unsent_jobs_and_give_up_on_sent_ones(journal):
+    unsent, _ = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT)
+    sent, _ = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT)
+    # A worker that died right after claiming both, having started to send one
+    journal.claim("dead", -1)
+    journal.claim("dead", -1)
+    assert journal.mark_sending(sent.id, "dead", -1)
+
+    assert journal.recover() == (1, 1)
+    assert journal.get(unsent.id).state == JOB_QUEUED
+    assert journal.get(unsent.id).credentials == CREDENTIALS
+    lost = journal.get(sent.id)
+    assert lost.state == JOB_UNKNOWN
+    assert lost.credentials is None
+
+
+def test_finished_job_credentials_are_gone_from_disk(journal, tmp_path):
+    job, _ = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT)
+    journal.claim("worker", 30)
+    journal.finish(job.id, "worker", {"status": "success"})
+    journal.checkpoint()
+
+    assert journal.get(job.id).credentials is None
+    on_disk = b"".join(path.read_bytes() for path in tmp_path.iterdir())
+    assert b"super-secret" not in on_disk
+
+
+def test_retryable_failures_are_retried_until_attempts_run_out(journal, monkeypatch):
+    monkeypatch.setattr(job_queue, "backoff_delay", lambda attempt: 0.0)
+    calls = []
+
+    async def runner(job, before_send):
+        calls.append(job.attempts)
+        return request_failed_result(httpx.ConnectError("Daraja unreachable"), None)
+
+    queue = JobQueue(runner, max_attempts=2)
+    job, _ = journal.enqueue("tenant-a", CREDENTIALS, PAYMENT)
+
+    async def drain_queue():
+        while (claimed := journal.claim(queue.owner, 30)) is not None:
+            await queue._run(journal, claimed)
+
+    asyncio.run(drain_queue())
+
+    assert calls == [1, 2]
+    assert queue.retried == 1 and queue.completed == 1
+    finished = journal.get(job.id)
+    assert finished.state == JOB_DONE
+    assert finished.result["retryable"] is True
+    assert finished.credentials is None
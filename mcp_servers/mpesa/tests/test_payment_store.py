@@ -0,0 +1,52 @@
+from src.utils.payment_store import STATUS_COMPLETED, PaymentStatusStore
+
+
+def _callback(checkout_request_id: str, result_code: int = 0) -> dict:
+    return {
+        "Body": {
+            "stkCallback": {
+                "MerchantRequestID": "m-1",
+                "CheckoutRequestID": checkout_request_id,
+                "ResultCode": result_code,
+                "ResultDesc": "ok",
+                "CallbackMetadata": {"Item": [{"Name": "MpesaReceiptNumber", "Value": "R1"}]},
+            }
+        }
+    }
+
+
+def test_callback_for_unknown_checkout_is_ignored():
+    store = PaymentStatusStore()
+    assert store.apply_callback(_callback("ws_CO_forged")) is None
+    assert "ws_CO_forged" not in store
+    assert store.get("ws_CO_forged", None) is None
+
+
+def test_callback_updates_tracked_payment():
+    store = PaymentStatusStore()
+    store.record_pending("ws_CO_1", "m-1", "tenant-a", "254712345678", "INV1", "10")
+    record = store.apply_callback(_callback("ws_CO_1"))
+    assert record is not None
+    assert record.status == STATUS_COMPLETED
+    assert record.mpesa_receipt_number == "R1"
+
+
+def test_reads_are_scoped_to_the_owning_tenant():
+    store = PaymentStatusStore()
+    store.record_pending("ws_CO_1", "m-1", "tenant-a", "254712345678", "INV1", "10")
+    assert store.get("ws_CO_1", "tenant-a") is not None
+    assert store.get("ws_CO_1", "tenant-b") is None
+    assert store.get("ws_CO_1", None) is None
+    assert store.get_by_merchant_request_id("m-1", "tenant-b") is None
+    assert store.latest_by_phone("tenant-b", "254712345678") is None
+
+
+def test_tenant_key_depends_on_the_credentials_not_just_the_shortcode():
+    from src.utils.credentials import credentials_from_values
+
+    def creds(secret: str):
+        values = ("https://sandbox.example", "174379", "pk", "https://cb.example/cb", "ck", secret)
+        return credentials_from_values(tuple(v.encode() for v in values))
+
+    assert creds("secret").tenant_key == creds("secret").tenant_key
+    assert creds("secret").tenant_key != creds("guessed").tenant_key
@@ -0,0 +1,64 @@
+import pytest
+from mcp.types import Tool
+
+from src.providers.mpesa import provider as mpesa_provider
+from src.providers.registry import PaymentProvider, ProviderError, ProviderRouter, parse_provider_header
+from src.tools.registry import ToolRegistry
+
+
+async def _noop(arguments, request):
+    return {"status": "success"}
+
+
+def _demo_provider() -> PaymentProvider:
+    tools = ToolRegistry()
+    tools.register(Tool(name="stk_push", description="Demo push", inputSchema={"type": "object"}), _noop)
+    return PaymentProvider("demo", tools)
+
+
+@pytest.fixture
+def router() -> ProviderRouter:
+    return ProviderRouter([mpesa_provider, _demo_provider()], default="mpesa")
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('["mpesa"]', ["mpesa"]),
+        ('["Demo", "mpesa"]', ["demo", "mpesa"]),
+        ("mpesa", ["mpesa"]),
+        (" demo , mpesa ", ["demo", "mpesa"]),
+        ("['mpesa']", ["mpesa"]),
+        ("[]", []),
+        ("", []),
+        (None, []),
+    ],
+)
+def test_parse_provider_header(header, expected):
+    assert parse_provider_header(header) == expected
+
+
+def test_sdk_json_list_header_selects_provider(router):
+    # The paylink SDK sends PAYMENT_PROVIDER=["mpesa"]
+    assert router.resolve("stk_push", '["mpesa"]')[0] == "mpesa"
+    assert router.resolve("stk_push", '["demo"]')[0] == "demo"
+    assert {tool.name for tool in router.list_tools('["mpesa"]')} == mpesa_provider.tools.names()
+
+
+def test_first_loaded_provider_in_header_wins(router):
+    assert router.resolve("stk_push", '["paypal", "demo", "mpesa"]')[0] == "demo"
+
+
+@pytest.mark.parametrize("header", ['["paypal"]', "paypal", "[not json", '{"provider": "mpesa"}', "[1, 2]"])
+def test_unknown_header_falls_back_to_default(router, header):
+    provider_name, entry = router.resolve("stk_push", header)
+    assert provider_name == "mpesa"
+    assert entry is not None
+    # Never raises; behaves as if no header was sent
+    assert router.list_tools(header) == router.list_tools(None)
+
+
+def test_qualified_name_must_match_header(router):
+    assert router.resolve("demo__stk_push", '["demo"]')[0] == "demo"
+    with pytest.raises(ProviderError):
+        router.resolve("mpesa__stk_push", '["demo"]')
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from src.utils.rate_limit import RateLimitExceeded, ShortcodeRateLimiter, TokenBucket
+
+
+def test_burst_is_admitted_at_once_then_callers_wait_for_refill():
+    bucket = TokenBucket(rate=50, burst=2, max_queue=10)
+
+    async def scenario():
+        return [await bucket.acquire(max_wait=1) for _ in range(3)]
+
+    first, second, third = asyncio.run(scenario())
+    assert first == second == 0.0
+    assert third == pytest.approx(1 / 50, abs=0.005)
+    assert bucket.stats()["waited"] == 1
+
+
+def test_refill_is_proportional_to_elapsed_time_and_capped_at_burst():
+    bucket = TokenBucket(rate=10, burst=5, max_queue=10)
+
+    async def drain():
+        for _ in range(5):
+            await bucket.acquire(max_wait=0)
+
+    asyncio.run(drain())
+    assert bucket.stats()["tokens_available"] < 1
+
+    bucket._updated -= 0.2
+    assert bucket.stats()["tokens_available"] == pytest.approx(2, abs=0.05)
+    bucket._updated -= 60
+    assert bucket.stats()["tokens_available"] == 5
+
+
+def test_wait_beyond_deadline_is_rejected_and_gives_the_token_back():
+    bucket = TokenBucket(rate=1, burst=1, max_queue=10)
+
+    async def scenario():
+        await bucket.acquire(max_wait=0)
+        with pytest.raises(RateLimitExceeded) as exc:
+            await bucket.acquire(max_wait=0.5)
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after == pytest.approx(1, abs=0.05)
+    assert bucket._tokens > -1
+    assert bucket.stats()["rejected"] == 1
+
+
+def test_full_queue_is_rejected_immediately():
+    bucket = TokenBucket(rate=10, burst=1, max_queue=1)
+
+    async def scenario():
+        await bucket.acquire(max_wait=1)
+        waiter = asyncio.ensure_future(bucket.acquire(max_wait=1))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded, match="queue is full"):
+            await bucket.acquire(max_wait=1)
+        await waiter
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_returns_its_reserved_token():
+    bucket = TokenBucket(rate=1, burst=1, max_queue=10)
+
+    async def scenario():
+        await bucket.acquire(max_wait=5)
+        waiter = asyncio.ensure_future(bucket.acquire(max_wait=5))
+        await asyncio.sleep(0)
+        tokens_while_waiting = bucket._tokens
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return tokens_while_waiting
+
+    tokens_while_waiting = asyncio.run(scenario())
+    assert bucket._tokens == pytest.approx(tokens_while_waiting + 1, abs=0.05)
+    assert bucket.stats()["queue_depth"] == 0
+
+
+def test_shortcodes_have_separate_buckets_and_zero_rate_disables_limiting():
+    limiter = ShortcodeRateLimiter(rate=1, burst=1, max_queue=0, max_wait=0)
+
+    async def scenario():
+        await limiter.acquire("174379")
+        await limiter.acquire("600000")
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire("174379")
+
+    asyncio.run(scenario())
+    assert set(limiter.stats()) == {"174379", "600000"}
+
+    disabled = ShortcodeRateLimiter(rate=0)
+    assert asyncio.run(disabled.acquire("174379")) == 0.0
+    assert disabled.stats() == {}
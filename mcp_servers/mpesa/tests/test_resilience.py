@@ -0,0 +1,136 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from src.utils import daraja, resilience
+from src.utils.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    backoff_delay,
+)
+
+BASE_URL = "https://sandbox.example"
+
+
+def test_breaker_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker("daraja", failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert 0 < exc.value.retry_after <= 60
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_limits_probes_and_closes_after_enough_successes():
+    breaker = CircuitBreaker("daraja", failure_threshold=1, reset_timeout=0, half_open_probes=2)
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+    breaker.before_call()
+    breaker.before_call()
+    assert breaker.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_failed_probe_reopens_and_neutral_probe_frees_its_slot():
+    breaker = CircuitBreaker("daraja", failure_threshold=1, reset_timeout=0, half_open_probes=1)
+    breaker.record_failure()
+
+    breaker.before_call()
+    breaker.record_neutral()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.times_opened == 2
+
+
+def test_backoff_is_jittered_below_an_exponential_cap(monkeypatch):
+    monkeypatch.setattr(resilience, "MPESA_RETRY_BASE_DELAY", 0.1)
+    monkeypatch.setattr(resilience, "MPESA_RETRY_MAX_DELAY", 0.5)
+    random.seed(8)
+
+    for attempt, cap in enumerate([0.1, 0.2, 0.4, 0.5, 0.5]):
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert len(set(delays)) > 1
+        assert max(delays) > cap / 2
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route daraja_request to a scripted transport; return (responses, delays)."""
+    responses = []
+    delays = []
+
+    def handler(request):
+        outcome = responses.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(daraja, "get_http_client", lambda base_url: client)
+    monkeypatch.setattr(daraja, "circuit_breakers", CircuitBreakerRegistry())
+    monkeypatch.setattr(daraja, "MPESA_RETRY_ATTEMPTS", 3)
+
+    def no_wait(attempt):
+        delays.append(attempt)
+        return 0.0
+
+    monkeypatch.setattr(daraja, "backoff_delay", no_wait)
+    return responses, delays
+
+
+def _request(retry_safe=False):
+    return asyncio.run(daraja.daraja_request("POST", BASE_URL, f"{BASE_URL}/mpesa/stkpush/v1/processrequest", retry_safe=retry_safe))
+
+
+def test_connect_failures_are_retried_with_growing_backoff(upstream):
+    responses, delays = upstream
+    responses += [httpx.ConnectError("refused"), httpx.ConnectError("refused"), 200]
+
+    assert _request().status_code == 200
+    assert delays == [0, 1]
+    assert daraja.circuit_breakers.get(BASE_URL).state == STATE_CLOSED
+
+
+def test_sent_request_is_not_retried_unless_retry_safe(upstream):
+    responses, delays = upstream
+    responses += [httpx.ReadTimeout("slow")]
+    with pytest.raises(httpx.ReadTimeout):
+        _request()
+    assert delays == []
+
+    responses += [httpx.ReadTimeout("slow"), 503, 200]
+    assert _request(retry_safe=True).status_code == 200
+    assert delays == [0, 1]
+
+
+def test_retries_stop_at_the_attempt_limit(upstream):
+    responses, delays = upstream
+    responses += [httpx.ConnectError("refused")] * 3
+    with pytest.raises(httpx.ConnectError):
+        _request()
+    assert delays == [0, 1]
+    assert daraja.circuit_breakers.get(BASE_URL).stats()["consecutive_failures"] == 3
@@ -0,0 +1,71 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+# Seconds from process start until /readyz must answer 200
+READY_BUDGET_S = float(os.getenv("MPESA_TEST_READY_BUDGET_S", "10"))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def start_server():
+    procs = []
+
+    def start(*transports: str) -> str:
+        port = _free_port()
+        args = [sys.executable, "server.py", "--port", str(port), "--log-level", "WARNING"]
+        for transport in transports:
+            args += ["--transport", transport]
+        # Nothing to warm up: readiness must not depend on reaching Daraja
+        env = {**os.environ, "MPESA_WARMUP_BASE_URLS": ""}
+        procs.append(subprocess.Popen(args, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for proc in procs:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def _wait_until_ready(base_url: str) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < READY_BUDGET_S:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=0.5).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    pytest.fail(f"/readyz not ready within {READY_BUDGET_S}s")
+
+
+@pytest.mark.parametrize(
+    "transport, mounted, not_mounted",
+    [
+        ("streamable-http", "/mcp/", ("/sse", "/messages/")),
+        ("sse", "/messages/", ("/mcp/",)),
+    ],
+)
+def test_server_is_ready_within_budget_with_only_selected_transport(start_server, transport, mounted, not_mounted):
+    base_url = start_server(transport)
+    _wait_until_ready(base_url)
+
+    assert httpx.post(f"{base_url}{mounted}", timeout=5).status_code != 404
+    for path in not_mounted:
+        assert httpx.post(f"{base_url}{path}", timeout=5).status_code == 404, path
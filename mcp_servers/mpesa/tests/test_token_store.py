@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import stat
+import time
+
+import pytest
+
+from src.utils.token_store import SqliteTokenStore, store_key
+
+KEY = store_key(("https://sandbox.example", "ck", "digest"))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "tokens.sqlite3")
+
+
+def test_one_process_holds_the_lease_while_the_others_wait(path):
+    first, second = SqliteTokenStore(path), SqliteTokenStore(path)
+
+    assert first.acquire(KEY) == (None, True)
+    assert second.acquire(KEY) == (None, False)
+
+    expires_at = time.time() + 3600
+    first.put(KEY, "token-1", expires_at)
+    assert second.acquire(KEY) == (("token-1", expires_at), False)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_expired_lease_is_taken_over(path):
+    first, second = SqliteTokenStore(path, lease_seconds=0.05), SqliteTokenStore(path)
+
+    assert first.acquire(KEY) == (None, True)
+    time.sleep(0.1)
+    assert second.acquire(KEY) == (None, True)
+
+
+def test_released_lease_is_free_at_once(path):
+    first, second = SqliteTokenStore(path), SqliteTokenStore(path)
+
+    first.acquire(KEY)
+    first.release(KEY)
+    assert second.acquire(KEY) == (None, True)
+
+
+def test_expired_or_rejected_token_needs_a_new_lease(path):
+    first, second = SqliteTokenStore(path), SqliteTokenStore(path)
+
+    first.acquire(KEY)
+    first.put(KEY, "token-1", time.time() - 1)
+    assert second.acquire(KEY) == (None, True)
+
+    second.put(KEY, "token-2", time.time() + 3600)
+    assert first.acquire(KEY, reject_token="token-2") == (None, True)
+    # Callers that did not see the rejection keep using the stored token
+    assert second.acquire(KEY)[0][0] == "token-2"
+
+
+def _race_for_lease(path: str, barrier) -> bool:
+    store = SqliteTokenStore(path)
+    barrier.wait()
+    _, leased = store.acquire(KEY)
+    return leased
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_exactly_one_of_several_processes_wins_the_lease(path):
+    SqliteTokenStore(path).close()
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Manager().Barrier(4)
+    with ctx.Pool(4) as pool:
+        leased = pool.starmap(_race_for_lease, [(path, barrier)] * 4)
+    assert sorted(leased) == [False, False, False, True]
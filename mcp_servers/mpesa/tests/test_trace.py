@@ -0,0 +1,19 @@
+from src.utils.trace import LOG_REDACTED_HEADERS, REDACTED, redact_headers
+
+
+def test_credentials_and_callback_token_are_redacted():
+    headers = {
+        "mpesa-consumer-secret": "cs",
+        "mpesa-callback-url": "https://cb.example/mpesa/callback?token=s3cret",
+        "mpesa-business-shortcode": "174379",
+    }
+    redacted = redact_headers(headers)
+    assert redacted["mpesa-consumer-secret"] == REDACTED
+    assert redacted["mpesa-callback-url"] == f"https://cb.example/mpesa/callback?{REDACTED}"
+    assert redacted["mpesa-business-shortcode"] == "174379"
+    assert "s3cret" not in repr(redact_headers(headers, LOG_REDACTED_HEADERS))
+
+
+def test_callback_url_without_query_is_kept():
+    headers = {"mpesa-callback-url": "https://cb.example/mpesa/callback"}
+    assert redact_headers(headers) == headers
@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+
+import paylink_tracer.tracer as paylink_tracer_module
+import pytest
+from paylink_tracer import paylink_tracer, set_trace_context_provider
+
+from src.utils.trace import LazyTraceContext, TraceContextProvider
+from src.utils.trace_export import TraceExporter, TraceSampler
+
+HEADERS = {
+    "paylink-api-key": "pk_test",
+    "paylink-project": "shop",
+    "mpesa-business-shortcode": "174379",
+    "mpesa-consumer-secret": "cs",
+}
+SCOPE = {"method": "POST", "path": "/mcp", "client": ("10.0.0.1", 5000), "server": ("mpesa", 8050)}
+
+trace_context: "contextvars.ContextVar[LazyTraceContext]" = contextvars.ContextVar("test_trace_context")
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = TraceExporter(TraceSampler(rate=0.0, slow_ms=60_000), flush_interval=60)
+    sent = []
+
+    async def send(trace, api_key):
+        sent.append((trace, api_key))
+
+    monkeypatch.setattr(exporter, "_send", send)
+    exporter.sent = sent
+    return exporter
+
+
+def _tool_calls():
+    calls = []
+
+    async def run(name, arguments):
+        calls.append("run")
+        return {"status": "error", "message": "Invalid input"} if arguments.get("fail") else {"status": "success"}
+
+    async def traced_run(name, arguments):
+        calls.append("traced")
+        return {"status": "success"}
+
+    return calls, run, traced_run
+
+
+def test_sampled_out_call_is_never_traced(exporter):
+    calls, run, traced_run = _tool_calls()
+    ctx = LazyTraceContext(SCOPE, HEADERS)
+
+    result = asyncio.run(exporter.call(run, traced_run, "stk_push", {}, ctx))
+
+    assert result == {"status": "success"}
+    assert calls == ["run"]
+    assert exporter.sampled_out == 1
+    assert exporter.stats()["buffered"] == 0
+
+
+def test_sampled_out_error_is_still_traced(exporter):
+    calls, run, traced_run = _tool_calls()
+    ctx = LazyTraceContext(SCOPE, HEADERS)
+
+    asyncio.run(exporter.call(run, traced_run, "stk_push", {"fail": True}, ctx))
+
+    assert calls == ["run"]
+    trace, api_key = exporter._buffer[0]
+    assert api_key == "pk_test"
+    assert trace["status"] == "error" and trace["tool_name"] == "stk_push"
+    assert "cs" not in repr(trace)
+
+
+def test_tenant_rate_decides_before_the_call(exporter):
+    exporter.sampler.tenant_rates = {"174379": 1.0}
+    calls, run, traced_run = _tool_calls()
+
+    asyncio.run(exporter.call(run, traced_run, "stk_push", {}, LazyTraceContext(SCOPE, HEADERS)))
+
+    assert calls == ["traced"]
+
+
+def test_start_routes_sdk_traces_to_the_buffer_and_stop_restores_the_sdk(exporter):
+    sdk_send = paylink_tracer_module.send_trace_to_api
+    set_trace_context_provider(TraceContextProvider(trace_context))
+
+    @paylink_tracer()
+    async def run_tool(name, arguments):
+        return {"status": "success"}
+
+    async def scenario():
+        exporter.start()
+        assert paylink_tracer_module.send_trace_to_api == exporter.submit
+        trace_context.set(LazyTraceContext(SCOPE, HEADERS))
+        await run_tool("stk_push", {})
+        assert exporter.stats()["buffered"] == 1
+        await exporter.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        paylink_tracer_module.send_trace_to_api = sdk_send
+        set_trace_context_provider(None)
+
+    assert paylink_tracer_module.send_trace_to_api is sdk_send
+    assert [trace["tool_name"] for trace, _ in exporter.sent] == ["stk_push"]
+    assert exporter.stats()["buffered"] == 0
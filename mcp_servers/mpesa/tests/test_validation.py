@@ -0,0 +1,30 @@
+import pytest
+
+from src.tools.validation import compile_schema
+
+
+def _errors(schema, value):
+    errors = []
+    compile_schema(schema)(value, "phone_number", errors)
+    return errors
+
+
+@pytest.mark.parametrize("value", ["254712345678\n", "254712345678\n\n", "2547123456789"])
+def test_anchored_pattern_rejects_trailing_characters(value):
+    assert _errors({"type": "string", "pattern": "^2547[0-9]{8}$"}, value)
+
+
+def test_anchored_pattern_accepts_exact_value():
+    assert _errors({"type": "string", "pattern": "^2547[0-9]{8}$"}, "254712345678") == []
+
+
+@pytest.mark.parametrize(
+    "pattern, value",
+    [
+        ("[0-9]+", "ref 42"),  # unanchored patterns match anywhere
+        (r"^\$[0-9]+$", "$10"),  # escaped dollar is literal
+        ("^[$0-9]+$", "$10"),  # dollar inside a class is literal
+    ],
+)
+def test_other_patterns_keep_their_meaning(pattern, value):
+    assert _errors({"type": "string", "pattern": pattern}, value) == []